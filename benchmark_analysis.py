@@ -0,0 +1,285 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from create_mocks import create_sized_mock
+from diagnosis.instrumentation import PeakRSS, current_rss_mb, peak_rss_mb
+
+BASE_DIR = os.getcwd()
+BENCH_DIR = os.path.join(BASE_DIR, "research_data", "benchmarks")
+SCANS_DIR = os.path.join(BENCH_DIR, "scans")
+
+# Etapele din InferenceEngine.analyze, în ordinea rulării
+STAGES = ['preflight', 'load', 'snapshot', 'masking', 'connectivity', 'prediction']
+
+# (nume, voxel mm, volume, comprimat) pe grila MNI152 (197 x 233 x 189 la 1 mm), float32:
+#   4 mm ~ 0.57 MB/volum, 3 mm ~ 1.3 MB/volum, 2 mm ~ 4.4 MB/volum
+QUICK = [
+    ("4mm_t60_gz", 4.0, 60, True),
+    ("4mm_t60_nii", 4.0, 60, False),
+]
+STANDARD = QUICK + [
+    ("3mm_t200_gz", 3.0, 200, True),
+    ("3mm_t200_nii", 3.0, 200, False),
+    ("2mm_t120_gz", 2.0, 120, True),
+]
+# Clasa 1.5 GB (necomprimat): trece pe extracția pe bucăți cu bugetul implicit de 512 MB
+FULL = STANDARD + [
+    ("2mm_t350_gz", 2.0, 350, True),
+    ("2mm_t350_nii", 2.0, 350, False),
+]
+SUITES = {'quick': QUICK, 'standard': STANDARD, 'full': FULL}
+
+
+def scan_path_for(voxel_size, n_timepoints, compressed, seed, scans_dir=SCANS_DIR):
+    extension = "nii.gz" if compressed else "nii"
+    return os.path.join(scans_dir, f"mock_{voxel_size:g}mm_t{n_timepoints}_s{seed}.{extension}")
+
+
+def ensure_scan(voxel_size, n_timepoints, compressed, seed, scans_dir=SCANS_DIR):
+    """
+    Scanările sintetice se generează o singură dată (determinist, din seed) și se refolosesc
+    între rulări, ca timpii să fie comparabili.
+    """
+    path = scan_path_for(voxel_size, n_timepoints, compressed, seed, scans_dir)
+    if not os.path.exists(path):
+        os.makedirs(scans_dir, exist_ok=True)
+        create_sized_mock(path, voxel_size=voxel_size, n_timepoints=n_timepoints, seed=seed)
+    return path
+
+
+def run_case(path, repeats=3, memory_budget_mb=512, streaming='auto', model_path=None):
+    """
+    Rulează pipeline-ul de analiză pe o scanare, etapă cu etapă (rulează într-un proces nou,
+    deci vârful de memorie al procesului aparține doar acestui caz).
+    """
+    from diagnosis.ml_logic import InferenceEngine
+    from diagnosis.preflight import check_header
+
+    engine = InferenceEngine(model_path=model_path, memory_budget_mb=memory_budget_mb,
+                             streaming=streaming)
+    start = time.perf_counter()
+    engine.warmup()
+    warmup_seconds = time.perf_counter() - start
+    baseline_mb = current_rss_mb()[1]
+
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="bench_viewer_") as tmp:
+        viewer_path = os.path.join(tmp, "bench_viewer.nii.gz")
+        for _ in range(repeats):
+            run = {}
+
+            def stage(name, func, *args):
+                with PeakRSS() as rss:
+                    begin = time.perf_counter()
+                    value = func(*args)
+                    seconds = time.perf_counter() - begin
+                run[name] = {'seconds': seconds, 'peak_rss_mb': rss.peak_mb, 'peak_anon_mb': rss.peak_anon_mb}
+                return value
+
+            header = stage('preflight', check_header, path)
+            img = stage('load', engine.load, path)
+            stage('snapshot', engine.save_snapshot, img, viewer_path)
+            time_series = stage('masking', engine.extract_time_series, img)
+            feature_vector = stage('connectivity', engine.compute_features, time_series)
+            label, confidence = stage('prediction', engine.classify, feature_vector)
+            runs.append(run)
+
+    return {
+        'shape': header['shape'],
+        'streaming': engine.use_streaming(img),
+        'chunk_volumes': engine.volumes_per_chunk(img),
+        'model_version': engine.model_version,
+        'label': label,
+        'warmup_seconds': round(warmup_seconds, 4),
+        'baseline_anon_mb': round(baseline_mb, 1),
+        'process_peak_rss_mb': round(peak_rss_mb(), 1),
+        'runs': runs,
+    }
+
+
+def summarize_runs(runs):
+    """
+    Mediana și minimul timpilor pe repetări; vârful de memorie maxim pe repetări.
+    """
+    stages = {}
+    for name in STAGES:
+        seconds = [run[name]['seconds'] for run in runs]
+        stages[name] = {
+            'seconds_median': round(float(np.median(seconds)), 4),
+            'seconds_min': round(float(np.min(seconds)), 4),
+            'peak_rss_mb': round(max(run[name]['peak_rss_mb'] for run in runs), 1),
+            'peak_anon_mb': round(max(run[name]['peak_anon_mb'] for run in runs), 1),
+        }
+    totals = [sum(run[name]['seconds'] for name in STAGES) for run in runs]
+    return stages, round(float(np.median(totals)), 4)
+
+
+def environment():
+    import joblib
+    import nibabel
+    import nilearn
+    import scipy
+    import sklearn
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'git_commit': commit,
+        'packages': {
+            'numpy': np.__version__,
+            'scipy': scipy.__version__,
+            'nibabel': nibabel.__version__,
+            'nilearn': nilearn.__version__,
+            'scikit-learn': sklearn.__version__,
+            'joblib': joblib.__version__,
+        },
+    }
+
+
+def compare_reports(baseline, current, max_slowdown=0.25, min_seconds=0.05):
+    """
+    Compară două rapoarte pe cazurile comune. Întoarce (rânduri, regresii): o regresie este
+    o etapă cu mediana mai lentă decât `max_slowdown` (fracție) față de referință;
+    etapele sub `min_seconds` în ambele rulări sunt zgomot și nu se judecă.
+    """
+    reference = {case['name']: case for case in baseline['cases']}
+    rows, regressions = [], []
+    for case in current['cases']:
+        before = reference.get(case['name'])
+        if before is None:
+            continue
+        for name in STAGES + ['total']:
+            if name == 'total':
+                old, new = before['total_seconds_median'], case['total_seconds_median']
+            else:
+                old = before['stages'][name]['seconds_median']
+                new = case['stages'][name]['seconds_median']
+            ratio = new / old if old > 0 else float('inf')
+            row = {'case': case['name'], 'stage': name, 'before': old, 'after': new, 'ratio': round(ratio, 3)}
+            rows.append(row)
+            if max(old, new) >= min_seconds and ratio > 1 + max_slowdown:
+                regressions.append(row)
+    return rows, regressions
+
+
+def print_comparison(baseline, current, max_slowdown=0.25):
+    old_env, new_env = baseline.get('environment', {}), current.get('environment', {})
+    for package, version in new_env.get('packages', {}).items():
+        previous = old_env.get('packages', {}).get(package)
+        if previous != version:
+            print(f"📦 {package}: {previous} -> {version}")
+
+    rows, regressions = compare_reports(baseline, current, max_slowdown)
+    print(f"{'case':<16}{'stage':<14}{'before s':>10}{'after s':>10}{'ratio':>8}")
+    for row in rows:
+        flag = "  ⚠️" if row in regressions else ""
+        print(f"{row['case']:<16}{row['stage']:<14}{row['before']:>10.3f}{row['after']:>10.3f}"
+              f"{row['ratio']:>8.2f}{flag}")
+    if regressions:
+        print(f"❌ {len(regressions)} etape mai lente cu peste {max_slowdown:.0%} decât referința.")
+    else:
+        print("✅ Nicio regresie față de referință.")
+    return regressions
+
+
+def benchmark(suite='standard', cases=None, repeats=3, seed=42, memory_budget_mb=512, streaming='auto',
+              model_path=None, report_path=None, scans_dir=SCANS_DIR):
+    """
+    Generează (o singură dată) scanările suitei, rulează fiecare caz într-un proces nou
+    și scrie raportul JSON. Întoarce raportul.
+    """
+    selected = [c for c in SUITES[suite] if not cases or c[0] in cases]
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'suite': suite,
+        'repeats': repeats,
+        'seed': seed,
+        'memory_budget_mb': memory_budget_mb,
+        'streaming': streaming,
+        'environment': environment(),
+        'cases': [],
+    }
+
+    print(f"📊 Benchmark analiză: {len(selected)} cazuri, {repeats} repetări...")
+    for name, voxel_size, n_timepoints, compressed in selected:
+        path = ensure_scan(voxel_size, n_timepoints, compressed, seed, scans_dir)
+        # 'spawn': fiecare caz pornește de la zero (fără memoria moștenită de la cazurile anterioare)
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(run_case, path, repeats, memory_budget_mb, streaming, model_path).result()
+
+        stages, total = summarize_runs(result.pop('runs'))
+        case = {
+            'name': name,
+            'voxel_mm': voxel_size,
+            'n_volumes': n_timepoints,
+            'compressed': compressed,
+            'file_mb': round(os.path.getsize(path) / (1024 * 1024), 1),
+            'data_mb': round(int(np.prod(result['shape'])) * 4 / (1024 * 1024), 1),
+            **result,
+            'stages': stages,
+            'total_seconds_median': total,
+        }
+        report['cases'].append(case)
+        timings = "  ".join(f"{stage} {stages[stage]['seconds_median']:.3f}s" for stage in STAGES)
+        peak_anon = max(stage['peak_anon_mb'] for stage in stages.values())
+        print(f"  ✅ {name:<14} {case['data_mb']:>8.1f} MB  total {total:.3f}s  "
+              f"RSS {case['process_peak_rss_mb']:.0f} MB (anon {peak_anon:.0f} MB)  [{timings}]")
+
+    if report_path is None:
+        report_path = os.path.join(BENCH_DIR, f"analysis_{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(report_path), exist_ok=True)
+    with open(report_path, "w") as fh:
+        json.dump(report, fh, indent=4)
+    print(f"✅ Raport salvat în: {report_path}")
+    return report
+
+
+def load_report(path):
+    with open(path) as fh:
+        return json.load(fh)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pe etape al analizei fMRI, pe scanări sintetice 4D.")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="standard",
+                        help="quick: 4 mm; standard: până la ~500 MB; full: include clasa 1.5 GB.")
+    parser.add_argument("--cases", nargs="+", default=None, help="Doar aceste cazuri din suită.")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42, help="Seed-ul scanărilor sintetice.")
+    parser.add_argument("--memory-budget-mb", type=int, default=512)
+    parser.add_argument("--streaming", choices=['auto', 'always', 'never'], default='auto')
+    parser.add_argument("--model", default=None, help="Un .pkl anume (implicit: versiunea activă din registru).")
+    parser.add_argument("--output", default=None, help="Implicit: research_data/benchmarks/analysis_<dată>.json")
+    parser.add_argument("--compare", default=None, help="Raport de referință; codul de ieșire 1 la regresii.")
+    parser.add_argument("--max-slowdown", type=float, default=0.25, help="Încetinirea tolerată (fracție).")
+    parser.add_argument("--diff", nargs=2, metavar=("BASELINE", "CURRENT"), default=None,
+                        help="Doar compară două rapoarte existente, fără rulare.")
+    args = parser.parse_args()
+
+    if args.diff:
+        regressions = print_comparison(load_report(args.diff[0]), load_report(args.diff[1]), args.max_slowdown)
+    else:
+        report = benchmark(suite=args.suite, cases=args.cases, repeats=args.repeats, seed=args.seed,
+                           memory_budget_mb=args.memory_budget_mb, streaming=args.streaming,
+                           model_path=args.model, report_path=args.output)
+        regressions = print_comparison(load_report(args.compare), report, args.max_slowdown) if args.compare else []
+    sys.exit(1 if regressions else 0)
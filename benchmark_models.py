@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import argparse
+import itertools
+import numpy as np
+import warnings
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.metrics import accuracy_score, roc_auc_score
+from sklearn.model_selection import GridSearchCV, StratifiedKFold
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import SVC
+
+from diagnosis.training_store import TrainingFeatureStore
+
+warnings.filterwarnings("ignore")
+
+BASE_DIR = os.getcwd()
+STORE_DIR = os.path.join(BASE_DIR, "research_data", "feature_store")
+REPORT_PATH = os.path.join(BASE_DIR, "research_data", "model_benchmark.json")
+
+KERNELS = ['linear', 'rbf']
+C_GRID = [0.01, 0.1, 1.0, 10.0]
+
+# Strategii de calibrare a probabilităților:
+#  - platt_internal : SVC(probability=True), Platt scaling cu 5-fold intern (pipeline-ul actual)
+#  - sigmoid_cv3    : CalibratedClassifierCV(method='sigmoid', cv=3) peste un SVC simplu
+#  - none           : fără probabilități; AUC calculat din decision_function
+CALIBRATIONS = ['platt_internal', 'sigmoid_cv3', 'none']
+
+
+def build_pipeline(kernel, calibration):
+    """
+    Pipeline-ul evaluat și numele parametrului C din grila internă.
+    """
+    if calibration == 'platt_internal':
+        clf = SVC(kernel=kernel, probability=True, class_weight='balanced')
+        c_param = 'svm__C'
+    elif calibration == 'sigmoid_cv3':
+        clf = CalibratedClassifierCV(SVC(kernel=kernel, class_weight='balanced'), method='sigmoid', cv=3)
+        c_param = 'svm__estimator__C'
+    else:
+        clf = SVC(kernel=kernel, class_weight='balanced')
+        c_param = 'svm__C'
+    return Pipeline([('scaler', StandardScaler()), ('svm', clf)]), c_param
+
+
+def positive_scores(model, X):
+    if hasattr(model, 'predict_proba'):
+        return model.predict_proba(X)[:, 1]
+    return model.decision_function(X)
+
+
+def run_fold(kernel, calibration, X, y, train_idx, test_idx, inner_folds, seed):
+    """
+    Un fold exterior: GridSearchCV intern pe C, apoi evaluare pe fold-ul de test.
+    """
+    pipeline, c_param = build_pipeline(kernel, calibration)
+    inner = StratifiedKFold(n_splits=inner_folds, shuffle=True, random_state=seed)
+    search = GridSearchCV(pipeline, {c_param: C_GRID}, cv=inner, scoring='roc_auc', n_jobs=1)
+
+    X_train, y_train = np.asarray(X[train_idx]), y[train_idx]
+    X_test, y_test = np.asarray(X[test_idx]), y[test_idx]
+
+    start = time.perf_counter()
+    search.fit(X_train, y_train)
+    search_seconds = time.perf_counter() - start
+
+    # Costul unui singur fit al modelului ales (ce plătim la reantrenare)
+    best = clone(search.best_estimator_)
+    start = time.perf_counter()
+    best.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+
+    # Costul de servire: predicție + scor (probabilitate sau decision_function)
+    start = time.perf_counter()
+    y_pred = best.predict(X_test)
+    scores = positive_scores(best, X_test)
+    predict_seconds = time.perf_counter() - start
+
+    return {
+        'kernel': kernel,
+        'calibration': calibration,
+        'best_C': search.best_params_[c_param],
+        'accuracy': accuracy_score(y_test, y_pred),
+        'auc': roc_auc_score(y_test, scores) if len(set(y_test)) > 1 else float('nan'),
+        'search_seconds': search_seconds,
+        'fit_seconds': fit_seconds,
+        'predict_ms_per_scan': predict_seconds * 1000 / len(test_idx),
+    }
+
+
+def summarize(fold_results):
+    """
+    Media pe fold-urile exterioare pentru fiecare configurație.
+    """
+    summary = []
+    key = lambda r: (r['kernel'], r['calibration'])
+    for (kernel, calibration), group in itertools.groupby(sorted(fold_results, key=key), key=key):
+        group = list(group)
+        row = {'kernel': kernel, 'calibration': calibration, 'folds': len(group)}
+        for metric in ['accuracy', 'auc', 'search_seconds', 'fit_seconds', 'predict_ms_per_scan']:
+            values = np.array([r[metric] for r in group], dtype=float)
+            row[metric] = float(np.nanmean(values))
+            row[f'{metric}_std'] = float(np.nanstd(values))
+        row['best_C'] = [r['best_C'] for r in group]
+        summary.append(row)
+    return sorted(summary, key=lambda r: (-r['auc'], r['fit_seconds']))
+
+
+def benchmark(outer_folds=5, inner_folds=3, n_jobs=-1, seed=42, store_dir=STORE_DIR, report_path=REPORT_PATH):
+    X, y, _ = TrainingFeatureStore(store_dir).load()
+    y = np.asarray(y)
+    if len(set(y.tolist())) < 2:
+        print("❌ Date insuficiente în depozitul de trăsături (minim 1 PD si 1 HC).")
+        return None
+
+    # Fold-urile nu pot depăși numărul de subiecți din clasa minoritară
+    min_class = int(np.bincount(y).min())
+    outer_folds = max(2, min(outer_folds, min_class))
+    inner_folds = max(2, min(inner_folds, min_class - min_class // outer_folds))
+
+    outer = StratifiedKFold(n_splits=outer_folds, shuffle=True, random_state=seed)
+    splits = list(outer.split(np.zeros(len(y)), y))
+    configs = list(itertools.product(KERNELS, CALIBRATIONS))
+
+    print(f"📊 Benchmark: {len(y)} subiecți, {len(configs)} configurații, CV {outer_folds}x{inner_folds}...")
+    # Paralelizăm pe (configurație x fold exterior); GridSearch-ul intern rămâne secvențial
+    fold_results = Parallel(n_jobs=n_jobs)(
+        delayed(run_fold)(kernel, calibration, X, y, train_idx, test_idx, inner_folds, seed)
+        for kernel, calibration in configs
+        for train_idx, test_idx in splits
+    )
+    summary = summarize(fold_results)
+
+    print(f"{'kernel':<8}{'calibration':<16}{'acc':>7}{'auc':>7}{'fit s':>9}{'pred ms':>9}")
+    for row in summary:
+        print(f"{row['kernel']:<8}{row['calibration']:<16}{row['accuracy']:>7.3f}{row['auc']:>7.3f}"
+              f"{row['fit_seconds']:>9.3f}{row['predict_ms_per_scan']:>9.3f}")
+
+    os.makedirs(os.path.dirname(report_path), exist_ok=True)
+    with open(report_path, "w") as fh:
+        json.dump({'n_subjects': len(y), 'outer_folds': outer_folds, 'inner_folds': inner_folds,
+                   'summary': summary, 'folds': fold_results}, fh, indent=4)
+    print(f"✅ Raport salvat în: {report_path}")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Nested CV pentru pipeline-ul SVM, din depozitul de trăsături.")
+    parser.add_argument("--outer-folds", type=int, default=5)
+    parser.add_argument("--inner-folds", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=-1, help="Procese paralele (implicit: toate nucleele).")
+    args = parser.parse_args()
+    benchmark(outer_folds=args.outer_folds, inner_folds=args.inner_folds, n_jobs=args.jobs)
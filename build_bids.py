@@ -0,0 +1,218 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dicom_index import INDEX_PATH, DicomIndex
+from convert_dicom_to_nifti import CONVERTERS, convert_series, series_fingerprint
+
+BIDS_DIR = "bids_dataset"
+SOURCE_DIR = "test_batch"
+DATASET_DESCRIPTION = {"Name": "PPMI Thesis", "BIDSVersion": "1.0.2"}
+# Starea build-ului stă în code/, ignorat de validatorul BIDS
+STATE_PATH = os.path.join("code", "build_state.json")
+
+# (sufix BIDS din dicom_index.CLASSIFICATION_RULES, folder, numele fișierelor)
+MODALITIES = [
+    ("T1w", "anat", "sub-{label}_T1w"),
+    ("bold", "func", "sub-{label}_task-rest_bold"),
+]
+
+
+def subject_label(patient_id):
+    # Etichetele BIDS sunt strict alfanumerice
+    return re.sub(r"[^A-Za-z0-9]", "", str(patient_id))
+
+
+def write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def plan_subjects(index, source_dir, subjects=None):
+    """
+    Pentru fiecare subiect: prima serie T1w și prima serie BOLD (după SeriesNumber),
+    clasificate prin interogările din dicom_index. Fără listă explicită, subiecții
+    se descoperă din index.
+    """
+    wanted = {str(s) for s in subjects} if subjects else None
+    plan = {}
+    for suffix, items in index.classify(source_dir).items():
+        for item in items:
+            patient_id = item["patient_id"]
+            if wanted is not None and patient_id not in wanted:
+                continue
+            chosen = plan.setdefault(patient_id, {})
+            if suffix in chosen:
+                continue
+            files = index.files(item["series_uid"])
+            chosen[suffix] = {
+                "series_uid": item["series_uid"],
+                "patient_id": patient_id,
+                "series_number": str(item["series_number"] or 0),
+                "description": item["series_description"] or suffix,
+                "tr": item["tr"],
+                "files": [f["path"] for f in files],
+                "fingerprint": series_fingerprint(files),
+            }
+    if wanted is not None:
+        for missing in sorted(wanted - set(plan)):
+            print(f"⚠️ Subiectul {missing} nu are serii T1w/BOLD în {source_dir}")
+    return plan
+
+
+def subject_fingerprint(series_by_suffix, repetition_time):
+    """
+    Se schimbă când se schimbă oricare serie sursă a subiectului sau TR-ul forțat.
+    """
+    digest = hashlib.sha256()
+    for suffix in sorted(series_by_suffix):
+        digest.update(f"{suffix}:{series_by_suffix[suffix]['fingerprint']}\n".encode())
+    digest.update(f"tr:{repetition_time}\n".encode())
+    return digest.hexdigest()
+
+
+def patch_sidecar(path, suffix, series, repetition_time=None):
+    """
+    Completează sidecar-ul în aceeași trecere cu conversia (înlocuiește fix_json.py și sed).
+    """
+    with open(path) as f:
+        sidecar = json.load(f)
+    if suffix == "bold":
+        tr = repetition_time or sidecar.get("RepetitionTime") or series["tr"]
+        if tr:
+            sidecar["RepetitionTime"] = float(tr)
+        sidecar["TaskName"] = "rest"
+    sidecar.setdefault("SeriesDescription", series["description"])
+    write_json(path, sidecar)
+
+
+def build_subject(patient_id, series_by_suffix, bids_dir, converter="auto", repetition_time=None):
+    """
+    Reconstruiește un singur subiect (rulează într-un proces separat). Ieșirile vechi ale
+    subiectului se înlocuiesc doar după ce toate conversiile lui au reușit.
+    """
+    start = time.perf_counter()
+    label = subject_label(patient_id)
+    record = {
+        "patient_id": patient_id,
+        "label": label,
+        "fingerprint": subject_fingerprint(series_by_suffix, repetition_time),
+        "series": {suffix: s["series_uid"] for suffix, s in series_by_suffix.items()},
+        "outputs": [],
+        "status": None,
+        "seconds": None,
+        "error": None,
+    }
+    subject_dir = os.path.join(bids_dir, f"sub-{label}")
+    staging_dir = os.path.join(bids_dir, "code", f".sub-{label}.tmp")
+    try:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        for suffix, folder, template in MODALITIES:
+            series = series_by_suffix.get(suffix)
+            if series is None:
+                continue
+            out_dir = os.path.join(staging_dir, folder)
+            result = convert_series(series, out_dir, template.format(label=label), converter)
+            if result["status"] != "converted":
+                raise RuntimeError(f"{suffix}: {result['error']}")
+            for name in result["outputs"]:
+                if name.endswith(".json"):
+                    patch_sidecar(os.path.join(out_dir, name), suffix, series, repetition_time)
+                record["outputs"].append(os.path.join(f"sub-{label}", folder, name))
+
+        shutil.rmtree(subject_dir, ignore_errors=True)
+        os.replace(staging_dir, subject_dir)
+        record["status"] = "built"
+    except Exception as e:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        record["status"] = "failed"
+        record["error"] = str(e)
+    finally:
+        record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def is_up_to_date(entry, fingerprint, bids_dir):
+    return (
+        entry is not None
+        and entry.get("status") in ("built", "skipped")
+        and entry.get("fingerprint") == fingerprint
+        and all(os.path.exists(os.path.join(bids_dir, path)) for path in entry.get("outputs", []))
+    )
+
+
+def build_bids(source_dir=SOURCE_DIR, bids_dir=BIDS_DIR, subjects=None, workers=None, converter="auto",
+               repetition_time=None, force=False, index_path=INDEX_PATH):
+    """
+    Construiește (incremental) setul BIDS din DICOM-urile din `source_dir`.
+    Doar subiecții ale căror serii sursă s-au schimbat (sau lipsesc din set) se reconvertesc,
+    în paralel; restul setului rămâne neatins. Întoarce starea build-ului pe subiecți.
+    """
+    os.makedirs(os.path.join(bids_dir, "code"), exist_ok=True)
+    description_path = os.path.join(bids_dir, "dataset_description.json")
+    if not os.path.exists(description_path):
+        write_json(description_path, DATASET_DESCRIPTION)
+
+    print(f"🗂️  Indexare DICOM din: {source_dir}")
+    with DicomIndex(index_path) as index:
+        index.update(source_dir, workers=workers or os.cpu_count())
+        plan = plan_subjects(index, source_dir, subjects)
+
+    state_path = os.path.join(bids_dir, STATE_PATH)
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+
+    pending = []
+    for patient_id, series_by_suffix in sorted(plan.items()):
+        fingerprint = subject_fingerprint(series_by_suffix, repetition_time)
+        if not force and is_up_to_date(state.get(patient_id), fingerprint, bids_dir):
+            state[patient_id]["status"] = "skipped"
+            print(f"  = skipped sub-{subject_label(patient_id)}")
+        else:
+            pending.append((patient_id, series_by_suffix))
+
+    print(f"🧠 {len(plan)} subiecți, {len(pending)} de reconstruit ({workers or os.cpu_count()} procese)...")
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(build_subject, patient_id, series_by_suffix, bids_dir, converter, repetition_time)
+                for patient_id, series_by_suffix in pending
+            ]
+            for future in as_completed(futures):
+                record = future.result()
+                state[record["patient_id"]] = record
+                write_json(state_path, state)
+                icon = "✅" if record["status"] == "built" else "❌"
+                print(f"  {icon} {record['status']:<7} sub-{record['label']} ({record['seconds']}s)")
+                if record["error"]:
+                    print(f"    Eroare: {record['error']}")
+
+    write_json(state_path, state)
+    print(f"✅ Setul BIDS este în: {bids_dir}")
+    return state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Construiește incremental setul BIDS (anat/T1w, func/bold) din DICOM.")
+    parser.add_argument("--source", default=SOURCE_DIR, help="Folderul cu DICOM-urile subiecților (recursiv).")
+    parser.add_argument("--output", default=BIDS_DIR, help="Folderul setului BIDS.")
+    parser.add_argument("--subjects", nargs="+", default=None,
+                        help="PatientID-urile de inclus (implicit: toți subiecții găsiți).")
+    parser.add_argument("--workers", type=int, default=None, help="Subiecți convertiți în paralel (implicit: toate nucleele).")
+    parser.add_argument("--converter", choices=CONVERTERS, default="auto")
+    parser.add_argument("--repetition-time", type=float, default=None,
+                        help="Forțează RepetitionTime (s) în sidecar-ele BOLD; implicit se păstrează TR-ul din DICOM.")
+    parser.add_argument("--force", action="store_true", help="Reconstruiește toți subiecții.")
+    parser.add_argument("--index", default=INDEX_PATH, help="Indexul SQLite al anteturilor DICOM (dicom_index.py).")
+    args = parser.parse_args()
+    build_bids(args.source, args.output, subjects=args.subjects, workers=args.workers, converter=args.converter,
+               repetition_time=args.repetition_time, force=args.force, index_path=args.index)
@@ -1,40 +1,215 @@
 import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
 import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-def convert_dicom_to_nifti(source_dir, output_dir):
+from dicom_index import INDEX_PATH, DicomIndex
+from diagnosis.dicom_convert import convert_series as convert_series_python
+
+MANIFEST_NAME = "conversion_manifest.json"
+NAME_TEMPLATE = "PPMI_{patient_id}_{description}_S{series_number}"
+
+# 'auto' folosește dcm2niix dacă este instalat, altfel convertorul Python din diagnosis.dicom_convert
+CONVERTERS = ("auto", "dcm2niix", "python")
+
+
+def group_series(source_dir, index_path=INDEX_PATH, workers=1):
     """
-    Converteste toate fisierele DICOM dintr-un folder intr-un singur fisier NIfTI.
-    Necesita dcm2niix instalat (conda install -c conda-forge dcm2niix).
+    Grupează fișierele DICOM din `source_dir` (recursiv) după SeriesInstanceUID,
+    folosind indexul de anteturi (doar fișierele noi sau modificate sunt citite).
+    Întoarce {series_uid: {'patient_id', 'series_number', 'description', 'files', 'fingerprint'}}.
     """
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    series = {}
+    with DicomIndex(index_path) as index:
+        index.update(source_dir, workers=workers)
+        for item in index.series(source_dir):
+            files = index.files(item["series_uid"])
+            series[item["series_uid"]] = {
+                "series_uid": item["series_uid"],
+                "patient_id": item["patient_id"] or "unknown",
+                "series_number": str(item["series_number"] or 0),
+                "description": item["series_description"] or "series",
+                "files": [f["path"] for f in files],
+                "fingerprint": series_fingerprint(files),
+            }
+    return series
 
-    print(f"🚀 Incepere conversie din: {source_dir}")
-    
-    # Rulam dcm2niix
-    # -z y : comprima in .nii.gz
-    # -f %f : pastreaza numele original al folderului/fisierului
-    # -o : folderul de iesire
+
+def series_fingerprint(files):
+    """
+    Amprenta intrărilor unei serii: SOPInstanceUID + dimensiune pentru fiecare fișier.
+    Nu depinde de căi sau mtime, deci rămâne stabilă la copierea datelor PPMI;
+    se schimbă când seria primește fișiere noi sau unul este înlocuit.
+    """
+    digest = hashlib.sha256()
+    for sop_uid, size in sorted((f["sop_uid"], f["size"]) for f in files):
+        digest.update(f"{sop_uid}:{size}\n".encode())
+    return digest.hexdigest()
+
+
+def output_basename(series, template=NAME_TEMPLATE):
+    fields = {key: re.sub(r"[^A-Za-z0-9.-]+", "_", str(value)).strip("_")
+              for key, value in series.items() if key != "files"}
+    return template.format(**fields)
+
+
+def resolve_converter(converter="auto"):
+    if converter == "auto":
+        return "dcm2niix" if shutil.which("dcm2niix") else "python"
+    return converter
+
+
+def convert_series(series, output_dir, template=NAME_TEMPLATE, converter="auto"):
+    """
+    Convertește o singură serie (rulează într-un proces separat), cu dcm2niix sau,
+    dacă acesta lipsește, cu convertorul Python. dcm2niix primește un director temporar
+    cu legături simbolice doar către fișierele seriei; în ambele cazuri rezultatele se
+    mută în `output_dir` abia după o conversie reușită.
+    """
+    start = time.perf_counter()
+    record = {
+        "series_uid": series["series_uid"],
+        "patient_id": series["patient_id"],
+        "description": series["description"],
+        "series_number": series["series_number"],
+        "n_files": len(series["files"]),
+        "fingerprint": series["fingerprint"],
+        "outputs": [],
+        "converter": resolve_converter(converter),
+        "status": None,
+        "seconds": None,
+        "error": None,
+    }
+    basename = output_basename(series, template)
     try:
-        command = [
-            "dcm2niix",
-            "-z", "y",
-            "-f", "%f_%p",
-            "-o", output_dir,
-            source_dir
-        ]
-        subprocess.run(command, check=True)
-        print(f"✅ Conversie finalizata! Fisierele .nii.gz sunt in: {output_dir}")
-    except FileNotFoundError:
-        print("❌ Eroare: dcm2niix nu este instalat.")
-        print("Ruleaza: 'conda install -c conda-forge dcm2niix' sau 'brew install dcm2niix'")
+        with tempfile.TemporaryDirectory(prefix="dcm2niix_") as tmp:
+            input_dir = os.path.join(tmp, "in")
+            work_dir = os.path.join(tmp, "out")
+            os.makedirs(input_dir)
+            os.makedirs(work_dir)
+            if record["converter"] == "python":
+                convert_series_python(series["files"], os.path.join(work_dir, f"{basename}.nii.gz"))
+            else:
+                for i, path in enumerate(series["files"]):
+                    os.symlink(os.path.abspath(path), os.path.join(input_dir, f"{i:06d}.dcm"))
+
+                # -z y : .nii.gz comprimat; -b y : sidecar JSON BIDS; -f : numele fișierelor
+                command = ["dcm2niix", "-z", "y", "-b", "y", "-f", basename, "-o", work_dir, input_dir]
+                subprocess.run(command, check=True, capture_output=True, text=True)
+
+            produced = sorted(os.listdir(work_dir))
+            if not any(name.endswith((".nii", ".nii.gz")) for name in produced):
+                raise RuntimeError(f"{record['converter']} nu a produs niciun fișier NIfTI")
+            os.makedirs(output_dir, exist_ok=True)
+            for name in produced:
+                os.replace(os.path.join(work_dir, name), os.path.join(output_dir, name))
+                record["outputs"].append(name)
+        record["status"] = "converted"
+    except FileNotFoundError as e:
+        record["status"] = "failed"
+        record["error"] = ("dcm2niix nu este instalat (conda install -c conda-forge dcm2niix)"
+                           if record["converter"] == "dcm2niix" else str(e))
+    except subprocess.CalledProcessError as e:
+        record["status"] = "failed"
+        record["error"] = (e.stderr or e.stdout or str(e)).strip()[-500:]
     except Exception as e:
-        print(f"❌ Eroare la conversie: {e}")
+        record["status"] = "failed"
+        record["error"] = str(e)
+    finally:
+        record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {entry["series_uid"]: entry for entry in json.load(f)}
+
+
+def write_manifest(output_dir, entries):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(sorted(entries.values(), key=lambda e: (e["patient_id"], e["series_uid"])), f, indent=4)
+    os.replace(tmp_path, path)
+    return path
+
+
+def is_up_to_date(entry, series, output_dir):
+    """
+    O serie se sare dacă manifestul are aceeași amprentă și toate ieșirile există încă.
+    """
+    return (
+        entry is not None
+        and entry.get("status") in ("converted", "skipped")
+        and entry.get("fingerprint") == series["fingerprint"]
+        and entry.get("outputs")
+        and all(os.path.exists(os.path.join(output_dir, name)) for name in entry["outputs"])
+    )
+
+
+def convert_dicom_to_nifti(source_dir, output_dir, workers=None, force=False, template=NAME_TEMPLATE,
+                           index_path=INDEX_PATH, converter="auto"):
+    """
+    Convertește fiecare serie DICOM din `source_dir` într-un NIfTI separat, în paralel.
+    Seriile deja convertite cu aceeași amprentă sunt sărite, deci reimportul unui
+    folder PPMI care crește plătește doar pentru datele noi.
+    Manifestul `conversion_manifest.json` din `output_dir` descrie toate ieșirile.
+    Fără dcm2niix (conda install -c conda-forge dcm2niix) se folosește convertorul Python.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    print(f"🚀 Incepere conversie din: {source_dir}")
+    series = group_series(source_dir, index_path, workers=workers or os.cpu_count())
+    manifest = load_manifest(output_dir)
+
+    pending = []
+    for uid, item in sorted(series.items(), key=lambda kv: (kv[1]["patient_id"], kv[0])):
+        if not force and is_up_to_date(manifest.get(uid), item, output_dir):
+            manifest[uid]["status"] = "skipped"
+            print(f"  = skipped   {output_basename(item, template)} ({len(item['files'])} fisiere)")
+        else:
+            pending.append(item)
+
+    print(f"🧩 {len(series)} serii găsite, {len(pending)} de convertit ({workers or os.cpu_count()} procese)...")
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(convert_series, item, output_dir, template, converter) for item in pending]
+            for future in as_completed(futures):
+                record = future.result()
+                manifest[record["series_uid"]] = record
+                # Manifestul se rescrie atomic după fiecare serie: o întrerupere nu pierde progresul
+                write_manifest(output_dir, manifest)
+                icon = "✅" if record["status"] == "converted" else "❌"
+                print(f"  {icon} {record['status']:<9} {record['patient_id']} {record['description']} "
+                      f"({record['n_files']} fisiere, {record['seconds']}s)")
+                if record["error"]:
+                    print(f"    Eroare: {record['error']}")
+
+    path = write_manifest(output_dir, manifest)
+    print(f"📝 Manifest scris în: {path}")
+    return manifest
+
 
 if __name__ == "__main__":
-    # Calea ta de pe Mac
-    INPUT_FOLDER = "/Users/ruthciuclea/Desktop/licenta/folder_wit_pd"
-    # Unde vrei sa apara fisierele NIfTI gata de antrenat
-    OUTPUT_FOLDER = "/Users/ruthciuclea/Desktop/licenta/nifti_ready"
-    
-    convert_dicom_to_nifti(INPUT_FOLDER, OUTPUT_FOLDER)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Conversie DICOM -> NIfTI pe serii, în paralel și incremental.")
+    parser.add_argument("source", nargs="?", default="folder_wit_pd", help="Folderul cu fișiere DICOM (recursiv).")
+    parser.add_argument("output", nargs="?", default="nifti_ready", help="Unde apar fișierele NIfTI gata de antrenat.")
+    parser.add_argument("--workers", type=int, default=None, help="Număr de procese dcm2niix (implicit: toate nucleele).")
+    parser.add_argument("--force", action="store_true", help="Reconvertește și seriile nemodificate.")
+    parser.add_argument("--name-template", default=NAME_TEMPLATE,
+                        help="Numele ieșirilor; câmpuri: patient_id, description, series_number, series_uid.")
+    parser.add_argument("--index", default=INDEX_PATH, help="Indexul SQLite al anteturilor DICOM (dicom_index.py).")
+    parser.add_argument("--converter", choices=CONVERTERS, default="auto",
+                        help="dcm2niix, convertorul Python sau 'auto' (dcm2niix dacă este instalat).")
+    args = parser.parse_args()
+    convert_dicom_to_nifti(args.source, args.output, workers=args.workers, force=args.force,
+                           template=args.name_template, index_path=args.index, converter=args.converter)
@@ -2,7 +2,10 @@ import numpy as np
 import nibabel as nib
 import os
 from nilearn.datasets import load_mni152_template
-from nilearn.image import resample_to_img
+from nilearn.image import resample_img, resample_to_img
+
+from diagnosis.derivatives import write_nifti_streaming
+from diagnosis.resize_scans import target_grid
 
 def create_realistic_mock(filename):
     print(f"Generating Realistic Mock: {filename}...")
@@ -49,6 +52,31 @@ def create_realistic_mock(filename):
     nib.save(img, filename)
     print(f"✅ Successfully created: {filename}")
 
+def create_sized_mock(filename, voxel_size=2.0, n_timepoints=10, seed=0, tr=2.0, compresslevel=6):
+    """
+    Same recipe as create_realistic_mock, but for benchmarks: any resolution and length,
+    reproducible (seeded noise) and written volume by volume, so a 1.5 GB scan
+    never has to fit in RAM.
+    """
+    mni = load_mni152_template()
+    target_affine, target_shape = target_grid(mni.affine, mni.shape, voxel_size)
+    base = resample_img(mni, target_affine=target_affine, target_shape=target_shape,
+                        interpolation='continuous').get_fdata()
+    brain_mask = base > 0
+    # The global maximum is unknown until the end, so scale by the template max + 4 sigma of noise
+    scale = 150.0 / (base.max() + 40.0)
+    rng = np.random.default_rng(seed)
+
+    def fill(data):
+        for t in range(n_timepoints):
+            volume = base + rng.standard_normal(base.shape) * 10 * brain_mask
+            data[..., t] = np.clip(volume, 0, None) * scale
+
+    print(f"Generating Sized Mock: {filename} ({target_shape} x {n_timepoints}, {voxel_size:g} mm)...")
+    write_nifti_streaming(filename, target_shape + (n_timepoints,), np.float32, target_affine, fill,
+                          zooms_t=tr, compresslevel=compresslevel)
+    return filename
+
 if __name__ == "__main__":
     if not os.path.exists('mocks'):
         os.makedirs('mocks')
@@ -1,16 +1,95 @@
+import os
+
 from django.contrib import admin
-from .models import PatientScan
+from django.http import FileResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .models import PatientScan, CloudOutbox, StageMetric, ViewProfile
+
+
+class StageMetricInline(admin.TabularInline):
+    # Durata, CPU și memoria fiecărei etape (upload, analiză, sincronizare Cloud)
+    model = StageMetric
+    extra = 0
+    can_delete = False
+    fields = ('source', 'stage', 'wall_seconds', 'cpu_seconds', 'peak_rss_mb', 'peak_anon_mb', 'failed', 'created_at')
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(PatientScan)
 class PatientScanAdmin(admin.ModelAdmin):
     # Coloanele care vor apărea în tabelul de administrare
-    list_display = ('patient_id', 'age', 'prediction', 'confidence', 'created_at', 'doctor')
+    list_display = ('patient_id', 'age', 'prediction', 'confidence', 'model_version', 'created_at', 'doctor')
     
     # Filtre pentru a găsi rapid datele
-    list_filter = ('prediction', 'created_at')
+    list_filter = ('prediction', 'model_version', 'created_at')
     
     # Câmpuri după care poți căuta
     search_fields = ('patient_id', 'prediction')
     
     # Permitem editarea rapidă a vârstei direct din listă
-    list_editable = ('age',)
\ No newline at end of file
+    list_editable = ('age',)
+
+    inlines = [StageMetricInline]
+
+
+@admin.register(CloudOutbox)
+class CloudOutboxAdmin(admin.ModelAdmin):
+    # Starea sincronizării Firestore: mesaje în așteptare, trimise și erori
+    list_display = ('doc_id', 'scan', 'created_at', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('sent_at',)
+    search_fields = ('doc_id', 'user_id', 'last_error')
+    readonly_fields = ('created_at', 'sent_at')
+
+
+@admin.register(StageMetric)
+class StageMetricAdmin(admin.ModelAdmin):
+    # Toate măsurătorile, pentru sortare după cele mai lente etape (percentilele: /metrics/stages/)
+    list_display = ('scan', 'source', 'stage', 'wall_seconds', 'cpu_seconds', 'peak_anon_mb', 'failed', 'created_at')
+    list_filter = ('source', 'stage', 'failed')
+    search_fields = ('scan__patient_id', 'stage')
+    list_select_related = ('scan',)
+
+
+@admin.register(ViewProfile)
+class ViewProfileAdmin(admin.ModelAdmin):
+    # Profilele cProfile capturate la cerere (VIEW_PROFILING), cu descărcarea fișierului .prof
+    list_display = ('created_at', 'view_name', 'method', 'path', 'user', 'status_code', 'duration_ms', 'download')
+    list_filter = ('view_name', 'status_code')
+    search_fields = ('path', 'user__username')
+    fields = ('view_name', 'method', 'path', 'user', 'status_code', 'duration_ms', 'created_at', 'download',
+              'summary_text')
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:profile_id>/download/', self.admin_site.admin_view(self.download_view),
+                 name='diagnosis_viewprofile_download'),
+        ] + super().get_urls()
+
+    def download_view(self, request, profile_id):
+        profile = get_object_or_404(ViewProfile, pk=profile_id)
+        return FileResponse(
+            profile.profile_file.open('rb'),
+            as_attachment=True,
+            filename=f"{profile.view_name}_{profile.pk}.prof",
+        )
+
+    @admin.display(description='Profile')
+    def download(self, obj):
+        if not obj.profile_file:
+            return '-'
+        url = reverse('admin:diagnosis_viewprofile_download', args=[obj.pk])
+        return format_html('<a href="{}">{}</a>', url, os.path.basename(obj.profile_file.name))
+
+    @admin.display(description='Summary')
+    def summary_text(self, obj):
+        return format_html('<pre style="white-space: pre; overflow-x: auto">{}</pre>', obj.summary)
@@ -1,6 +1,46 @@
+import os
+import sys
+import threading
+
 from django.apps import AppConfig
+from django.conf import settings
+
+
+def _is_serving():
+    """
+    True doar în procesele care servesc cereri: `manage.py runserver` sau un server
+    WSGI / ASGI care a importat modulul aplicației (gunicorn, uwsgi, daphne, uvicorn).
+    Nu pentru migrate, test, shell, scripturi sau procesele worker pornite de export.
+    """
+    if os.path.basename(sys.argv[0]) == 'manage.py':
+        if sys.argv[1:2] != ['runserver']:
+            return False
+        # Procesul părinte al autoreloader-ului nu servește cereri
+        return '--noreload' in sys.argv or os.environ.get('RUN_MAIN') == 'true'
+    # ready() rulează chiar în timpul importului pd_project.wsgi / pd_project.asgi
+    package = getattr(settings, 'WSGI_APPLICATION', 'pd_project.wsgi.application').split('.')[0]
+    return f"{package}.wsgi" in sys.modules or f"{package}.asgi" in sys.modules
 
 
 class DiagnosisConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "diagnosis"
+
+    def ready(self):
+        # Invalidarea statisticilor din dashboard la salvarea / ștergerea scanărilor
+        from . import signals  # noqa: F401
+
+        if getattr(settings, 'ML_ENGINE_WARMUP', False) and _is_serving():
+            from .ml_logic import get_engine
+            # Încălzim motorul în fundal ca să nu blocăm pornirea serverului
+            threading.Thread(target=get_engine().warmup, name='ml-engine-warmup', daemon=True).start()
+
+        if getattr(settings, 'ANALYSIS_DISPATCH', 'thread') == 'thread' and _is_serving():
+            from .jobs import resume_pending_jobs
+            # Joburile rămase de la oprirea anterioară se reiau în pool-ul acestui proces
+            threading.Thread(target=resume_pending_jobs, name='analysis-resume', daemon=True).start()
+
+        if getattr(settings, 'CLOUD_OUTBOX_FLUSHER', True) and _is_serving():
+            from .cloud_utils import start_outbox_flusher
+            # Trimite în fundal mesajele din outbox-ul Cloud (inclusiv cele rămase de la o oprire)
+            start_outbox_flusher()
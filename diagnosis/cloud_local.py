@@ -0,0 +1,70 @@
+import copy
+import threading
+
+
+class LocalDocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def collection(self, name):
+        return LocalCollectionReference(self._client, f"{self.path}/{name}")
+
+    def set(self, data):
+        self._client._commit([(self.path, data)])
+
+    def get(self):
+        return self._client.documents.get(self.path)
+
+
+class LocalCollectionReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+
+    def document(self, doc_id):
+        return LocalDocumentReference(self._client, f"{self.path}/{doc_id}")
+
+
+class LocalWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, doc_ref, data):
+        self._writes.append((doc_ref.path, data))
+
+    def commit(self):
+        self._client._commit(self._writes)
+        self._writes = []
+
+
+class LocalFirestoreClient:
+    """
+    Înlocuitor in-process pentru clientul Firestore (collection/document/set/batch),
+    folosit în dezvoltare (CLOUD_SYNC_BACKEND = 'local') și în teste.
+    Documentele stau în `documents` (cale -> date); `fail_commits` simulează erori de rețea.
+    """
+
+    def __init__(self, fail_commits=0):
+        self.documents = {}
+        self.commits = 0
+        self.fail_commits = fail_commits
+        self._lock = threading.Lock()
+
+    def collection(self, name):
+        return LocalCollectionReference(self, name)
+
+    def batch(self):
+        return LocalWriteBatch(self)
+
+    def _commit(self, writes):
+        with self._lock:
+            if self.fail_commits > 0:
+                self.fail_commits -= 1
+                raise ConnectionError("Local Firestore stand-in: simulated unavailable backend")
+            # Ca în Firestore, un lot se aplică atomic
+            for path, data in writes:
+                self.documents[path] = copy.deepcopy(data)
+            self.commits += 1
@@ -1,5 +1,6 @@
 import os
 import uuid
+import threading
 from datetime import datetime
 import firebase_admin
 from firebase_admin import credentials, firestore
@@ -36,36 +37,177 @@ def get_firestore_client():
             return None
     return db
 
-def save_scan_to_cloud(user_id, scan_data):
+def scans_collection(client):
+    # Construim calea conform regulilor de securitate
+    return client.collection('artifacts').document(app_id).collection('public').document('data').collection('scans')
+
+
+def build_cloud_document(user_id, scan_data, doc_id, timestamp=None):
+    return {
+        **scan_data,
+        'cloud_id': doc_id,
+        'user_id': str(user_id),
+        'timestamp': (timestamp or datetime.now()).isoformat(),
+        'status': 'finalized'
+    }
+
+
+# --- Outbox tranzacțional ---
+#
+# Rezultatul este scris local în CloudOutbox în aceeași tranzacție cu PatientScan;
+# un flusher din fundal trimite mesajele în loturi Firestore, cu reîncercări și backoff.
+# Cererile HTTP nu mai așteaptă după Cloud și niciun mesaj nu se pierde.
+
+FIRESTORE_BATCH_LIMIT = 500
+
+_local_client = None
+
+
+def get_sync_client():
+    """
+    Clientul folosit de flusher: Firestore real sau înlocuitorul local (CLOUD_SYNC_BACKEND).
+    """
+    global _local_client
+    from django.conf import settings
+    if getattr(settings, 'CLOUD_SYNC_BACKEND', 'firestore') == 'local':
+        if _local_client is None:
+            from .cloud_local import LocalFirestoreClient
+            _local_client = LocalFirestoreClient()
+        return _local_client
+    return get_firestore_client()
+
+
+def enqueue_scan_sync(scan):
+    """
+    Creează mesajul de sincronizare pentru o scanare. Se apelează în interiorul
+    tranzacției care salvează rezultatul (transaction.atomic).
+    """
+    from .models import CloudOutbox
+    payload = {
+        'patient_id': scan.patient_id,
+        'prediction': scan.prediction,
+        'confidence': scan.confidence,
+        'age': scan.age or 0,
+        'doctor_username': scan.doctor.username if scan.doctor else ''
+    }
+    doc_id = str(uuid.uuid4())
+    return CloudOutbox.objects.create(
+        scan=scan,
+        user_id=str(scan.doctor_id or ''),
+        doc_id=doc_id,
+        payload=build_cloud_document(scan.doctor_id, payload, doc_id),
+    )
+
+
+def backoff_delay(attempts, base=None, maximum=None):
+    """
+    Întârziere exponențială (secunde) după `attempts` eșecuri consecutive.
+    """
+    from django.conf import settings
+    base = base if base is not None else getattr(settings, 'CLOUD_SYNC_BACKOFF_BASE', 5)
+    maximum = maximum if maximum is not None else getattr(settings, 'CLOUD_SYNC_BACKOFF_MAX', 3600)
+    return min(maximum, base * (2 ** max(0, attempts - 1)))
+
+
+def flush_outbox(client=None, batch_size=FIRESTORE_BATCH_LIMIT):
     """
-    Salvează rezultatul unui diagnostic în Firestore.
-    Calea: /artifacts/{appId}/public/data/scans
+    Trimite mesajele scadente în loturi Firestore (batch.set + commit).
+    Un lot eșuat rămâne în outbox și este reprogramat cu backoff exponențial.
+    Întoarce numărul de documente sincronizate.
     """
-    client = get_firestore_client()
+    from django.db.models import F
+    from django.utils import timezone
+    from .instrumentation import StageRecorder
+    from .models import CloudOutbox, StageMetric
+
+    client = client or get_sync_client()
     if client is None:
-        print("📴 Cloud Offline: Verificați prezența fișierului serviceAccountKey.json")
-        return None
-
-    try:
-        # Generăm un ID unic pentru document
-        doc_id = str(uuid.uuid4())
-        
-        # Construim calea conform regulilor de securitate
-        doc_ref = client.collection('artifacts').document(app_id).collection('public').document('data').collection('scans').document(doc_id)
-        
-        # Pregătim datele pentru upload
-        full_data = {
-            **scan_data,
-            'cloud_id': doc_id,
-            'user_id': str(user_id),
-            'timestamp': datetime.now().isoformat(),
-            'status': 'finalized'
-        }
-        
-        # Executăm scrierea în baza de date Google
-        doc_ref.set(full_data)
-        print(f"☁️ [Cloud Sync] Datele pacientului {scan_data.get('patient_id')} au fost sincronizate.")
-        return doc_id
-    except Exception as e:
-        print(f"❌ Eroare la scrierea în Cloud: {e}")
-        return None
\ No newline at end of file
+        # Cloud offline: mesajele rămân în outbox pentru următoarea rundă
+        return 0
+
+    batch_size = min(batch_size, FIRESTORE_BATCH_LIMIT)
+    sent = 0
+    while True:
+        now = timezone.now()
+        pending = list(
+            CloudOutbox.objects.filter(sent_at__isnull=True, next_attempt_at__lte=now).order_by('id')[:batch_size]
+        )
+        if not pending:
+            return sent
+
+        ids = [message.id for message in pending]
+        recorder = StageRecorder(StageMetric.SOURCE_CLOUD)
+        try:
+            with recorder.stage('firestore_batch'):
+                batch = client.batch()
+                collection = scans_collection(client)
+                for message in pending:
+                    batch.set(collection.document(message.doc_id), message.payload)
+                batch.commit()
+        except Exception as e:
+            attempts = max(message.attempts for message in pending) + 1
+            CloudOutbox.objects.filter(id__in=ids).update(
+                attempts=F('attempts') + 1,
+                last_error=str(e),
+                next_attempt_at=now + timezone.timedelta(seconds=backoff_delay(attempts)),
+            )
+            print(f"❌ Eroare la sincronizarea lotului Cloud ({len(ids)} documente): {e}")
+            return sent
+
+        CloudOutbox.objects.filter(id__in=ids).update(sent_at=now, last_error='')
+        # Un commit acoperă tot lotul: fiecare scanare primește durata lotului în care a plecat
+        StageMetric.objects.bulk_create([
+            StageMetric(scan_id=message.scan_id, **row)
+            for message in pending if message.scan_id
+            for row in recorder.results()
+        ])
+        sent += len(ids)
+        print(f"☁️ [Cloud Sync] {len(ids)} documente sincronizate într-un lot.")
+
+
+class OutboxFlusher:
+    """
+    Fir de fundal care golește outbox-ul periodic sau imediat după `wake()`.
+    """
+
+    def __init__(self, interval=None):
+        from django.conf import settings
+        self.interval = interval or getattr(settings, 'CLOUD_SYNC_INTERVAL', 30)
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='cloud-outbox', daemon=True)
+            self._thread.start()
+        return self
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        from django.db import close_old_connections
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                flush_outbox()
+            except Exception as e:
+                print(f"❌ Eroare flusher Cloud: {e}")
+            finally:
+                close_old_connections()
+
+
+_flusher = None
+
+
+def start_outbox_flusher():
+    global _flusher
+    if _flusher is None:
+        _flusher = OutboxFlusher().start()
+    return _flusher
+
+
+def wake_outbox_flusher():
+    if _flusher is not None:
+        _flusher.wake()
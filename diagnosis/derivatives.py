@@ -0,0 +1,115 @@
+import gzip
+import os
+import shutil
+
+import nibabel as nib
+import numpy as np
+
+NIFTI_VOX_OFFSET = 352
+
+
+def preview_path_for(viewer_path):
+    """
+    `scan_viewer.nii.gz` -> `scan_viewer_preview.nii.gz`
+    """
+    return viewer_path.replace('.nii.gz', '_preview.nii.gz')
+
+
+def downsample_blocks(volume, affine, max_dim):
+    """
+    Reduce volumul 3D prin medie pe blocuri f x f x f, astfel încât cea mai mare
+    dimensiune să fie <= max_dim. Afinul se ajustează la noul centru al voxelilor.
+    """
+    factor = int(np.ceil(max(volume.shape) / float(max_dim)))
+    if factor <= 1:
+        return volume, affine
+
+    # Tăiem marginile ca dimensiunile să fie multipli ai factorului
+    shape = [(d // factor) * factor for d in volume.shape]
+    cropped = volume[:shape[0], :shape[1], :shape[2]]
+    small = cropped.reshape(
+        shape[0] // factor, factor,
+        shape[1] // factor, factor,
+        shape[2] // factor, factor,
+    ).mean(axis=(1, 3, 5))
+
+    scale = np.diag([factor, factor, factor, 1.0])
+    scale[:3, 3] = (factor - 1) / 2.0
+    return small, affine @ scale
+
+
+def write_quantized(volume, affine, path, dtype, compresslevel):
+    """
+    Scrie volumul cuantizat la `dtype` (uint8/int16); nibabel alege scl_slope/scl_inter,
+    deci valorile originale se recuperează în vizualizator.
+    """
+    img = nib.Nifti1Image(np.asarray(volume, dtype=np.float32), affine)
+    img.set_data_dtype(dtype)
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, 'wb', compresslevel=compresslevel) as f:
+        f.write(img.to_bytes())
+    os.replace(tmp_path, path)
+    return path
+
+
+def write_viewer_derivatives(volume, affine, viewer_path, preview_max_dim=64, compresslevel=6):
+    """
+    Generează cele două derivate pentru niivue:
+      - preview: rezoluție redusă, uint8 (încărcare instantanee)
+      - full: rezoluție completă, int16 (descărcat la cerere)
+    Întoarce {'full': path, 'preview': path}.
+    """
+    volume = np.nan_to_num(np.asarray(volume, dtype=np.float32))
+    preview, preview_affine = downsample_blocks(volume, affine, preview_max_dim)
+    preview_path = preview_path_for(viewer_path)
+
+    write_quantized(volume, affine, viewer_path, np.int16, compresslevel)
+    write_quantized(preview, preview_affine, preview_path, np.uint8, compresslevel)
+    return {'full': viewer_path, 'preview': preview_path}
+
+
+def write_nifti_streaming(path, shape, dtype, affine, fill, zooms_t=None, slope_inter=None, compresslevel=6):
+    """
+    Scrie un NIfTI fără a ține volumul în RAM: antetul se scrie întâi, apoi datele se
+    completează felie cu felie într-un np.memmap peste fișier (ordinea Fortran din NIfTI).
+    Pentru `.nii.gz` fișierul brut se comprimă prin streaming și apoi se șterge.
+    """
+    header = nib.Nifti1Header()
+    header.set_data_shape(shape)
+    header.set_data_dtype(dtype)
+    header.set_qform(affine, code=1)
+    header.set_sform(affine, code=1)
+    zooms = tuple(np.linalg.norm(affine[:3, :3], axis=0))
+    if len(shape) == 4:
+        zooms += (zooms_t or 1.0,)
+    header.set_zooms(zooms)
+    header.set_xyzt_units("mm", "sec")
+    if slope_inter is not None:
+        header.set_slope_inter(*slope_inter)
+    header["vox_offset"] = NIFTI_VOX_OFFSET
+
+    compressed = path.endswith(".gz")
+    raw_path = f"{path[:-3]}.tmp" if compressed else f"{path}.tmp"
+    n_bytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    with open(raw_path, "wb") as f:
+        f.write(header.binaryblock)
+        f.write(b"\x00" * (NIFTI_VOX_OFFSET - len(header.binaryblock)))
+        f.truncate(NIFTI_VOX_OFFSET + n_bytes)
+
+    try:
+        data = np.memmap(raw_path, dtype=dtype, mode="r+", offset=NIFTI_VOX_OFFSET, shape=shape, order="F")
+        fill(data)
+        data.flush()
+        del data
+
+        if compressed:
+            tmp_path = f"{path}.tmp"
+            with open(raw_path, "rb") as src, gzip.open(tmp_path, "wb", compresslevel=compresslevel) as dst:
+                shutil.copyfileobj(src, dst, length=16 * 1024 * 1024)
+            os.replace(tmp_path, path)
+        else:
+            os.replace(raw_path, path)
+    finally:
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+    return path
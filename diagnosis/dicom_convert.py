@@ -0,0 +1,242 @@
+import json
+import math
+import os
+import tempfile
+import warnings
+import zipfile
+
+import numpy as np
+import pydicom
+from pydicom.tag import Tag
+
+from .derivatives import write_nifti_streaming
+
+# UID-urile PPMI anonimizate nu respectă strict VR UI; avertismentele nu ne privesc aici
+warnings.filterwarnings("ignore", module="pydicom")
+
+MOSAIC_TAG = Tag(0x0019, 0x100A)  # Siemens NumberOfImagesInMosaic
+CONVERTER_NAME = "NeuroDetect dicom_convert"
+
+# DICOM folosește LPS, NIfTI folosește RAS
+LPS_TO_RAS = np.diag([-1.0, -1.0, 1.0, 1.0])
+
+
+def read_headers(paths):
+    """
+    Anteturile (fără pixeli) pentru fișierele unei serii; fișierele non-DICOM sunt ignorate.
+    """
+    headers = []
+    for path in paths:
+        try:
+            ds = pydicom.dcmread(path, stop_before_pixels=True)
+        except Exception:
+            continue
+        if "SeriesInstanceUID" in ds and "ImagePositionPatient" in ds:
+            headers.append((path, ds))
+    return headers
+
+
+def group_by_series(paths):
+    """
+    {SeriesInstanceUID: [(path, header), ...]}
+    """
+    series = {}
+    for path, ds in read_headers(paths):
+        series.setdefault(str(ds.SeriesInstanceUID), []).append((path, ds))
+    return series
+
+
+def is_mosaic(ds):
+    return MOSAIC_TAG in ds or "MOSAIC" in [str(v).upper() for v in ds.get("ImageType", [])]
+
+
+def _temporal_key(item):
+    _, ds = item
+    return (int(ds.get("AcquisitionNumber", 0) or 0), int(ds.get("InstanceNumber", 0) or 0), item[0])
+
+
+def _orientation(ds):
+    iop = np.array(ds.ImageOrientationPatient, dtype=float)
+    row_cos, col_cos = iop[:3], iop[3:]
+    normal = np.cross(row_cos, col_cos)
+    ps_row, ps_col = (float(v) for v in ds.PixelSpacing)
+    return row_cos, col_cos, normal, ps_row, ps_col
+
+
+def _slice_spacing(ds):
+    return float(ds.get("SpacingBetweenSlices") or ds.get("SliceThickness") or 1.0)
+
+
+def plan_mosaic(items):
+    """
+    Seria Siemens mozaic (rsfMRI PPMI): un fișier = un volum, feliile așezate într-o grilă.
+    Poziția din antet este colțul întregului mozaic, deci se corectează la prima felie.
+    """
+    items = sorted(items, key=_temporal_key)
+    ds = items[0][1]
+    n_slices = int(ds[MOSAIC_TAG].value) if MOSAIC_TAG in ds else None
+    if not n_slices:
+        raise ValueError("Serie mozaic fără NumberOfImagesInMosaic (0019,100A)")
+    grid = int(math.ceil(math.sqrt(n_slices)))
+    rows, cols = int(ds.Rows), int(ds.Columns)
+    tile_rows, tile_cols = rows // grid, cols // grid
+
+    row_cos, col_cos, normal, ps_row, ps_col = _orientation(ds)
+    origin = (
+        np.array(ds.ImagePositionPatient, dtype=float)
+        + row_cos * ps_col * (cols - tile_cols) / 2.0
+        + col_cos * ps_row * (rows - tile_rows) / 2.0
+    )
+    affine = np.eye(4)
+    affine[:3, 0] = row_cos * ps_col
+    affine[:3, 1] = col_cos * ps_row
+    affine[:3, 2] = normal * _slice_spacing(ds)
+    affine[:3, 3] = origin
+
+    def volumes():
+        # Un singur fișier în memorie la un moment dat
+        for path, _ in items:
+            pixels = pydicom.dcmread(path).pixel_array
+            tiles = pixels[:grid * tile_rows, :grid * tile_cols].reshape(grid, tile_rows, grid, tile_cols)
+            # (rând grilă, rând, coloană grilă, coloană) -> (rând, coloană, felie)
+            stack = tiles.transpose(1, 3, 0, 2).reshape(tile_rows, tile_cols, grid * grid)[..., :n_slices]
+            yield None, stack.transpose(1, 0, 2)
+
+    shape = (tile_cols, tile_rows, n_slices, len(items))
+    return shape, LPS_TO_RAS @ affine, volumes
+
+
+def plan_slices(items):
+    """
+    Serie cu o felie per fișier (ex. MPRAGE sau EPI non-mozaic): feliile se ordonează după
+    proiecția poziției pe normala planului, iar volumele după AcquisitionNumber/InstanceNumber.
+    """
+    ds = items[0][1]
+    row_cos, col_cos, normal, ps_row, ps_col = _orientation(ds)
+
+    by_position = {}
+    for item in items:
+        position = np.array(item[1].ImagePositionPatient, dtype=float)
+        by_position.setdefault(round(float(position @ normal), 3), []).append(item)
+    distances = sorted(by_position)
+    n_slices = len(distances)
+    counts = {len(group) for group in by_position.values()}
+    if len(counts) != 1:
+        raise ValueError(f"Serie incompletă: număr diferit de volume pe felii ({sorted(counts)})")
+    n_volumes = counts.pop()
+
+    first = np.array(by_position[distances[0]][0][1].ImagePositionPatient, dtype=float)
+    if n_slices > 1:
+        last = np.array(by_position[distances[-1]][0][1].ImagePositionPatient, dtype=float)
+        slice_vector = (last - first) / (n_slices - 1)
+    else:
+        slice_vector = normal * _slice_spacing(ds)
+
+    affine = np.eye(4)
+    affine[:3, 0] = row_cos * ps_col
+    affine[:3, 1] = col_cos * ps_row
+    affine[:3, 2] = slice_vector
+    affine[:3, 3] = first
+
+    ordered = [sorted(by_position[d], key=_temporal_key) for d in distances]
+
+    def volumes():
+        for t in range(n_volumes):
+            for k, group in enumerate(ordered):
+                yield (k, t), pydicom.dcmread(group[t][0]).pixel_array.T
+
+    shape = (int(ds.Columns), int(ds.Rows), n_slices, n_volumes)
+    return shape, LPS_TO_RAS @ affine, volumes
+
+
+def sidecar_for(ds, tr):
+    """
+    Sidecar JSON minimal în stil BIDS (câmpurile folosite mai departe în pipeline).
+    """
+    sidecar = {
+        "Modality": str(ds.get("Modality", "")),
+        "Manufacturer": str(ds.get("Manufacturer", "")),
+        "SeriesDescription": str(ds.get("SeriesDescription", "")),
+        "ProtocolName": str(ds.get("ProtocolName", "")),
+        "SeriesNumber": int(ds.get("SeriesNumber", 0) or 0),
+        "SeriesInstanceUID": str(ds.get("SeriesInstanceUID", "")),
+        "ConversionSoftware": CONVERTER_NAME,
+    }
+    if ds.get("EchoTime") not in (None, ""):
+        sidecar["EchoTime"] = float(ds.EchoTime) / 1000.0
+    if ds.get("FlipAngle") not in (None, ""):
+        sidecar["FlipAngle"] = float(ds.FlipAngle)
+    if tr:
+        sidecar["RepetitionTime"] = tr
+    return sidecar
+
+
+def convert_series(paths, output_path, compresslevel=6):
+    """
+    Convertește o serie DICOM (lista de fișiere) în NIfTI, fără dcm2niix.
+    Acoperă seriile PPMI: rsfMRI Siemens mozaic și seriile cu o felie per fișier (MPRAGE).
+    Scrie și sidecar-ul JSON lângă NIfTI. Întoarce {'nifti', 'sidecar', 'shape'}.
+    """
+    items = read_headers(paths)
+    if not items:
+        raise ValueError("Niciun fișier DICOM cu geometrie (ImagePositionPatient) în serie")
+    series_uids = {str(ds.SeriesInstanceUID) for _, ds in items}
+    if len(series_uids) > 1:
+        raise ValueError(f"Fișierele aparțin mai multor serii ({len(series_uids)})")
+
+    ds = items[0][1]
+    shape, affine, volumes = plan_mosaic(items) if is_mosaic(ds) else plan_slices(items)
+    if shape[3] == 1:
+        shape = shape[:3]
+
+    # Tipul datelor din primul fișier (uint16 / int16 la PPMI); rescale-ul rămâne în antet
+    dtype = pydicom.dcmread(items[0][0]).pixel_array.dtype
+    slope = float(ds.get("RescaleSlope", 1) or 1)
+    inter = float(ds.get("RescaleIntercept", 0) or 0)
+    tr = float(ds.RepetitionTime) / 1000.0 if ds.get("RepetitionTime") not in (None, "") else None
+
+    def fill(data):
+        target = data if data.ndim == 4 else data[..., np.newaxis]
+        for t, (index, values) in enumerate(volumes()):
+            if index is None:
+                target[..., t] = values
+            else:
+                k, vol = index
+                target[:, :, k, vol] = values
+
+    write_nifti_streaming(
+        output_path, shape, dtype, affine, fill,
+        zooms_t=tr, slope_inter=(slope, inter) if (slope, inter) != (1.0, 0.0) else None,
+        compresslevel=compresslevel,
+    )
+
+    sidecar_path = output_path.replace(".nii.gz", ".json").replace(".nii", ".json")
+    with open(sidecar_path, "w") as f:
+        json.dump(sidecar_for(ds, tr), f, indent=4)
+    return {"nifti": output_path, "sidecar": sidecar_path, "shape": shape}
+
+
+def is_dicom_archive(path):
+    return path.lower().endswith(".zip") and zipfile.is_zipfile(path)
+
+
+def convert_dicom_archive(archive_path, output_path, compresslevel=6):
+    """
+    Conversia unei arhive .zip cu DICOM-uri încărcate pe server: se alege seria cu cele
+    mai multe fișiere (la PPMI, rsfMRI-ul 4D) și se scrie ca NIfTI în `output_path`.
+    """
+    with tempfile.TemporaryDirectory(prefix="dicom_upload_") as tmp:
+        with zipfile.ZipFile(archive_path) as archive:
+            for member in archive.infolist():
+                name = os.path.normpath(member.filename)
+                # Fără căi absolute sau `..` în arhivă
+                if member.is_dir() or name.startswith("..") or os.path.isabs(name):
+                    continue
+                archive.extract(member, tmp)
+
+        paths = sorted(os.path.join(root, name) for root, _, names in os.walk(tmp) for name in names)
+        series = group_by_series(paths)
+        if not series:
+            raise ValueError("Arhiva nu conține fișiere DICOM")
+        largest = max(series.values(), key=len)
+        return convert_series([path for path, _ in largest], output_path, compresslevel=compresslevel)
@@ -0,0 +1,158 @@
+import csv
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .models import PatientScan
+from .report_worker import init_worker, render
+from .reports import cached_report_path, report_key, report_snapshot, store_report
+
+CSV_FIELDS = [
+    'id', 'patient_id', 'age', 'doctor', 'created_at', 'status',
+    'prediction', 'confidence', 'model_version', 'content_sha256', 'report', 'report_status',
+]
+
+
+class _StreamBuffer:
+    """
+    Destinație ne-căutabilă (fără seek/tell) pentru zipfile: octeții scriși se
+    colectează și sunt goliți de generator după fiecare intrare din arhivă.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def export_queryset(date_from=None, date_to=None, doctor=None):
+    """
+    Scanările de exportat: interval de date (inclusiv) și, opțional, un medic (username).
+    """
+    scans = PatientScan.objects.select_related('doctor').order_by('created_at', 'id')
+    if date_from:
+        scans = scans.filter(created_at__date__gte=date_from)
+    if date_to:
+        scans = scans.filter(created_at__date__lte=date_to)
+    if doctor:
+        scans = scans.filter(doctor__username=doctor)
+    return scans
+
+
+def report_entry_name(scan):
+    return f"reports/{scan.id}_{scan.patient_id}.pdf"
+
+
+def _worker_context():
+    # Exportul rulează în procesul web, lângă firele de analiză și de sincronizare:
+    # un fork ar moșteni lock-uri ținute și conexiuni la baza de date deschise
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+def _iter_batches(scans, chunk_rows):
+    """
+    Scanările, în loturi complet citite: raportul salvat (UPDATE pe PatientScan) nu se
+    scrie niciodată cât timp un cursor pe același tabel este încă deschis (SQLite).
+    """
+    pks = list(scans.values_list('pk', flat=True))
+    for start in range(0, len(pks), chunk_rows):
+        chunk = pks[start:start + chunk_rows]
+        by_pk = scans.model.objects.select_related('doctor').in_bulk(chunk)
+        yield [by_pk[pk] for pk in chunk if pk in by_pk]
+
+
+def _summary_row(scan, report_entry, report_status):
+    return [
+        scan.id, scan.patient_id, scan.age,
+        scan.doctor.username if scan.doctor else '',
+        scan.created_at.isoformat(), scan.status, scan.prediction or '',
+        scan.confidence if scan.confidence is not None else '',
+        scan.model_version, scan.content_sha256, report_entry, report_status,
+    ]
+
+
+def iter_export_zip(scans, workers=None, chunk_rows=500):
+    """
+    Generează arhiva ZIP bucată cu bucată: câte un PDF per scanare, apoi summary.csv.
+    Rapoartele deja stocate sunt copiate; cele lipsă se randează în paralel, cu cel
+    mult 2 x workers joburi în zbor, deci memoria nu crește cu mărimea exportului.
+    Rândul CSV al unui raport care nu a putut fi randat are `report` gol și
+    `report_status` = 'render_failed'.
+    """
+    buffer = _StreamBuffer()
+    archive = zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED)
+
+    # Rezumatul se scrie pe măsură ce intrările intră în arhivă (spill pe disc peste 8 MB)
+    summary = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024, mode='w+', encoding='utf-8', newline='')
+    writer = csv.writer(summary)
+    writer.writerow(CSV_FIELDS)
+
+    # 1. Rapoartele PDF, în ordinea scanărilor
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, mp_context=_worker_context()) as pool:
+        window = deque()
+        max_in_flight = 2 * workers
+
+        def write_next():
+            scan, key, path, future = window.popleft()
+            if path is None:
+                try:
+                    pdf = future.result()
+                except Exception as e:
+                    print(f"⚠️ Raportul pentru scanarea {scan.id} nu a putut fi randat: {e}")
+                    pdf = None
+                if pdf is None:
+                    writer.writerow(_summary_row(scan, '', 'render_failed'))
+                    return
+                path = store_report(scan, pdf, key)
+            with open(path, 'rb') as src, archive.open(report_entry_name(scan), 'w') as dest:
+                shutil.copyfileobj(src, dest, 1024 * 1024)
+            writer.writerow(_summary_row(scan, report_entry_name(scan), 'included'))
+
+        for batch in _iter_batches(scans, chunk_rows):
+            for scan in batch:
+                key = report_key(scan)
+                path = cached_report_path(scan, key)
+                future = None if path else pool.submit(render, report_snapshot(scan))
+                window.append((scan, key, path, future))
+                if len(window) >= max_in_flight:
+                    write_next()
+                    yield buffer.drain()
+
+        while window:
+            write_next()
+            yield buffer.drain()
+
+    # 2. Rezumatul CSV, doar cu rapoartele efectiv incluse marcate ca atare
+    summary.seek(0)
+    with summary, archive.open('summary.csv', 'w') as raw:
+        text = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        while True:
+            data = summary.read(1024 * 1024)
+            if not data:
+                break
+            text.write(data)
+            text.flush()
+            yield buffer.drain()
+        text.detach()
+    yield buffer.drain()
+
+    archive.close()
+    yield buffer.drain()
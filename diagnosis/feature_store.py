@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+from django.core.files.storage import default_storage
+
+# Descrierea trăsăturilor salvate (trebuie să corespundă cu ml_logic.InferenceEngine)
+ATLAS = 'msdl'
+KIND = 'correlation'
+
+FEATURES_DIR = 'features'
+
+
+def features_name(scan):
+    """
+    Numele sidecar-ului .npz, relativ la MEDIA_ROOT. Cheia este amprenta conținutului,
+    deci scanările duplicate partajează același fișier.
+    """
+    key = scan.content_sha256 or f"scan_{scan.pk}"
+    return f"{FEATURES_DIR}/{key}.npz"
+
+
+def save_features(scan, time_series, feature_vector):
+    """
+    Scrie seriile temporale ROI și vectorul de conectivitate (float32) și
+    leagă fișierul de scanare. Nu salvează modelul; apelantul face scan.save().
+    """
+    name = features_name(scan)
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # np.savez adaugă extensia .npz doar dacă lipsește; scriem atomic prin fișier temporar
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(
+        tmp_path,
+        time_series=np.asarray(time_series, dtype=np.float32),
+        feature_vector=np.asarray(feature_vector, dtype=np.float32).ravel(),
+        atlas=ATLAS,
+        kind=KIND,
+    )
+    os.replace(tmp_path, path)
+    scan.features_file.name = name
+
+
+def load_features(scan):
+    """
+    Citește sidecar-ul unei scanări; întoarce None dacă nu există sau e incompatibil.
+    """
+    if not scan.features_file or not default_storage.exists(scan.features_file.name):
+        return None
+    with np.load(default_storage.path(scan.features_file.name)) as data:
+        if str(data['atlas']) != ATLAS or str(data['kind']) != KIND:
+            return None
+        return {
+            'time_series': data['time_series'],
+            'feature_vector': data['feature_vector'],
+        }
+
+
+def load_feature_matrix(scans):
+    """
+    Stivuiește vectorii de trăsături ai scanărilor care au sidecar.
+    Întoarce (matricea N x 741, lista scanărilor corespunzătoare rândurilor).
+    """
+    rows, found = [], []
+    for scan in scans:
+        features = load_features(scan)
+        if features is not None:
+            rows.append(features['feature_vector'])
+            found.append(scan)
+    if not rows:
+        return np.empty((0, 0), dtype=np.float32), found
+    return np.vstack(rows), found
@@ -0,0 +1,149 @@
+import os
+import sys
+import time
+import resource
+import threading
+from contextlib import contextmanager, nullcontext
+
+
+def current_rss_mb():
+    """
+    (RSS, RSS fără paginile mapate din fișiere) din /proc (Linux). Un .nii necomprimat este
+    memory-mapped, deci paginile lui apar în RSS fără să fie memorie alocată de pipeline.
+    În afara Linux: vârful raportat de getrusage, pentru ambele valori.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            fields = f.read().split()
+        page_mb = os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+        return int(fields[1]) * page_mb, (int(fields[1]) - int(fields[2])) * page_mb
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb(), peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux raportează în KB, macOS în octeți
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class PeakRSS:
+    """
+    Vârful de memorie pe durata unui bloc: un fir separat eșantionează RSS-ul procesului.
+    (ru_maxrss dă doar vârful întregului proces, nu al fiecărei etape.)
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self.peak_anon_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _update(self):
+        rss, anon = current_rss_mb()
+        self.peak_mb = max(self.peak_mb, rss)
+        self.peak_anon_mb = max(self.peak_anon_mb, anon)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._update()
+
+    def __enter__(self):
+        self.peak_mb, self.peak_anon_mb = current_rss_mb()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, name='peak-rss', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._update()
+        return False
+
+
+def _children_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class StageRecorder:
+    """
+    Colectează, pentru fiecare etapă a unui job, timpul real, timpul CPU și vârful de memorie.
+    Timpul CPU este al firului curent plus al proceselor copil încheiate în etapă
+    (ex. pool-ul de reeșantionare); memoria este RSS-ul întregului proces, deci la
+    joburi concurente vârful include și memoria celorlalte fire.
+    """
+
+    def __init__(self, source, sample_interval=0.02):
+        self.source = source
+        self.sample_interval = sample_interval
+        self.records = []
+
+    @contextmanager
+    def stage(self, name):
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        children = _children_cpu_seconds()
+        error = None
+        with PeakRSS(self.sample_interval) as rss:
+            try:
+                yield
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                self.records.append({
+                    'source': self.source,
+                    'stage': name,
+                    'wall_seconds': time.perf_counter() - wall,
+                    'cpu_seconds': time.thread_time() - cpu + _children_cpu_seconds() - children,
+                    # Vârful se citește după oprirea eșantionării (mai jos), nu aici
+                    'rss': rss,
+                    'failed': error is not None,
+                })
+
+    def add(self, stage, wall_seconds, cpu_seconds, peak_rss_mb, peak_anon_mb, failed=False):
+        """
+        O etapă măsurată în afara unui bloc `with` (ex. recepția upload-ului, în
+        uploads.HashingUploadHandler), deja în formatul din results().
+        """
+        self.records.append({
+            'source': self.source,
+            'stage': stage,
+            'wall_seconds': wall_seconds,
+            'cpu_seconds': cpu_seconds,
+            'peak_rss_mb': peak_rss_mb,
+            'peak_anon_mb': peak_anon_mb,
+            'failed': failed,
+        })
+
+    def results(self):
+        """
+        Înregistrările finale (dict-uri simple, gata de salvat ca StageMetric).
+        """
+        rows = []
+        for record in self.records:
+            row = {key: value for key, value in record.items() if key != 'rss'}
+            if 'rss' in record:
+                row['peak_rss_mb'] = round(record['rss'].peak_mb, 1)
+                row['peak_anon_mb'] = round(record['rss'].peak_anon_mb, 1)
+            rows.append(row)
+        return rows
+
+
+class NullRecorder:
+    """
+    Același API fără măsurători (scripturile de antrenare, apelurile fără job).
+    """
+    records = ()
+
+    def stage(self, name):
+        return nullcontext()
+
+    def results(self):
+        return []
+
+
+NULL_RECORDER = NullRecorder()
@@ -0,0 +1,377 @@
+import os
+import socket
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cloud_utils import enqueue_scan_sync, wake_outbox_flusher
+from .derivatives import preview_path_for
+from .dicom_convert import convert_dicom_archive, is_dicom_archive
+from .feature_store import load_features, save_features
+from .instrumentation import StageRecorder
+from .ml_logic import extract_features, get_engine, viewer_filename_for
+from .models import PatientScan, StageMetric
+from .preflight import check_header, run_preflight
+from .reports import get_or_render_report
+from .resize_scans import downsample_scan, downsampled_path_for, needs_downsampling
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Pool-ul de worker-i din procesul web. Firele partajează motorul ML deja încălzit.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'ANALYSIS_WORKERS', 2),
+                    thread_name_prefix='analysis'
+                )
+    return _executor
+
+
+def enqueue_analysis(scan):
+    """
+    Programează analiza după commit-ul tranzacției care a creat scanarea.
+    Cu ANALYSIS_DISPATCH = 'worker' jobul rămâne în coadă pentru `manage.py process_scans`.
+    """
+    if getattr(settings, 'ANALYSIS_DISPATCH', 'thread') != 'thread':
+        return
+    scan_id = scan.pk
+    transaction.on_commit(lambda: get_executor().submit(run_analysis_job, scan_id))
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_scan(scan_id):
+    """
+    Trece atomic jobul din 'queued' în 'running'; doar un singur worker câștigă.
+    """
+    now = timezone.now()
+    return PatientScan.objects.filter(pk=scan_id, status=PatientScan.STATUS_QUEUED).update(
+        status=PatientScan.STATUS_RUNNING,
+        started_at=now,
+        claimed_by=worker_id(),
+        heartbeat_at=now,
+    ) == 1
+
+
+def touch_heartbeat(scan_id):
+    """
+    Semn de viață pentru un job în lucru: doar cât timp este încă 'running' în acest worker.
+    """
+    return PatientScan.objects.filter(
+        pk=scan_id, status=PatientScan.STATUS_RUNNING, claimed_by=worker_id()
+    ).update(heartbeat_at=timezone.now()) == 1
+
+
+@contextmanager
+def heartbeat(scan_id, interval=None):
+    """
+    Un fir separat reîmprospătează heartbeat_at la fiecare `interval` secunde cât
+    durează blocul, ca requeue_stale să nu repună în coadă o analiză lungă, dar vie.
+    """
+    interval = interval or getattr(settings, 'ANALYSIS_HEARTBEAT_SECONDS', 30)
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                try:
+                    touch_heartbeat(scan_id)
+                except Exception as e:
+                    # Un heartbeat ratat (ex. baza de date blocată) se reia la următorul interval
+                    print(f"⚠️ Heartbeat eșuat pentru scanarea {scan_id}: {e}")
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'heartbeat-{scan_id}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_analysis_job(scan_id):
+    """
+    Execută analiza ML pentru o scanare din coadă; sincronizarea Cloud trece prin outbox.
+    """
+    try:
+        if not claim_scan(scan_id):
+            return
+        scan = PatientScan.objects.select_related('doctor').get(pk=scan_id)
+        with heartbeat(scan_id):
+            _analyze(scan)
+    except Exception as e:
+        print(f"❌ Eroare job analiză {scan_id}: {e}")
+    finally:
+        # Firele din pool nu trec prin ciclul request/response al Django
+        close_old_connections()
+
+
+def convert_uploaded_dicom(scan):
+    """
+    Încărcările DICOM (.zip) se convertesc o singură dată în NIfTI, lângă arhivă;
+    scanarea indică apoi fișierul NIfTI (refolosit și la deduplicare).
+    """
+    archive_path = scan.scan_file.path
+    nifti_path = f"{os.path.splitext(archive_path)[0]}.nii.gz"
+    if not os.path.exists(nifti_path):
+        convert_dicom_archive(archive_path, nifti_path)
+    scan.scan_file.name = os.path.join(os.path.dirname(scan.scan_file.name), os.path.basename(nifti_path))
+    return nifti_path
+
+
+def prepare_analysis_input(file_path):
+    """
+    Scanările peste ANALYSIS_DOWNSAMPLE_ABOVE_MB se reduc la ANALYSIS_DOWNSAMPLE_VOXEL_MM
+    înainte de mascare (atlasul MSDL are oricum voxeli de 4 mm); derivatul se refolosește.
+    În procesul web (ANALYSIS_DISPATCH = 'thread') reeșantionarea rulează în firul jobului,
+    fără pool de procese; worker-ii `process_scans` folosesc ANALYSIS_DOWNSAMPLE_WORKERS.
+    """
+    if not needs_downsampling(file_path, getattr(settings, 'ANALYSIS_DOWNSAMPLE_ABOVE_MB', None)):
+        return file_path
+    voxel_size = getattr(settings, 'ANALYSIS_DOWNSAMPLE_VOXEL_MM', 4.0)
+    downsampled = downsampled_path_for(file_path, voxel_size)
+    if not os.path.exists(downsampled):
+        if getattr(settings, 'ANALYSIS_DISPATCH', 'thread') == 'thread':
+            workers = 1
+        else:
+            workers = getattr(settings, 'ANALYSIS_DOWNSAMPLE_WORKERS', 2)
+        downsample_scan(
+            file_path, downsampled, voxel_size=voxel_size, workers=workers,
+            memory_budget_mb=getattr(settings, 'ANALYSIS_MEMORY_BUDGET_MB', 512),
+        )
+    return downsampled
+
+
+def extract_prepared_features(file_path):
+    """
+    Trăsăturile extrase din aceeași intrare ca în _analyze (pre-flight din antet, apoi
+    reeșantionarea scanărilor mari). Funcție de modul: rulează și în procese separate (rescore).
+    """
+    check_header(file_path, min_volumes=getattr(settings, 'QC_MIN_VOLUMES', 10))
+    return extract_features(prepare_analysis_input(file_path))
+
+
+def run_qc(file_path, header=None):
+    """
+    Metricile QC într-o trecere pe bucăți; ridică PreflightError dacă scanarea se respinge.
+    """
+    return run_preflight(
+        file_path,
+        header=header,
+        min_volumes=getattr(settings, 'QC_MIN_VOLUMES', 10),
+        memory_budget_mb=getattr(settings, 'ANALYSIS_MEMORY_BUDGET_MB', 512),
+        min_tsnr=getattr(settings, 'QC_MIN_TSNR', 20.0),
+        max_outlier_fraction=getattr(settings, 'QC_MAX_OUTLIER_FRACTION', 0.2),
+        reject_tsnr=getattr(settings, 'QC_REJECT_TSNR', None),
+    )
+
+
+def save_stage_metrics(scan, recorder):
+    """
+    Salvează măsurătorile etapelor (instrumentation.StageRecorder) pentru scanare.
+    """
+    StageMetric.objects.bulk_create([StageMetric(scan=scan, **row) for row in recorder.results()])
+
+
+def _analyze(scan):
+    engine = get_engine()
+    recorder = StageRecorder(StageMetric.SOURCE_ANALYSIS)
+    try:
+        if is_dicom_archive(scan.scan_file.path):
+            with recorder.stage('dicom_convert'):
+                convert_uploaded_dicom(scan)
+        # Pre-flight: fișierele 3D, prea scurte sau trunchiate se resping doar din antet;
+        # antetul se citește o singură dată și ajunge în metricile QC
+        with recorder.stage('header_check'):
+            header = check_header(scan.scan_file.path, min_volumes=getattr(settings, 'QC_MIN_VOLUMES', 10))
+        with recorder.stage('downsample'):
+            file_path = prepare_analysis_input(scan.scan_file.path)
+        if not scan.qc_metrics:
+            with recorder.stage('qc'):
+                scan.qc_metrics = run_qc(file_path, header=header)
+        viewer_path = os.path.join(os.path.dirname(file_path), viewer_filename_for(file_path))
+
+        cached = load_features(scan)
+        if cached is not None:
+            # Trăsăturile acestui conținut există deja: doar predicție, fără recitirea scanării
+            if not (os.path.exists(viewer_path) and os.path.exists(preview_path_for(viewer_path))):
+                with recorder.stage('snapshot'):
+                    engine.save_snapshot(engine.load(file_path), viewer_path)
+            with recorder.stage('prediction'):
+                pred, conf, model_version = engine.classify_versioned(cached['feature_vector'])
+        else:
+            result = engine.analyze(file_path, viewer_path, recorder=recorder)
+            pred, conf, model_version = result['label'], result['confidence'], result['model_version']
+            with recorder.stage('feature_save'):
+                save_features(scan, result['time_series'], result['feature_vector'])
+    except Exception as e:
+        print(f"❌ Eroare ML Logic: {e}")
+        scan.qc_metrics = getattr(e, 'metrics', scan.qc_metrics)
+        scan.prediction = "Analysis Error"
+        scan.confidence = 0.0
+        scan.status = PatientScan.STATUS_FAILED
+        scan.error_message = str(e)
+        scan.finished_at = timezone.now()
+        # Și eșecurile ajung în Cloud, ca orice rezultat (la fel ca sincronizarea inițială)
+        with transaction.atomic():
+            scan.save()
+            enqueue_scan_sync(scan)
+            transaction.on_commit(wake_outbox_flusher)
+        save_stage_metrics(scan, recorder)
+        return
+
+    # Derivatele stau lângă scanare, în același director din MEDIA_ROOT
+    scan_dir = os.path.dirname(scan.scan_file.name)
+    scan.viewer_full.name = os.path.join(scan_dir, os.path.basename(viewer_path))
+    scan.viewer_preview.name = os.path.join(scan_dir, os.path.basename(preview_path_for(viewer_path)))
+
+    scan.prediction = pred
+    scan.confidence = conf
+    # Versiunea din registru care a produs predicția (nu cea activă acum: pointerul se poate muta)
+    scan.model_version = model_version
+    scan.status = PatientScan.STATUS_DONE
+    scan.finished_at = timezone.now()
+
+    # Rezultatul și mesajul pentru Cloud se confirmă împreună (outbox tranzacțional);
+    # trimiterea către Firestore are loc în fundal, în loturi (etapa 'cloud' a metricilor)
+    with recorder.stage('db_save'), transaction.atomic():
+        scan.save()
+        enqueue_scan_sync(scan)
+        transaction.on_commit(wake_outbox_flusher)
+
+    # Etapa finală: raportul PDF este randat o singură dată, înainte de prima descărcare
+    try:
+        with recorder.stage('report'):
+            get_or_render_report(scan)
+    except Exception as e:
+        print(f"⚠️ Raportul PDF pentru scanarea {scan.pk} nu a putut fi randat: {e}")
+    save_stage_metrics(scan, recorder)
+
+
+def find_previous_scan(content_sha256):
+    """
+    Cea mai recentă scanare cu același conținut; preferăm una deja analizată.
+    Cât timp un job pe același conținut este în coadă sau în lucru nu întoarcem nimic:
+    scanarea nouă își păstrează propria copie, ca două joburi să nu scrie aceleași derivate.
+    """
+    if not content_sha256:
+        return None
+    same_content = PatientScan.objects.filter(content_sha256=content_sha256).exclude(scan_file='')
+    if same_content.filter(status__in=[PatientScan.STATUS_QUEUED, PatientScan.STATUS_RUNNING]).exists():
+        return None
+    return (
+        same_content.filter(status=PatientScan.STATUS_DONE).order_by('-created_at').first()
+        or same_content.order_by('-created_at').first()
+    )
+
+
+def reuse_previous_analysis(scan, previous):
+    """
+    Copiază fișierul stocat și, dacă modelul activ este același, și rezultatul analizei.
+    Întoarce True când scanarea nu mai trebuie trimisă în coadă.
+    """
+    # Același conținut => refolosim fișierul (și snapshot-ul _viewer de lângă el)
+    scan.scan_file.name = previous.scan_file.name
+    scan.features_file.name = previous.features_file.name
+    scan.viewer_full.name = previous.viewer_full.name
+    scan.viewer_preview.name = previous.viewer_preview.name
+
+    if previous.status != PatientScan.STATUS_DONE or not previous.model_version:
+        return False
+    # Doar versiunea din registru: cererea de upload nu încarcă atlasul și modelul
+    if previous.model_version != get_engine().active_version():
+        return False
+
+    scan.prediction = previous.prediction
+    scan.confidence = previous.confidence
+    scan.model_version = previous.model_version
+    scan.status = PatientScan.STATUS_DONE
+    scan.started_at = scan.finished_at = timezone.now()
+    return True
+
+
+def render_report_job(scan_id):
+    """
+    Randează raportul PDF în fundal (scanările cu rezultat refolosit nu trec prin _analyze).
+    """
+    try:
+        get_or_render_report(PatientScan.objects.get(pk=scan_id))
+    except Exception as e:
+        print(f"⚠️ Raportul PDF pentru scanarea {scan_id} nu a putut fi randat: {e}")
+    finally:
+        close_old_connections()
+
+
+def save_reused_scan(scan):
+    """
+    Salvează o scanare al cărei rezultat a fost refolosit: rezultatul și mesajul pentru Cloud
+    se confirmă împreună (ca în _analyze), iar raportul PDF se randează după commit, în fundal.
+    """
+    with transaction.atomic():
+        scan.save()
+        enqueue_scan_sync(scan)
+        transaction.on_commit(wake_outbox_flusher)
+        scan_id = scan.pk
+        transaction.on_commit(lambda: get_executor().submit(render_report_job, scan_id))
+
+
+def process_queued(limit=None):
+    """
+    Rulează în procesul curent toate joburile aflate în coadă (cele mai vechi primele).
+    Întoarce numărul de scanări procesate.
+    """
+    queued = PatientScan.objects.filter(status=PatientScan.STATUS_QUEUED).order_by('created_at')
+    ids = list(queued.values_list('pk', flat=True)[:limit])
+    for scan_id in ids:
+        run_analysis_job(scan_id)
+    return len(ids)
+
+
+def requeue_stale(older_than):
+    """
+    Repune în coadă joburile rămase 'running' după oprirea unui worker: cele fără
+    heartbeat de mai mult de `older_than` (joburile vii îl reîmprospătează periodic,
+    oricât ar dura analiza). Rândurile fără heartbeat se judecă după started_at.
+    """
+    cutoff = timezone.now() - older_than
+    silent = Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    return PatientScan.objects.filter(silent, status=PatientScan.STATUS_RUNNING).update(
+        status=PatientScan.STATUS_QUEUED, started_at=None, claimed_by='', heartbeat_at=None,
+    )
+
+
+def resume_pending_jobs():
+    """
+    La pornirea procesului web (ANALYSIS_DISPATCH = 'thread') coada din memorie este goală:
+    joburile 'running' fără heartbeat de ANALYSIS_STALE_AFTER_MINUTES revin în coadă, iar
+    toate cele din 'queued' sunt trimise din nou în pool. Un job trimis de două ori rulează
+    o singură dată (claim_scan). Întoarce numărul de joburi trimise.
+    """
+    try:
+        stale_after = getattr(settings, 'ANALYSIS_STALE_AFTER_MINUTES', 30)
+        if stale_after is not None:
+            requeue_stale(timedelta(minutes=stale_after))
+        queued = PatientScan.objects.filter(status=PatientScan.STATUS_QUEUED).order_by('created_at')
+        ids = list(queued.values_list('pk', flat=True))
+        for scan_id in ids:
+            get_executor().submit(run_analysis_job, scan_id)
+        return len(ids)
+    finally:
+        close_old_connections()
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from diagnosis.export import export_queryset, iter_export_zip
+
+
+class Command(BaseCommand):
+    help = "Writes a ZIP of PDF reports plus a CSV summary for a date range and/or doctor."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Destination .zip file.")
+        parser.add_argument('--from', dest='date_from', help="First day (YYYY-MM-DD), inclusive.")
+        parser.add_argument('--to', dest='date_to', help="Last day (YYYY-MM-DD), inclusive.")
+        parser.add_argument('--doctor', help="Username of the doctor who uploaded the scans.")
+        parser.add_argument('--workers', type=int, default=None, help="Rendering processes (default: CPU count).")
+
+    def handle(self, *args, **options):
+        dates = {}
+        for name in ('date_from', 'date_to'):
+            value = options[name]
+            dates[name] = parse_date(value) if value else None
+            if value and dates[name] is None:
+                raise CommandError(f"Invalid date: {value}")
+
+        scans = export_queryset(dates['date_from'], dates['date_to'], options['doctor'])
+        count = scans.count()
+
+        start = time.perf_counter()
+        size = 0
+        with open(options['output'], 'wb') as f:
+            for chunk in iter_export_zip(scans, workers=options['workers']):
+                f.write(chunk)
+                size += len(chunk)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {count} scan(s) to {options['output']} ({size / 1024 / 1024:.1f} MB) in {elapsed:.1f}s."
+        ))
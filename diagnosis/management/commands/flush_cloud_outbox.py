@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from diagnosis.cloud_utils import FIRESTORE_BATCH_LIMIT, flush_outbox
+
+
+class Command(BaseCommand):
+    help = "Pushes pending Firestore sync messages from the outbox in batched writes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep flushing instead of exiting when the outbox is empty.")
+        parser.add_argument('--interval', type=float, default=30.0, help="Seconds between flushes in --loop mode.")
+        parser.add_argument('--batch-size', type=int, default=FIRESTORE_BATCH_LIMIT,
+                            help=f"Documents per Firestore batch (max {FIRESTORE_BATCH_LIMIT}).")
+
+    def handle(self, *args, **options):
+        while True:
+            sent = flush_outbox(batch_size=options['batch_size'])
+            if sent:
+                self.stdout.write(self.style.SUCCESS(f"Synced {sent} document(s)."))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
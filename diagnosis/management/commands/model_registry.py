@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from diagnosis.model_registry import (
+    REGISTRY_DIR, ModelRegistryError, activate_version, active_version, list_versions, register_file,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Lists the classifier versions in the model registry, activates one (workers hot-reload "
+        "on their next prediction) or imports an existing .pkl as a new version."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--activate', metavar='VERSION', help="Point the registry at this version.")
+        parser.add_argument('--import', dest='import_path', metavar='PKL',
+                            help="Register an existing classifier file (e.g. the legacy pd_classifier.pkl).")
+        parser.add_argument('--no-activate', action='store_true', help="With --import: register only.")
+
+    def handle(self, *args, **options):
+        registry_dir = getattr(settings, 'MODEL_REGISTRY_DIR', REGISTRY_DIR)
+        try:
+            if options['import_path']:
+                version = register_file(options['import_path'], trainer='import', registry_dir=registry_dir,
+                                        activate=not options['no_activate'])
+                self.stdout.write(self.style.SUCCESS(f"Registered {options['import_path']} as {version}."))
+            if options['activate']:
+                activate_version(options['activate'], registry_dir)
+                self.stdout.write(self.style.SUCCESS(f"Active model: {options['activate']}"))
+        except (ModelRegistryError, OSError) as e:
+            raise CommandError(str(e))
+
+        active = active_version(registry_dir)
+        versions = list_versions(registry_dir)
+        if not versions:
+            self.stdout.write(self.style.WARNING("No registered versions (workers use the legacy pd_classifier.pkl)."))
+        for meta in versions:
+            marker = '*' if meta['version'] == active else ' '
+            self.stdout.write(
+                f"{marker} {meta['version']}  {meta['created_at']}  {meta['trainer']:<20} "
+                f"{meta['estimator'].rsplit('.', 1)[-1]:<20} {meta['feature_space']}[{meta['feature_dim']}]"
+            )
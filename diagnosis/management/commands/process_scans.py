@@ -0,0 +1,33 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from diagnosis.jobs import process_queued, requeue_stale
+from diagnosis.ml_logic import get_engine
+
+
+class Command(BaseCommand):
+    help = "Runs queued scan analyses in this process (database-backed job queue, no broker needed)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep polling the queue instead of exiting when empty.")
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds between polls in --loop mode.")
+        parser.add_argument('--requeue-stale', type=int, default=None, metavar='MINUTES',
+                            help="Re-queue 'running' jobs whose worker sent no heartbeat for MINUTES (e.g. after a crash).")
+
+    def handle(self, *args, **options):
+        if options['requeue_stale'] is not None:
+            count = requeue_stale(timedelta(minutes=options['requeue_stale']))
+            self.stdout.write(f"Re-queued {count} stale job(s).")
+
+        get_engine().warmup()
+
+        while True:
+            processed = process_queued()
+            if processed:
+                self.stdout.write(self.style.SUCCESS(f"Processed {processed} scan(s)."))
+            if not options['loop']:
+                break
+            if not processed:
+                time.sleep(options['interval'])
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from diagnosis.stats import refresh_stats
+
+
+class Command(BaseCommand):
+    help = "Fully recomputes the cached dashboard statistics (schedule it, e.g. from cron)."
+
+    def handle(self, *args, **options):
+        stats = refresh_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Dashboard stats refreshed: {stats['total_scans']} scans, "
+            f"{stats['pd_cases']} PD, {stats['healthy_cases']} HC, "
+            f"{len(stats['by_doctor'])} doctor(s)."
+        ))
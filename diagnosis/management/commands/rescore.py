@@ -0,0 +1,130 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from diagnosis.cloud_utils import enqueue_scan_sync, wake_outbox_flusher
+from diagnosis.feature_store import load_features, save_features
+from diagnosis.jobs import extract_prepared_features
+from diagnosis.ml_logic import get_engine
+from diagnosis.models import PatientScan
+from diagnosis.stats import refresh_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-scores every analysed scan with the current classifier. Uses the stored "
+        "feature vectors and only re-extracts (in parallel) scans that have none. Scans whose "
+        "label or model version changed are queued for Cloud sync."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2048,
+                            help="Scans per predict_proba / bulk_update batch.")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Processes used to extract missing features (default: CPU count).")
+        parser.add_argument('--only-stale', action='store_true',
+                            help="Skip scans already scored by the current model version.")
+
+    def handle(self, *args, **options):
+        engine = get_engine().warmup()
+        # The active model is pinned for the whole run, even if the registry pointer moves meanwhile
+        model, version = engine.model, engine.model_version
+        if model is None:
+            self.stderr.write(self.style.ERROR("Model missing: no active version in the model registry"))
+            return
+
+        scans = (
+            PatientScan.objects.filter(status=PatientScan.STATUS_DONE).exclude(scan_file='')
+            .select_related('doctor').order_by('pk')
+        )
+        if options['only_stale']:
+            scans = scans.exclude(model_version=version)
+
+        self.stdout.write(f"Re-scoring with model {version}...")
+        start = time.perf_counter()
+        totals = {'scored': 0, 'extracted': 0, 'failed': 0, 'synced': 0}
+
+        # Pool-ul de extracție pornește doar la prima scanare fără trăsături salvate
+        self.pool = None
+        self.workers = options['workers']
+        try:
+            # Loturile se citesc complet înainte de bulk_update: fără scrieri pe PatientScan
+            # cât timp un cursor pe același tabel este încă deschis (SQLite)
+            pks = list(scans.values_list('pk', flat=True))
+            for offset in range(0, len(pks), options['batch_size']):
+                chunk = pks[offset:offset + options['batch_size']]
+                batch = list(PatientScan.objects.select_related('doctor').filter(pk__in=chunk).order_by('pk'))
+                self._rescore_batch(batch, engine, model, version, totals)
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown()
+
+        # bulk_update nu emite post_save: recalculăm statisticile dashboard-ului
+        refresh_stats()
+
+        elapsed = time.perf_counter() - start
+        rate = totals['scored'] / elapsed if elapsed > 0 else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Re-scored {totals['scored']} scan(s) in {elapsed:.2f}s ({rate:.1f} scans/sec); "
+            f"{totals['extracted']} extracted from NIfTI, {totals['failed']} failed, "
+            f"{totals['synced']} queued for Cloud sync."
+        ))
+
+    def _extraction_pool(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self.pool
+
+    def _rescore_batch(self, batch, engine, model, version, totals):
+        vectors = {}
+        missing = []
+        for scan in batch:
+            features = load_features(scan)
+            if features is None:
+                missing.append(scan)
+            else:
+                vectors[scan.pk] = features['feature_vector']
+
+        # Fallback: extracție paralelă doar pentru scanările fără trăsături salvate,
+        # pe aceeași intrare ca analiza live (pre-flight + reeșantionare)
+        futures = {
+            scan.pk: self._extraction_pool().submit(extract_prepared_features, scan.scan_file.path)
+            for scan in missing
+        }
+        for scan in missing:
+            try:
+                time_series, feature_vector = futures[scan.pk].result()
+            except Exception as e:
+                self.stderr.write(f"  Extraction failed for scan {scan.pk}: {e}")
+                totals['failed'] += 1
+                continue
+            save_features(scan, time_series, feature_vector)
+            vectors[scan.pk] = feature_vector.ravel()
+            totals['extracted'] += 1
+
+        scored = [scan for scan in batch if scan.pk in vectors]
+        if not scored:
+            return
+
+        matrix = np.vstack([vectors[scan.pk] for scan in scored])
+        changed = []
+        for scan, (label, confidence) in zip(scored, engine.predict_batch(matrix, model=model)):
+            if (scan.prediction, scan.model_version) != (label, version):
+                changed.append(scan)
+            scan.prediction = label
+            scan.confidence = confidence
+            scan.model_version = version
+
+        # Rezultatele noi și mesajele pentru Cloud se confirmă împreună (outbox tranzacțional)
+        with transaction.atomic():
+            PatientScan.objects.bulk_update(
+                scored, ['prediction', 'confidence', 'model_version', 'features_file']
+            )
+            for scan in changed:
+                enqueue_scan_sync(scan)
+            transaction.on_commit(wake_outbox_flusher)
+        totals['scored'] += len(scored)
+        totals['synced'] += len(changed)
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from diagnosis.ml_logic import get_engine
+
+
+class Command(BaseCommand):
+    help = "Pre-loads the MSDL atlas, the fitted masker and the classifier (downloads the atlas if needed)."
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        engine = get_engine().warmup()
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(f"Atlas: {engine.atlas.maps}")
+        if engine.model is None:
+            self.stdout.write(self.style.WARNING("Model missing: no active version in the model registry"))
+        else:
+            self.stdout.write(f"Model: {engine.model_version} ({engine.model_meta.get('trainer', '')})")
+        self.stdout.write(self.style.SUCCESS(f"Engine warm in {elapsed:.2f}s"))
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:17
+
+from django.db import migrations, models
+
+
+def mark_existing_scans_finished(apps, schema_editor):
+    # Scans uploaded before the job queue were analysed synchronously
+    PatientScan = apps.get_model("diagnosis", "PatientScan")
+    PatientScan.objects.filter(prediction="Analysis Error").update(status="failed")
+    PatientScan.objects.exclude(prediction="Analysis Error").update(status="done")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diagnosis", "0002_alter_patientscan_options_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="patientscan",
+            name="error_message",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.AddField(
+            model_name="patientscan",
+            name="finished_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="patientscan",
+            name="started_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="patientscan",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("queued", "Queued"),
+                    ("running", "Running"),
+                    ("done", "Done"),
+                    ("failed", "Failed"),
+                ],
+                default="queued",
+                max_length=10,
+            ),
+        ),
+        migrations.RunPython(
+            mark_existing_scans_finished, migrations.RunPython.noop
+        ),
+    ]
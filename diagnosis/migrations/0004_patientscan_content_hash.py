@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diagnosis", "0003_patientscan_job_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="patientscan",
+            name="content_sha256",
+            field=models.CharField(
+                blank=True, db_index=True, default="", max_length=64
+            ),
+        ),
+        migrations.AddField(
+            model_name="patientscan",
+            name="model_version",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diagnosis", "0004_patientscan_content_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="patientscan",
+            name="features_file",
+            field=models.FileField(blank=True, upload_to="features/"),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diagnosis", "0005_patientscan_features_file"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="patientscan",
+            name="viewer_full",
+            field=models.FileField(blank=True, upload_to="scans/"),
+        ),
+        migrations.AddField(
+            model_name="patientscan",
+            name="viewer_preview",
+            field=models.FileField(blank=True, upload_to="scans/"),
+        ),
+    ]
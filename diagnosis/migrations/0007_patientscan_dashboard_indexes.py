@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diagnosis", "0006_patientscan_viewer_derivatives"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="patientscan",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="scan_created_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="patientscan",
+            index=models.Index(fields=["prediction"], name="scan_prediction_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="patientscan",
+            index=models.Index(
+                fields=["doctor", "-created_at"], name="scan_doctor_created_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diagnosis", "0007_patientscan_dashboard_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="patientscan",
+            name="report_file",
+            field=models.FileField(blank=True, upload_to="reports/"),
+        ),
+        migrations.AddField(
+            model_name="patientscan",
+            name="report_key",
+            field=models.CharField(blank=True, default="", max_length=32),
+        ),
+    ]
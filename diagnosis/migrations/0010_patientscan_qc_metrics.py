@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diagnosis", "0009_cloudoutbox"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="patientscan",
+            name="qc_metrics",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
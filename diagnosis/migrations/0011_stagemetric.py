@@ -0,0 +1,63 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diagnosis", "0010_patientscan_qc_metrics"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StageMetric",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[
+                            ("upload", "Upload"),
+                            ("analysis", "Analysis"),
+                            ("cloud", "Cloud sync"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("stage", models.CharField(max_length=40)),
+                ("wall_seconds", models.FloatField()),
+                ("cpu_seconds", models.FloatField()),
+                ("peak_rss_mb", models.FloatField()),
+                ("peak_anon_mb", models.FloatField()),
+                ("failed", models.BooleanField(default=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "scan",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stage_metrics",
+                        to="diagnosis.patientscan",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["scan", "id"],
+                "indexes": [
+                    models.Index(
+                        fields=["source", "stage", "created_at"],
+                        name="stage_metric_window_idx",
+                    )
+                ],
+            },
+        ),
+    ]
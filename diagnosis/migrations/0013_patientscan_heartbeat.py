@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diagnosis", "0012_viewprofile"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="patientscan",
+            name="claimed_by",
+            field=models.CharField(blank=True, default="", max_length=100),
+        ),
+        migrations.AddField(
+            model_name="patientscan",
+            name="heartbeat_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
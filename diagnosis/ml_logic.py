@@ -1,69 +1,345 @@
 import os
+import threading
 import numpy as np
 import joblib
 import nibabel as nib
-from nilearn import datasets, maskers, connectome
+from nilearn import datasets, maskers, connectome, signal
 import warnings
 
+from .derivatives import write_viewer_derivatives
+from .instrumentation import NULL_RECORDER
+from .model_registry import (
+    FEATURE_DIM, REGISTRY_DIR, check_feature_dim, file_sha256, pointer_stamp, resolve_active,
+)
+from .preflight import check_header
+
 warnings.filterwarnings("ignore")
 
-def analyze_fmri(file_path):
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LABELS = {1: "Parkinson's Disease", 0: "Healthy Control"}
+
+
+class InferenceEngine:
     """
-    Extrage un snapshot 3D clar și rulează analiza ML.
+    Motor de inferență rezident în procesul worker-ului.
+    Atlasul MSDL, masker-ul (potrivit pe hărți) și clasificatorul se încarcă
+    o singură dată; fiecare scanare plătește doar extracția și predicția.
+    Clasificatorul este versiunea activă din registru (model_registry); când pointerul
+    activ se schimbă, modelul nou se încarcă la următoarea predicție, fără repornire.
+    `model_path` fixează în schimb un anumit fișier .pkl (benchmark-uri, teste).
     """
-    dir_name = os.path.dirname(file_path)
-    base_name = os.path.basename(file_path)
-    
-    # Nume curat: evităm duplicarea _viewer_viewer
-    clean_name = base_name.replace('.nii.gz', '').replace('.nii', '').replace('_viewer', '')
-    viewer_filename = f"{clean_name}_viewer.nii.gz"
-    viewer_path = os.path.join(dir_name, viewer_filename)
 
-    try:
-        # 1. Încărcare Creier
-        img = nib.load(file_path)
-        data = img.get_fdata()
-        
-        # 2. Generare Snapshot 3D (Volumul de control)
+    def __init__(self, model_path=None, memory_budget_mb=512, streaming='auto',
+                 preview_max_dim=64, viewer_compresslevel=6, registry_dir=REGISTRY_DIR):
+        self.model_path = model_path
+        self.registry_dir = registry_dir
+        self.preview_max_dim = preview_max_dim
+        self.viewer_compresslevel = viewer_compresslevel
+        # 'auto' = streaming doar când seria completă (float64) depășește bugetul de memorie
+        self.memory_budget_mb = memory_budget_mb
+        self.streaming = streaming
+        self.atlas = None
+        self.masker = None
+        self.raw_masker = None
+        # (model, versiune, metadate) se înlocuiesc împreună, ca predicția și versiunea să corespundă
+        self._active = (None, '', {})
+        self._model_stamp = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        return self._active[0]
+
+    @property
+    def model_version(self):
+        return self._active[1]
+
+    @property
+    def model_meta(self):
+        return self._active[2]
+
+    @property
+    def is_warm(self):
+        return self.masker is not None and self.model is not None
+
+    def warmup(self):
+        """
+        Încarcă atlasul, potrivește masker-ul și citește modelul activ de pe disc.
+        Apelurile repetate sunt ieftine: se reîncarcă doar ce lipsește sau modelul schimbat.
+        """
+        with self._lock:
+            if self.masker is None:
+                self.atlas = datasets.fetch_atlas_msdl()
+                # Hărțile sunt ținta de reeșantionare, deci fit() nu are nevoie de scanare
+                self.masker = maskers.NiftiMapsMasker(
+                    maps_img=self.atlas.maps,
+                    standardize='zscore_sample',
+                    detrend=True,
+                    resampling_target='maps'
+                ).fit()
+                # Aceleași hărți, fără curățare: pentru extracția pe bucăți de timp
+                self.raw_masker = maskers.NiftiMapsMasker(
+                    maps_img=self.atlas.maps,
+                    standardize=None,
+                    detrend=False,
+                    resampling_target='maps'
+                ).fit()
+        self.refresh_model()
+        return self
+
+    def active_version(self):
+        """
+        Versiunea modelului activ fără încălzire (ex. din cererea de upload): cea din memorie
+        dacă pointerul nu s-a mișcat, altfel citită din registru, fără a încărca modelul sau atlasul.
+        """
+        if self._model_stamp is not None and self._stamp() == self._model_stamp:
+            return self.model_version
+        resolved = self._resolve()
+        return resolved['version'] if resolved else ''
+
+    def _stamp(self):
+        if self.model_path is not None:
+            try:
+                st = os.stat(self.model_path)
+            except FileNotFoundError:
+                return None
+            return st.st_ino, st.st_size, st.st_mtime_ns
+        return pointer_stamp(self.registry_dir)
+
+    def _resolve(self):
+        if self.model_path is None:
+            return resolve_active(self.registry_dir)
+        if not os.path.exists(self.model_path):
+            return None
+        return {'version': file_sha256(self.model_path)[:12], 'model_path': self.model_path,
+                'meta': {'feature_dim': FEATURE_DIM}}
+
+    def refresh_model(self):
+        """
+        Reîncarcă modelul dacă pointerul activ s-a schimbat de la ultima verificare.
+        În regim stabil costul este un singur os.stat. Întoarce True dacă modelul s-a schimbat.
+        """
+        stamp = self._stamp()
+        if stamp == self._model_stamp:
+            return False
+        with self._lock:
+            if stamp == self._model_stamp:
+                return False
+            self._model_stamp = stamp
+            try:
+                resolved = self._resolve()
+                if resolved is None:
+                    self._active = (None, '', {})
+                elif resolved['version'] != self.model_version:
+                    model = joblib.load(resolved['model_path'])
+                    check_feature_dim(model, resolved['meta'].get('feature_dim', FEATURE_DIM))
+                    self._active = (model, resolved['version'], resolved['meta'])
+                    print(f"🔄 Model activ: {resolved['version']}")
+            except Exception as e:
+                # Un pointer sau artefact invalid nu oprește worker-ul: rămâne modelul anterior
+                print(f"❌ Modelul activ nu a putut fi încărcat ({e}); rămâne {self.model_version or 'niciunul'}.")
+        return True
+
+    # --- Etapele pipeline-ului (expuse separat pentru măsurători) ---
+
+    def load(self, file_path):
+        # Doar header-ul + proxy-ul `dataobj`; .nii necomprimat este memory-mapped,
+        # iar fișierul rămâne deschis ca citirile secvențiale din .nii.gz să nu reia decompresia
+        return nib.load(file_path, keep_file_open=True)
+
+    def save_snapshot(self, img, viewer_path):
+        """
+        Salvează volumul de control 3D folosit de vizualizator, ca derivate cuantizate
+        (previzualizare + rezoluție completă). Întoarce {'full': path, 'preview': path}.
+        """
         if len(img.shape) == 4:
             # Alegem volumul 10 sau mijlocul (primele volume sunt adesea negre)
             idx = min(10, img.shape[3] - 1)
-            snapshot_data = data[..., idx]
-            # Creăm imaginea NIfTI nouă
-            viewer_img = nib.Nifti1Image(snapshot_data, img.affine)
-            nib.save(viewer_img, viewer_path)
+            # Citim prin proxy doar volumul necesar, nu toată seria 4D
+            snapshot_data = np.asarray(img.dataobj[..., idx])
             print(f"✅ Snapshot 3D generat la volumul {idx}")
         else:
-            nib.save(img, viewer_path)
-
-        # 3. Analiză ML
-        atlas = datasets.fetch_atlas_msdl()
-        masker = maskers.NiftiMapsMasker(
-            maps_img=atlas.maps, 
-            standardize='zscore_sample',
-            detrend=True,
-            resampling_target='maps'
+            snapshot_data = np.asarray(img.dataobj)
+        return write_viewer_derivatives(
+            snapshot_data, img.affine, viewer_path,
+            preview_max_dim=self.preview_max_dim,
+            compresslevel=self.viewer_compresslevel,
         )
-        
-        time_series = masker.fit_transform(file_path)
+
+    def volumes_per_chunk(self, img):
+        """
+        Câte volume încap în bugetul de memorie (date brute + copie float + reeșantionare).
+        """
+        voxels = int(np.prod(img.shape[:3]))
+        budget = self.memory_budget_mb * 1024 * 1024
+        return max(1, int(budget // (voxels * 8 * 3)))
+
+    def use_streaming(self, img):
+        if len(img.shape) != 4 or self.streaming == 'never':
+            return False
+        if self.streaming == 'always':
+            return True
+        return img.shape[3] > self.volumes_per_chunk(img)
+
+    def extract_time_series(self, img):
+        if self.use_streaming(img):
+            return self.extract_time_series_streaming(img)
+        # Pe grila atlasului masker-ul copiază imaginea (deepcopy), iar handle-ul ținut deschis
+        # de load() nu se poate copia: îi dăm calea fișierului, nu imaginea încărcată
+        return self.masker.transform(img.get_filename() or img)
+
+    def extract_time_series_streaming(self, img):
+        """
+        Extrage semnalele regiunilor pe bucăți de timp, apoi aplică detrend + z-score
+        pe întreaga serie (39 coloane), exact ca masker-ul complet.
+        Memoria maximă este limitată de `memory_budget_mb`, nu de mărimea fișierului.
+        """
+        step = self.volumes_per_chunk(img)
+        n_volumes = img.shape[3]
+        chunks = []
+        for start in range(0, n_volumes, step):
+            chunk_img = img.slicer[..., start:start + step]
+            chunks.append(self.raw_masker.transform(chunk_img))
+        raw_signals = np.vstack(chunks)
+        return signal.clean(raw_signals, detrend=True, standardize='zscore_sample')
+
+    def compute_features(self, time_series):
         conn = connectome.ConnectivityMeasure(kind='correlation', vectorize=True, discard_diagonal=True)
-        feature_vector = conn.fit_transform([time_series])
+        return conn.fit_transform([time_series])
+
+    def predict(self, feature_vector):
+        return self.predict_batch(feature_vector)[0]
+
+    def predict_batch(self, feature_matrix, model=None):
+        """
+        Predicție vectorizată pentru o matrice N x 741; întoarce o listă de (label, confidence).
+        `model` fixează un model anume (ex. cel de la începutul unui rescore lung).
+        """
+        model = model if model is not None else self.model
+        predictions = model.predict(feature_matrix).astype(int)
+        probs = model.predict_proba(feature_matrix)
+        confidences = probs[np.arange(len(predictions)), predictions]
+        return [
+            (LABELS[int(p)], round(float(c) * 100, 2))
+            for p, c in zip(predictions, confidences)
+        ]
+
+    def classify(self, feature_vector):
+        """
+        Predicție direct din trăsături deja extrase (fără a reciti scanarea).
+        """
+        label, confidence, _ = self.classify_versioned(feature_vector)
+        return label, confidence
 
-        BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        MODEL_PATH = os.path.join(BASE_DIR, 'diagnosis', 'ml_models', 'pd_classifier.pkl')
-        
-        if not os.path.exists(MODEL_PATH):
-            return "Model Missing", 0.0, viewer_filename
+    def classify_versioned(self, feature_vector):
+        """
+        Ca `classify`, plus versiunea modelului care a produs predicția (stampilată pe scanare).
+        """
+        self.warmup()
+        model, version, _ = self._active
+        if model is None:
+            return "Model Missing", 0.0, ''
+        label, confidence = self.predict_batch(np.asarray(feature_vector).reshape(1, -1), model=model)[0]
+        return label, confidence, version
 
-        model = joblib.load(MODEL_PATH)
-        prediction = int(model.predict(feature_vector)[0])
-        probs = model.predict_proba(feature_vector)[0]
+    def analyze(self, file_path, viewer_path, recorder=NULL_RECORDER):
+        """
+        Rulează întreg pipeline-ul pe o scanare.
+        Întoarce un dict cu label, confidence, time_series (T x 39) și feature_vector (1 x 741).
+        `recorder` (instrumentation.StageRecorder) măsoară fiecare etapă separat.
+        Verificarea antetului (preflight.check_header) este responsabilitatea apelantului.
+        """
+        with recorder.stage('warmup'):
+            self.warmup()
+        with recorder.stage('load'):
+            img = self.load(file_path)
+        with recorder.stage('snapshot'):
+            viewer_files = self.save_snapshot(img, viewer_path)
 
-        label = "Parkinson's Disease" if prediction == 1 else "Healthy Control"
-        confidence = round(float(probs[prediction]) * 100, 2)
-        
-        return label, confidence, viewer_filename
+        with recorder.stage('masking'):
+            time_series = self.extract_time_series(img)
+        with recorder.stage('connectivity'):
+            feature_vector = self.compute_features(time_series)
+        with recorder.stage('prediction'):
+            label, confidence, model_version = self.classify_versioned(feature_vector)
+
+        return {
+            'label': label,
+            'confidence': confidence,
+            'model_version': model_version,
+            'time_series': time_series,
+            'feature_vector': feature_vector,
+            'viewer_files': viewer_files,
+        }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """
+    Instanța partajată de toate cererile din procesul curent.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = InferenceEngine(
+                    memory_budget_mb=_setting('ANALYSIS_MEMORY_BUDGET_MB', 512),
+                    streaming=_setting('ANALYSIS_STREAMING', 'auto'),
+                    preview_max_dim=_setting('VIEWER_PREVIEW_MAX_DIM', 64),
+                    viewer_compresslevel=_setting('VIEWER_COMPRESSION_LEVEL', 6),
+                    registry_dir=_setting('MODEL_REGISTRY_DIR', REGISTRY_DIR),
+                )
+    return _engine
+
+
+def _setting(name, default):
+    """
+    Citește o setare Django dacă există (scripturile de antrenare rulează fără Django).
+    """
+    try:
+        from django.conf import settings
+        if settings.configured:
+            return getattr(settings, name, default)
+    except ImportError:
+        pass
+    return default
+
+
+def extract_features(file_path):
+    """
+    Doar extracția (serii temporale + vector de conectivitate), fără snapshot și predicție.
+    Funcție de modul ca să poată rula în procese separate (ProcessPoolExecutor).
+    """
+    engine = get_engine().warmup()
+    time_series = engine.extract_time_series(engine.load(file_path))
+    return time_series, engine.compute_features(time_series)
+
+
+def viewer_filename_for(file_path):
+    base_name = os.path.basename(file_path)
+    # Nume curat: evităm duplicarea _viewer_viewer
+    clean_name = base_name.replace('.nii.gz', '').replace('.nii', '').replace('_viewer', '')
+    return f"{clean_name}_viewer.nii.gz"
+
+
+def analyze_fmri(file_path, recorder=NULL_RECORDER):
+    """
+    Extrage un snapshot 3D clar și rulează analiza ML.
+    """
+    viewer_filename = viewer_filename_for(file_path)
+    viewer_path = os.path.join(os.path.dirname(file_path), viewer_filename)
+
+    try:
+        # Fișierele 3D, prea scurte sau trunchiate se resping din antet, înainte de citire
+        with recorder.stage('preflight'):
+            check_header(file_path, min_volumes=_setting('QC_MIN_VOLUMES', 10))
+        result = get_engine().analyze(file_path, viewer_path, recorder=recorder)
+        return result['label'], result['confidence'], viewer_filename
 
     except Exception as e:
         print(f"❌ Eroare ML Logic: {e}")
-        return "Analysis Error", 0.0, None
\ No newline at end of file
+        return "Analysis Error", 0.0, None
@@ -0,0 +1,230 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+from datetime import datetime, timezone
+
+import joblib
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REGISTRY_DIR = os.path.join(BASE_DIR, 'diagnosis', 'ml_models')
+# Modelul dinaintea registrului; se folosește doar cât timp nu există niciun pointer activ
+LEGACY_MODEL_NAME = 'pd_classifier.pkl'
+POINTER_NAME = 'registry.json'
+VERSIONS_DIR = 'versions'
+
+# Vectorul de conectivitate MSDL: triunghiul superior al matricei 39 x 39, fără diagonală
+FEATURE_SPACE = 'msdl_correlation'
+FEATURE_DIM = 39 * 38 // 2
+
+
+class ModelRegistryError(Exception):
+    pass
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """
+    Amprenta SHA-256 a unui fișier, citit în bucăți (nu încarcă tot fișierul în memorie).
+    """
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='microseconds')
+
+
+def version_dir(version, registry_dir=REGISTRY_DIR):
+    return os.path.join(registry_dir, VERSIONS_DIR, version)
+
+
+def model_feature_dim(model):
+    """
+    Dimensiunea intrării așteptată de estimator (scikit-learn >= 1.0), sau None.
+    """
+    n_features = getattr(model, 'n_features_in_', None)
+    return int(n_features) if n_features is not None else None
+
+
+def check_feature_dim(model, feature_dim=FEATURE_DIM):
+    n_features = model_feature_dim(model)
+    if n_features is not None and n_features != feature_dim:
+        raise ModelRegistryError(
+            f"Modelul așteaptă {n_features} trăsături, dar pipeline-ul produce {feature_dim} ({FEATURE_SPACE})."
+        )
+
+
+def register_model(model, trainer, feature_dim=FEATURE_DIM, metadata=None, activate=True,
+                   registry_dir=REGISTRY_DIR):
+    """
+    Salvează modelul ca versiune imutabilă `versions/<sha256[:12]>/` (model.pkl + meta.json)
+    și, implicit, o face activă. Același artefact înregistrat de două ori are aceeași versiune.
+    Întoarce versiunea.
+    """
+    check_feature_dim(model, feature_dim)
+    versions_root = os.path.join(registry_dir, VERSIONS_DIR)
+    os.makedirs(versions_root, exist_ok=True)
+
+    tmp_path = os.path.join(versions_root, f".{uuid.uuid4().hex}.pkl.tmp")
+    joblib.dump(model, tmp_path)
+    try:
+        version = _store_artifact(tmp_path, model, trainer, feature_dim, metadata, registry_dir)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    if activate:
+        activate_version(version, registry_dir)
+    return version
+
+
+def register_file(path, trainer, feature_dim=FEATURE_DIM, metadata=None, activate=True,
+                  registry_dir=REGISTRY_DIR):
+    """
+    Înregistrează un .pkl existent (ex. vechiul pd_classifier.pkl); fișierul sursă rămâne neatins.
+    """
+    model = joblib.load(path)
+    check_feature_dim(model, feature_dim)
+    os.makedirs(os.path.join(registry_dir, VERSIONS_DIR), exist_ok=True)
+    tmp_path = os.path.join(registry_dir, VERSIONS_DIR, f".{uuid.uuid4().hex}.pkl.tmp")
+    shutil.copyfile(path, tmp_path)
+    try:
+        version = _store_artifact(tmp_path, model, trainer, feature_dim,
+                                  {'source': os.path.abspath(path), **(metadata or {})}, registry_dir)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    if activate:
+        activate_version(version, registry_dir)
+    return version
+
+
+def _store_artifact(tmp_path, model, trainer, feature_dim, metadata, registry_dir):
+    import sklearn
+
+    sha256 = file_sha256(tmp_path)
+    version = sha256[:12]
+    target_dir = version_dir(version, registry_dir)
+    if os.path.exists(os.path.join(target_dir, 'meta.json')):
+        # Versiunile sunt imutabile: artefactul identic există deja
+        return version
+
+    staging_dir = f"{target_dir}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(staging_dir)
+    os.replace(tmp_path, os.path.join(staging_dir, 'model.pkl'))
+    classes = getattr(model, 'classes_', None)
+    _write_json(os.path.join(staging_dir, 'meta.json'), {
+        'version': version,
+        'sha256': sha256,
+        'created_at': _now(),
+        'trainer': trainer,
+        'feature_space': FEATURE_SPACE,
+        'feature_dim': feature_dim,
+        'estimator': f"{type(model).__module__}.{type(model).__name__}",
+        'classes': [int(c) for c in classes] if classes is not None else None,
+        'sklearn_version': sklearn.__version__,
+        'metadata': metadata or {},
+    })
+    try:
+        os.rename(staging_dir, target_dir)
+    except OSError:
+        # Alt proces a înregistrat același artefact între timp
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    return version
+
+
+def read_pointer(registry_dir=REGISTRY_DIR):
+    path = os.path.join(registry_dir, POINTER_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def active_version(registry_dir=REGISTRY_DIR):
+    return read_pointer(registry_dir).get('active')
+
+
+def activate_version(version, registry_dir=REGISTRY_DIR):
+    """
+    Mută pointerul `registry.json` pe `version` (scriere atomică). Worker-ii observă
+    schimbarea la următoarea predicție (vezi InferenceEngine.refresh_model).
+    """
+    if not os.path.exists(os.path.join(version_dir(version, registry_dir), 'model.pkl')):
+        raise ModelRegistryError(f"Versiunea {version} nu există în {registry_dir}")
+    pointer = read_pointer(registry_dir)
+    history = pointer.get('history', [])
+    history.append({'version': version, 'activated_at': _now()})
+    _write_json(os.path.join(registry_dir, POINTER_NAME), {
+        'active': version,
+        'previous': pointer.get('active'),
+        'history': history,
+    })
+    return version
+
+
+def read_meta(version, registry_dir=REGISTRY_DIR):
+    with open(os.path.join(version_dir(version, registry_dir), 'meta.json')) as f:
+        return json.load(f)
+
+
+def list_versions(registry_dir=REGISTRY_DIR):
+    """
+    Metadatele tuturor versiunilor, cele mai vechi primele.
+    """
+    root = os.path.join(registry_dir, VERSIONS_DIR)
+    if not os.path.isdir(root):
+        return []
+    versions = [
+        read_meta(name, registry_dir) for name in os.listdir(root)
+        if os.path.exists(os.path.join(root, name, 'meta.json'))
+    ]
+    return sorted(versions, key=lambda meta: meta['created_at'])
+
+
+def resolve_active(registry_dir=REGISTRY_DIR):
+    """
+    {'version', 'model_path', 'meta'} pentru modelul activ. Fără pointer se folosește
+    vechiul pd_classifier.pkl (versiunea = amprenta lui, ca înainte de registru); None dacă lipsesc ambele.
+    """
+    version = active_version(registry_dir)
+    if version:
+        return {
+            'version': version,
+            'model_path': os.path.join(version_dir(version, registry_dir), 'model.pkl'),
+            'meta': read_meta(version, registry_dir),
+        }
+    legacy_path = os.path.join(registry_dir, LEGACY_MODEL_NAME)
+    if os.path.exists(legacy_path):
+        return {
+            'version': file_sha256(legacy_path)[:12],
+            'model_path': legacy_path,
+            'meta': {'feature_dim': FEATURE_DIM, 'trainer': 'legacy'},
+        }
+    return None
+
+
+def pointer_stamp(registry_dir=REGISTRY_DIR):
+    """
+    Semnătura ieftină (un stat) a pointerului activ: se schimbă la fiecare activare.
+    Fără pointer, semnătura fișierului vechi pd_classifier.pkl.
+    """
+    for name in (POINTER_NAME, LEGACY_MODEL_NAME):
+        try:
+            st = os.stat(os.path.join(registry_dir, name))
+        except FileNotFoundError:
+            continue
+        return name, st.st_ino, st.st_size, st.st_mtime_ns
+    return None
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 class PatientScan(models.Model):
@@ -14,6 +15,18 @@ class PatientScan(models.Model):
 
 
 class PatientScan(models.Model):
+    # Starea jobului de analiză din fundal
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
     # Legăm scanarea de medicul care a urcat-o
     doctor = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     
@@ -31,8 +44,160 @@ class PatientScan(models.Model):
     # Data la care a fost efectuată analiza
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Amprenta conținutului fișierului și versiunea modelului care l-a analizat
+    content_sha256 = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    model_version = models.CharField(max_length=64, blank=True, default='')
+
+    # Derivatele pentru vizualizator (generate o singură dată, cuantizate)
+    viewer_full = models.FileField(upload_to='scans/', blank=True)
+    viewer_preview = models.FileField(upload_to='scans/', blank=True)
+
+    # Seriile temporale ROI și vectorul de conectivitate (sidecar .npz în media/features/)
+    features_file = models.FileField(upload_to='features/', blank=True)
+
+    # Raportul PDF pre-randat și cheia versiunii sale (vezi reports.report_key)
+    report_file = models.FileField(upload_to='reports/', blank=True)
+    report_key = models.CharField(max_length=32, blank=True, default='')
+
+    # Metrici QC din pre-flight (tSNR, semnal global, DVARS) și avertismentele lor (vezi preflight.py)
+    qc_metrics = models.JSONField(null=True, blank=True)
+
+    # Ciclul de viață al jobului de analiză
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    error_message = models.TextField(blank=True, default='')
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Worker-ul care rulează jobul (host:pid) și ultimul său semn de viață (vezi jobs.requeue_stale)
+    claimed_by = models.CharField(max_length=100, blank=True, default='')
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
     def __str__(self):
         return f"Scan {self.patient_id} - {self.prediction}"
 
+    @property
+    def qc_flags(self):
+        return (self.qc_metrics or {}).get('flags', [])
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+    @property
+    def viewer_url(self):
+        """
+        URL-ul snapshot-ului 3D la rezoluție completă (evită dublarea '_viewer_viewer').
+        """
+        if self.viewer_full:
+            return self.viewer_full.url
+        # Scanări mai vechi: snapshot-ul nu este înregistrat, dar stă lângă fișier
+        base_url = self.scan_file.url
+        if base_url.endswith('.nii.gz'):
+            # Strip extension and potential existing suffix
+            clean_url = base_url[:-7]
+            if clean_url.endswith('_viewer'):
+                clean_url = clean_url[:-7]
+            return f"{clean_url}_viewer.nii.gz"
+        # Fallback for non-compressed .nii
+        return base_url.replace('.nii', '_viewer.nii')
+
+    @property
+    def viewer_preview_url(self):
+        """
+        Previzualizarea la rezoluție redusă; pentru scanările vechi, volumul complet.
+        """
+        if self.viewer_preview:
+            return self.viewer_preview.url
+        return self.viewer_url
+
+    class Meta:
+        ordering = ['-created_at'] # Cele mai noi analize apar primele
+        indexes = [
+            # Paginarea keyset din dashboard: ORDER BY created_at DESC, id DESC
+            models.Index(fields=['-created_at', '-id'], name='scan_created_id_idx'),
+            models.Index(fields=['prediction'], name='scan_prediction_idx'),
+            models.Index(fields=['doctor', '-created_at'], name='scan_doctor_created_idx'),
+        ]
+
+
+class CloudOutbox(models.Model):
+    """
+    Mesaj de sincronizare Firestore, scris în aceeași tranzacție cu rezultatul scanării
+    și trimis ulterior, în loturi, de flusher-ul din fundal (cloud_utils.flush_outbox).
+    """
+    scan = models.ForeignKey(PatientScan, on_delete=models.SET_NULL, null=True, blank=True)
+    user_id = models.CharField(max_length=50, blank=True, default='')
+    # ID-ul documentului este fixat la creare: reîncercările suprascriu același document
+    doc_id = models.CharField(max_length=36, unique=True)
+    payload = models.JSONField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+
     class Meta:
-        ordering = ['-created_at'] # Cele mai noi analize apar primele
\ No newline at end of file
+        indexes = [
+            models.Index(fields=['sent_at', 'next_attempt_at'], name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"Outbox {self.doc_id} - {'sent' if self.sent_at else 'pending'}"
+
+
+class StageMetric(models.Model):
+    """
+    Durata, timpul CPU și vârful de memorie ale unei etape din încărcarea sau analiza
+    unei scanări (vezi instrumentation.StageRecorder).
+    """
+    SOURCE_UPLOAD = 'upload'
+    SOURCE_ANALYSIS = 'analysis'
+    SOURCE_CLOUD = 'cloud'
+    SOURCE_CHOICES = [
+        (SOURCE_UPLOAD, 'Upload'),
+        (SOURCE_ANALYSIS, 'Analysis'),
+        (SOURCE_CLOUD, 'Cloud sync'),
+    ]
+
+    scan = models.ForeignKey(PatientScan, on_delete=models.CASCADE, related_name='stage_metrics')
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES)
+    stage = models.CharField(max_length=40)
+    wall_seconds = models.FloatField()
+    cpu_seconds = models.FloatField()
+    # RSS-ul procesului; `peak_anon_mb` exclude paginile mapate din fișiere (.nii memory-mapped)
+    peak_rss_mb = models.FloatField()
+    peak_anon_mb = models.FloatField()
+    failed = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['scan', 'id']
+        indexes = [
+            # Percentilele per etapă pe o fereastră de timp
+            models.Index(fields=['source', 'stage', 'created_at'], name='stage_metric_window_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.source}.{self.stage} {self.wall_seconds:.3f}s"
+
+
+class ViewProfile(models.Model):
+    """
+    Profil cProfile al unui apel de view, capturat la cerere (vezi profiling.profile_view).
+    """
+    view_name = models.CharField(max_length=50)
+    path = models.CharField(max_length=255)
+    method = models.CharField(max_length=10)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    # Statisticile brute (format pstats) și rezumatul după timpul cumulat
+    profile_file = models.FileField(upload_to='profiles/')
+    summary = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.view_name} {self.duration_ms:.0f} ms ({self.created_at:%Y-%m-%d %H:%M})"
@@ -0,0 +1,195 @@
+import os
+import gzip
+import zlib
+import struct
+
+import nibabel as nib
+import numpy as np
+
+MIN_VOLUMES = 10
+
+
+class PreflightError(ValueError):
+    """
+    Scanarea nu poate fi analizată; mesajul este afișat medicului.
+    """
+
+
+def _gzip_isize(path):
+    """
+    Dimensiunea necomprimată din trailer-ul gzip (ultimii 4 octeți, modulo 2**32).
+    """
+    with open(path, 'rb') as f:
+        f.seek(-4, os.SEEK_END)
+        return struct.unpack('<I', f.read(4))[0]
+
+
+def _gzip_data_size(path, chunk_size=1024 * 1024):
+    """
+    Dimensiunea necomprimată reală, prin decomprimarea întregului flux (toți membrii gzip,
+    fără padding-ul de zerouri de la final); None dacă fluxul este trunchiat sau corupt.
+    """
+    size = 0
+    try:
+        with gzip.open(path, 'rb') as f:
+            while chunk := f.read(chunk_size):
+                size += len(chunk)
+    except (EOFError, OSError, zlib.error):
+        return None
+    return size
+
+
+def check_header(file_path, min_volumes=MIN_VOLUMES):
+    """
+    Validare doar din antetul NIfTI (milisecunde, fără citirea datelor):
+    4D, suficiente volume, geometrie validă și fișier complet (netrunchiat).
+    Întoarce un rezumat al antetului sau ridică PreflightError.
+    """
+    try:
+        img = nib.load(file_path)
+    except Exception as e:
+        raise PreflightError(f"Fișierul nu este un NIfTI valid: {e}")
+
+    header = img.header
+    shape = img.shape
+    if len(shape) != 4:
+        raise PreflightError(f"Scanarea are forma {shape}; analiza necesită o serie fMRI 4D.")
+    if min(shape) < 1:
+        raise PreflightError(f"Dimensiuni invalide în antet: {shape}.")
+    if shape[3] < min_volumes:
+        raise PreflightError(f"Seria are {shape[3]} volume; sunt necesare minim {min_volumes}.")
+
+    zooms = header.get_zooms()[:3]
+    if not np.all(np.isfinite(img.affine)) or min(zooms) <= 0:
+        raise PreflightError(f"Geometrie invalidă în antet (voxeli {tuple(float(z) for z in zooms)}).")
+
+    # Fișier trunchiat (upload întrerupt): mărimea datelor nu corespunde antetului
+    expected = int(img.dataobj.offset) + int(np.prod(shape)) * header.get_data_dtype().itemsize
+    if file_path.endswith('.gz'):
+        # ISIZE (ultimul membru gzip) corect => fișier complet, fără citirea datelor. Altfel
+        # poate fi gzip multi-membru (bgzip, pigz) sau cu padding: se verifică fluxul întreg
+        truncated = _gzip_isize(file_path) != expected % 2 ** 32 and (
+            (_gzip_data_size(file_path) or 0) < expected
+        )
+    else:
+        truncated = os.path.getsize(file_path) < expected
+    if truncated:
+        raise PreflightError("Fișierul este trunchiat sau corupt (datele nu corespund antetului).")
+
+    return {
+        'shape': [int(n) for n in shape],
+        'voxel_mm': [round(float(z), 3) for z in zooms],
+        'tr': round(float(header.get_zooms()[3]), 3),
+        'dtype': str(header.get_data_dtype()),
+    }
+
+
+def volumes_per_chunk(shape, memory_budget_mb):
+    # Bucata float64 + diferența față de volumul anterior + acumulatorii
+    voxels = int(np.prod(shape[:3]))
+    return max(1, int(memory_budget_mb * 1024 * 1024) // (voxels * 8 * 3))
+
+
+def compute_qc(file_path, memory_budget_mb=512):
+    """
+    Metrici QC într-o singură trecere pe bucăți de volume (memorie limitată de buget):
+      - tSNR (media / deviația standard temporală per voxel, mediana în creier)
+      - semnalul global per volum
+      - DVARS: schimbarea de intensitate între volume consecutive (% din media globală)
+    Masca creierului: voxelii din primul volum peste media acestuia.
+    """
+    img = nib.load(file_path, keep_file_open=True)
+    n_volumes = img.shape[3]
+    step = volumes_per_chunk(img.shape, memory_budget_mb)
+
+    mask = None
+    total = total_sq = previous = None
+    global_signal, dvars = [], []
+    for start in range(0, n_volumes, step):
+        chunk = np.asarray(img.dataobj[..., start:start + step], dtype=np.float64)
+        chunk = np.nan_to_num(chunk)
+        if mask is None:
+            first = chunk[..., 0]
+            mask = first > first.mean()
+            if not mask.any():
+                raise PreflightError("Primul volum este gol (nicio intensitate peste fundal).")
+            total = np.zeros(int(mask.sum()))
+            total_sq = np.zeros_like(total)
+
+        voxels = chunk[mask]  # (voxeli în mască, volume)
+        total += voxels.sum(axis=1)
+        total_sq += np.square(voxels).sum(axis=1)
+        global_signal.extend(voxels.mean(axis=0).tolist())
+
+        # Diferențele includ trecerea de la bucata anterioară
+        series = voxels if previous is None else np.column_stack([previous, voxels])
+        diffs = np.diff(series, axis=1)
+        dvars.extend(np.sqrt(np.mean(np.square(diffs), axis=0)).tolist())
+        previous = voxels[:, -1]
+
+    mean = total / n_volumes
+    std = np.sqrt(np.maximum(total_sq / n_volumes - np.square(mean), 0.0))
+    varying = std > 1e-6 * np.maximum(np.abs(mean), 1.0)
+    tsnr = mean[varying] / std[varying]
+
+    mean_global = float(np.mean(global_signal))
+    dvars_pct = np.asarray(dvars) * 100.0 / mean_global if mean_global else np.asarray(dvars)
+    # Cadre aberante: DVARS peste mediană + 3 deviații robuste (MAD)
+    if len(dvars_pct):
+        median = np.median(dvars_pct)
+        mad = 1.4826 * np.median(np.abs(dvars_pct - median))
+        outliers = int(np.sum(dvars_pct > median + 3 * mad)) if mad > 0 else 0
+    else:
+        outliers = 0
+
+    return {
+        'n_volumes': int(n_volumes),
+        'mask_voxels': int(mask.sum()),
+        'varying_fraction': round(float(varying.mean()), 4),
+        'tsnr_median': round(float(np.median(tsnr)), 2) if tsnr.size else 0.0,
+        'global_signal_mean': round(mean_global, 3),
+        'global_signal_cv': round(float(np.std(global_signal) / mean_global), 5) if mean_global else 0.0,
+        'global_signal': [round(v, 3) for v in global_signal],
+        'dvars_pct': [round(float(v), 4) for v in dvars_pct],
+        'dvars_pct_mean': round(float(dvars_pct.mean()), 4) if len(dvars_pct) else 0.0,
+        'dvars_pct_max': round(float(dvars_pct.max()), 4) if len(dvars_pct) else 0.0,
+        'outlier_frames': outliers,
+        'outlier_fraction': round(outliers / max(1, len(dvars_pct)), 4),
+    }
+
+
+def assess_qc(metrics, min_tsnr=20.0, max_outlier_fraction=0.2, reject_tsnr=None):
+    """
+    Întoarce (flags, motiv de respingere sau None). Semnalul constant se respinge mereu;
+    tSNR-ul mic și cadrele aberante doar se semnalează, dacă `reject_tsnr` nu cere altfel.
+    """
+    flags = []
+    if metrics['varying_fraction'] == 0:
+        return ['no_temporal_variance'], "Semnalul este constant în timp (nicio variație între volume)."
+    if metrics['tsnr_median'] < min_tsnr:
+        flags.append('low_tsnr')
+    if metrics['outlier_fraction'] > max_outlier_fraction:
+        flags.append('motion_outliers')
+    if reject_tsnr is not None and metrics['tsnr_median'] < reject_tsnr:
+        return flags, f"tSNR median {metrics['tsnr_median']} sub pragul minim {reject_tsnr}."
+    return flags, None
+
+
+def run_preflight(file_path, min_volumes=MIN_VOLUMES, memory_budget_mb=512, min_tsnr=20.0,
+                  max_outlier_fraction=0.2, reject_tsnr=None, header=None):
+    """
+    Antet + QC. Întoarce dict-ul de metrici (cu 'header' și 'flags'); ridică
+    PreflightError dacă scanarea trebuie respinsă înainte de analiză.
+    `header` este rezultatul unui check_header deja rulat de apelant (antetul nu se recitește).
+    """
+    if header is None:
+        header = check_header(file_path, min_volumes=min_volumes)
+    metrics = compute_qc(file_path, memory_budget_mb=memory_budget_mb)
+    flags, reject = assess_qc(metrics, min_tsnr, max_outlier_fraction, reject_tsnr)
+    metrics['header'] = header
+    metrics['flags'] = flags
+    if reject:
+        error = PreflightError(reject)
+        error.metrics = metrics
+        raise error
+    return metrics
@@ -0,0 +1,94 @@
+import io
+import time
+import pstats
+import cProfile
+import marshal
+import functools
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+# cProfile nu suportă doi profileri activi în același proces: cererile concurente rulează neprofilate
+_profile_lock = threading.Lock()
+
+
+def profiling_requested(request):
+    """
+    VIEW_PROFILING = True: doar la cererea unui membru staff (?profile=1 sau antetul X-Profile: 1);
+    'always': fiecare apel. Orice altă valoare falsă oprește complet profilarea.
+    """
+    mode = getattr(settings, 'VIEW_PROFILING', False)
+    if mode == 'always':
+        return True
+    if not mode or not request.user.is_staff:
+        return False
+    return request.GET.get('profile') == '1' or request.headers.get('X-Profile') == '1'
+
+
+def profile_view(view):
+    """
+    Rulează view-ul sub cProfile când profilarea este cerută și salvează rezultatul ca
+    ViewProfile (descărcabil din admin). Dezactivat, costul este o singură citire de setare.
+    Profilul acoperă doar view-ul: la upload, corpul multipart este deja citit și salvat
+    de CsrfViewMiddleware, deci recepția lipsește din profil (timpul ei este etapa
+    'receive' din StageMetric, măsurată de uploads.HashingUploadHandler).
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not getattr(settings, 'VIEW_PROFILING', False) or not profiling_requested(request):
+            return view(request, *args, **kwargs)
+        if not _profile_lock.acquire(blocking=False):
+            return view(request, *args, **kwargs)
+
+        profiler = cProfile.Profile()
+        try:
+            start = time.perf_counter()
+            response = profiler.runcall(view, request, *args, **kwargs)
+            duration_ms = (time.perf_counter() - start) * 1000
+        finally:
+            _profile_lock.release()
+
+        try:
+            record = save_profile(view.__name__, request, response, profiler, duration_ms)
+            response['X-Profile-Id'] = str(record.pk)
+        except Exception as e:
+            # Profilul este opțional: răspunsul ajunge la utilizator oricum
+            print(f"⚠️ Profilul pentru {view.__name__} nu a putut fi salvat: {e}")
+        return response
+
+    return wrapper
+
+
+def profile_summary(stats, top=None):
+    """
+    Primele `top` funcții după timpul cumulat, ca text (formatul pstats).
+    """
+    stream = io.StringIO()
+    stats.stream = stream
+    stats.sort_stats('cumulative').print_stats(top or getattr(settings, 'VIEW_PROFILE_TOP', 40))
+    return stream.getvalue()
+
+
+def save_profile(view_name, request, response, profiler, duration_ms):
+    """
+    Salvează profilul brut (.prof, deschis cu `python -m pstats` sau snakeviz) și rezumatul text.
+    """
+    from .models import ViewProfile
+
+    # pstats.Stats preia statisticile profiler-ului (profiler.stats rămâne gol)
+    stats = pstats.Stats(profiler)
+    record = ViewProfile(
+        view_name=view_name,
+        path=request.get_full_path()[:255],
+        method=request.method,
+        user=request.user if request.user.is_authenticated else None,
+        status_code=response.status_code,
+        duration_ms=round(duration_ms, 2),
+    )
+    # Același format ca cProfile.Profile.dump_stats
+    raw = marshal.dumps(stats.stats)
+    record.summary = profile_summary(stats)
+    record.profile_file.save(f"{view_name}.prof", ContentFile(raw), save=False)
+    record.save()
+    return record
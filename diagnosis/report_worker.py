@@ -0,0 +1,17 @@
+import django
+from django.apps import apps
+
+
+def init_worker():
+    """
+    Procesele pornite cu spawn/forkserver trebuie să inițializeze Django. Modulul nu
+    importă modele la nivel de modul: se încarcă în proces înainte de django.setup().
+    """
+    if not apps.ready:
+        django.setup()
+
+
+def render(snapshot):
+    from .reports import render_report
+
+    return render_report(snapshot)
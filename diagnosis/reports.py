@@ -0,0 +1,117 @@
+import hashlib
+import os
+from io import BytesIO
+from types import SimpleNamespace
+
+from django.core.files.storage import default_storage
+from django.template.loader import get_template
+from xhtml2pdf import pisa
+
+from .models import PatientScan
+
+TEMPLATE_PATH = 'diagnosis/pdf_layout.html'
+REPORTS_DIR = 'reports'
+
+_template_hash = {'mtime': None, 'digest': None}
+
+
+def template_hash():
+    """
+    Amprenta șablonului PDF; recalculată doar când fișierul se modifică.
+    """
+    path = get_template(TEMPLATE_PATH).origin.name
+    mtime = os.path.getmtime(path)
+    if _template_hash['mtime'] != mtime:
+        with open(path, 'rb') as f:
+            _template_hash['digest'] = hashlib.sha256(f.read()).hexdigest()
+        _template_hash['mtime'] = mtime
+    return _template_hash['digest']
+
+
+def report_key(scan):
+    """
+    Versiunea raportului: id-ul scanării, versiunea modelului, hash-ul șablonului și
+    câmpurile afișate în PDF. Orice schimbare a unei intrări produce o cheie nouă.
+    """
+    parts = [
+        scan.id, scan.model_version, template_hash(),
+        scan.patient_id, scan.age, scan.prediction, scan.confidence,
+        scan.scan_file.name, scan.created_at.isoformat() if scan.created_at else '',
+    ]
+    return hashlib.sha256('|'.join(str(p) for p in parts).encode()).hexdigest()[:32]
+
+
+def render_report(scan):
+    """
+    Randează PDF-ul clinic în memorie; întoarce octeții sau None dacă xhtml2pdf eșuează.
+    """
+    html = get_template(TEMPLATE_PATH).render({'scan': scan})
+    buffer = BytesIO()
+    pisa_status = pisa.CreatePDF(html, dest=buffer)
+    if pisa_status.err:
+        return None
+    return buffer.getvalue()
+
+
+def report_snapshot(scan):
+    """
+    Copie simplă (picklable) a câmpurilor folosite de șablon, pentru randarea în alt proces.
+    """
+    return SimpleNamespace(
+        id=scan.id,
+        patient_id=scan.patient_id,
+        age=scan.age,
+        prediction=scan.prediction,
+        confidence=scan.confidence,
+        created_at=scan.created_at,
+        scan_file=SimpleNamespace(name=scan.scan_file.name),
+    )
+
+
+def cached_report_path(scan, key=None):
+    """
+    Calea PDF-ului stocat dacă este la zi cu cheia curentă, altfel None.
+    """
+    key = key or report_key(scan)
+    if scan.report_key == key and scan.report_file and default_storage.exists(scan.report_file.name):
+        return default_storage.path(scan.report_file.name)
+    return None
+
+
+def store_report(scan, pdf, key):
+    """
+    Salvează PDF-ul randat sub cheia lui și înlocuiește versiunea veche a scanării.
+    """
+    name = f"{REPORTS_DIR}/{scan.id}_{key}.pdf"
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(pdf)
+    os.replace(tmp_path, path)
+
+    old_name = scan.report_file.name
+    scan.report_file.name = name
+    scan.report_key = key
+    # update() direct: nu modificăm alte câmpuri și nu declanșăm semnalele de statistici
+    PatientScan.objects.filter(pk=scan.pk).update(report_file=name, report_key=key)
+
+    if old_name and old_name != name and default_storage.exists(old_name):
+        default_storage.delete(old_name)
+    return path
+
+
+def get_or_render_report(scan):
+    """
+    Calea PDF-ului stocat pentru versiunea curentă a scanării; îl (re)randează doar
+    dacă lipsește sau dacă o intrare s-a schimbat. Întoarce None la eroare de randare.
+    """
+    key = report_key(scan)
+    path = cached_report_path(scan, key)
+    if path:
+        return path
+
+    pdf = render_report(scan)
+    if pdf is None:
+        return None
+    return store_report(scan, pdf, key)
@@ -1,19 +1,135 @@
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 import nibabel as nib
-from nilearn.image import resample_img
 import numpy as np
+from nilearn.image import resample_img
+
+from .derivatives import write_nifti_streaming
+
+
+def target_grid(affine, shape, voxel_size):
+    """
+    Grila de ieșire: aceeași orientare și același câmp de vedere, voxeli de `voxel_size` mm.
+    Toate bucățile se reeșantionează pe aceeași grilă, deci se pot lipi pe axa timpului.
+    """
+    zooms = np.linalg.norm(affine[:3, :3], axis=0)
+    directions = affine[:3, :3] / zooms
+    target = np.eye(4)
+    target[:3, :3] = directions * voxel_size
+    # Marginea primului voxel rămâne pe loc (centrul se mută cu jumătate din diferență)
+    target[:3, 3] = affine[:3, 3] + directions @ ((voxel_size - zooms) / 2.0)
+    target_shape = tuple(int(np.ceil(n * z / voxel_size)) for n, z in zip(shape[:3], zooms))
+    return target, target_shape
+
+
+def volumes_per_chunk(shape, memory_budget_mb, workers):
+    """
+    Câte volume are o bucată: bucata float32, copia din proces și rezultatul
+    reeșantionării trebuie să încapă, pentru toate bucățile în zbor, în bugetul de memorie.
+    """
+    voxels = int(np.prod(shape[:3]))
+    budget = memory_budget_mb * 1024 * 1024
+    return max(1, int(budget // (2 * max(1, workers) * voxels * 4 * 3)))
+
+
+def resample_chunk(data, affine, start, stop, target_affine, target_shape, interpolation):
+    """
+    Reeșantionează volumele [start, stop) într-un proces separat.
+    """
+    chunk = nib.Nifti1Image(data, affine)
+    resampled = resample_img(
+        chunk, target_affine=target_affine, target_shape=target_shape,
+        interpolation=interpolation,
+    )
+    return start, stop, np.asarray(resampled.dataobj, dtype=np.float32)
+
+
+def downsample_scan(input_path, output_path, voxel_size=4.0, workers=None, memory_budget_mb=512,
+                    chunk_volumes=None, interpolation='continuous', compresslevel=6):
+    """
+    Reduce rezoluția spațială a unei scanări 4D fără să o încarce întreagă în RAM:
+    bucățile de timp se citesc secvențial, se reeșantionează în paralel pe aceeași grilă,
+    iar rezultatul se scrie incremental în fișierul de ieșire. Întoarce calea fișierului scris.
+    """
+    # Fișierul rămâne deschis: bucățile se citesc secvențial, într-o singură decomprimare gzip
+    img = nib.load(input_path, keep_file_open=True)
+    shape = img.shape
+    n_volumes = shape[3] if len(shape) == 4 else 1
+    target_affine, target_shape = target_grid(img.affine, shape, voxel_size)
+    workers = workers or os.cpu_count()
+    chunk_volumes = chunk_volumes or volumes_per_chunk(shape, memory_budget_mb, workers)
+    chunks = [(start, min(start + chunk_volumes, n_volumes)) for start in range(0, n_volumes, chunk_volumes)]
+
+    out_shape = target_shape + ((n_volumes,) if len(shape) == 4 else ())
+    tr = float(img.header.get_zooms()[3]) if len(shape) == 4 else None
+
+    def read_chunk(start, stop):
+        if len(shape) == 4:
+            return np.asarray(img.dataobj[..., start:stop], dtype=np.float32)
+        return np.asarray(img.dataobj, dtype=np.float32)
+
+    def fill(data):
+        target = data if data.ndim == 4 else data[..., np.newaxis]
+        if workers == 1:
+            # Un singur worker: în procesul curent, fără pool (ex. dintr-un fir al serverului web)
+            for start, stop in chunks:
+                _write_chunk(target, *resample_chunk(
+                    read_chunk(start, stop), img.affine, start, stop, target_affine, target_shape, interpolation
+                ))
+            return
+        # Fereastră limitată de bucăți în zbor: memoria nu crește cu lungimea scanării
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for start, stop in chunks:
+                pending.append(pool.submit(
+                    resample_chunk, read_chunk(start, stop), img.affine, start, stop,
+                    target_affine, target_shape, interpolation
+                ))
+                if len(pending) >= 2 * workers:
+                    _write_chunk(target, *pending.popleft().result())
+            while pending:
+                _write_chunk(target, *pending.popleft().result())
+
+    write_nifti_streaming(output_path, out_shape, np.float32, target_affine, fill,
+                          zooms_t=tr, compresslevel=compresslevel)
+    return output_path
+
+
+def _write_chunk(target, start, stop, values):
+    target[..., start:stop] = values.reshape(values.shape[:3] + (stop - start,))
+
+
+def downsampled_path_for(file_path, voxel_size):
+    """
+    `scan.nii.gz` -> `scan_ds4mm.nii.gz` (lângă original)
+    """
+    base = file_path.replace('.nii.gz', '').replace('.nii', '')
+    return f"{base}_ds{voxel_size:g}mm.nii.gz"
+
 
-# Numele fișierului tău gigant
-input_file = "/Users/ruthciuclea/Desktop/licenta/media/scans/test_control_HC_4D_8mwBLlU_Zv1JeQA_1GN31NQ_Uhegdu6_j2rqkvW.nii.gz"
-output_file = "fisier_mic_optimizat.nii.gz"
+def needs_downsampling(file_path, threshold_mb):
+    return threshold_mb is not None and os.path.getsize(file_path) > threshold_mb * 1024 * 1024
 
-print("Incarc fisierul gigant (asteapta putin)...")
-img = nib.load(input_file)
 
-# Il redimensionam la o rezolutie standard (ex: 4mm)
-# Asta va reduce dimensiunea de la 1.5GB la probabil sub 100MB
-print("Redimensionare...")
-downsampled_img = resample_img(img, target_affine=np.eye(4)*4, interpolation='continuous')
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reducere de rezoluție spațială pe bucăți de timp, în paralel.")
+    parser.add_argument("input", help="Scanarea NIfTI (3D sau 4D).")
+    parser.add_argument("output", nargs="?", default=None, help="Implicit: <input>_ds<voxel>mm.nii.gz")
+    parser.add_argument("--voxel-size", type=float, default=4.0, help="Dimensiunea voxelului țintă (mm).")
+    parser.add_argument("--workers", type=int, default=None, help="Procese paralele (implicit: toate nucleele).")
+    parser.add_argument("--memory-budget-mb", type=int, default=512, help="Memoria totală pentru bucățile în lucru.")
+    parser.add_argument("--chunk-volumes", type=int, default=None, help="Volume per bucată (implicit: din buget).")
+    parser.add_argument("--interpolation", choices=['continuous', 'linear', 'nearest'], default='continuous')
+    args = parser.parse_args()
 
-print(f"Salvare in {output_file}...")
-downsampled_img.to_filename(output_file)
-print("Gata! Incearca sa incarci acest fisier nou in aplicatie.")
\ No newline at end of file
+    output = args.output or downsampled_path_for(args.input, args.voxel_size)
+    start = time.perf_counter()
+    print(f"Redimensionare la {args.voxel_size:g} mm: {args.input}")
+    downsample_scan(args.input, output, voxel_size=args.voxel_size, workers=args.workers,
+                    memory_budget_mb=args.memory_budget_mb, chunk_volumes=args.chunk_volumes,
+                    interpolation=args.interpolation)
+    print(f"✅ Salvat în {output} ({time.perf_counter() - start:.1f}s)")
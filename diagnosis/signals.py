@@ -0,0 +1,28 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .models import PatientScan
+from .stats import stats_changed
+
+
+def _state(instance):
+    return (instance.prediction, instance.doctor_id)
+
+
+@receiver(post_init, sender=PatientScan)
+def remember_stats_state(sender, instance, **kwargs):
+    # Starea încărcată din DB, ca post_save să știe dacă statisticile s-au schimbat
+    instance._stats_state = _state(instance) if instance.pk else None
+
+
+@receiver(post_save, sender=PatientScan)
+def update_stats_on_save(sender, instance, created, **kwargs):
+    old_state = None if created else instance._stats_state
+    new_state = _state(instance)
+    stats_changed(old_state, new_state)
+    instance._stats_state = new_state
+
+
+@receiver(post_delete, sender=PatientScan)
+def update_stats_on_delete(sender, instance, **kwargs):
+    stats_changed(instance._stats_state, None)
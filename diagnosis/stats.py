@@ -0,0 +1,114 @@
+import numpy as np
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import PatientScan, StageMetric
+
+STATS_KEY = 'dashboard:stats'
+
+PD_LABEL = "Parkinson's Disease"
+HC_LABEL = "Healthy Control"
+
+
+def _empty_counters():
+    return {'total_scans': 0, 'pd_cases': 0, 'healthy_cases': 0}
+
+
+def compute_stats():
+    """
+    Recalculare completă: contoarele globale și defalcarea pe medic, într-o singură interogare.
+    """
+    rows = PatientScan.objects.values('doctor_id').annotate(
+        total_scans=Count('id'),
+        pd_cases=Count('id', filter=Q(prediction=PD_LABEL)),
+        healthy_cases=Count('id', filter=Q(prediction=HC_LABEL)),
+    ).order_by()
+
+    stats = {**_empty_counters(), 'by_doctor': {}}
+    for row in rows:
+        doctor_id = row.pop('doctor_id')
+        stats['by_doctor'][doctor_id] = row
+        for key, value in row.items():
+            stats[key] += value
+    return stats
+
+
+def refresh_stats():
+    """
+    Recalculează și pune în cache; expirarea (DASHBOARD_STATS_TTL) limitează cât poate
+    rămâne în cache un rezultat calculat chiar înaintea unei schimbări concurente.
+    """
+    stats = compute_stats()
+    cache.set(STATS_KEY, stats, timeout=getattr(settings, 'DASHBOARD_STATS_TTL', 900))
+    return stats
+
+
+def get_stats():
+    """
+    Statisticile din cache; interogarea agregată rulează doar după o schimbare sau la expirare.
+    """
+    stats = cache.get(STATS_KEY)
+    if stats is None:
+        stats = refresh_stats()
+    return stats
+
+
+def doctor_stats(stats, doctor_id):
+    return stats['by_doctor'].get(doctor_id, _empty_counters())
+
+
+def invalidate_stats():
+    """
+    Șterge statisticile din cache; următoarea citire le recalculează (o singură interogare).
+    Nu există citire-modificare-scriere, deci procesul web și worker-ii `process_scans`
+    nu își pot pierde reciproc actualizările prin cache-ul comun.
+    """
+    cache.delete(STATS_KEY)
+
+
+def stats_changed(old_state, new_state):
+    """
+    Apelată după salvarea / ștergerea unei scanări. Stările sunt (prediction, doctor_id)
+    sau None (rând inexistent). Invalidarea are loc după commit, ca o recalculare
+    concurentă să vadă deja rândul modificat (și nimic dacă tranzacția se anulează).
+    """
+    if old_state != new_state:
+        transaction.on_commit(invalidate_stats)
+
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def stage_percentiles(since=None, source=None):
+    """
+    Percentilele timpului real / CPU și ale vârfului de memorie pentru fiecare etapă
+    (StageMetric), opțional doar după `since` și pentru o singură sursă.
+    """
+    metrics = StageMetric.objects.all()
+    if since is not None:
+        metrics = metrics.filter(created_at__gte=since)
+    if source:
+        metrics = metrics.filter(source=source)
+
+    grouped = {}
+    rows = metrics.order_by().values_list('source', 'stage', 'wall_seconds', 'cpu_seconds', 'peak_anon_mb', 'failed')
+    for source_name, stage, wall, cpu, memory, failed in rows.iterator():
+        group = grouped.setdefault((source_name, stage), {'wall': [], 'cpu': [], 'memory': [], 'failed': 0})
+        group['wall'].append(wall)
+        group['cpu'].append(cpu)
+        group['memory'].append(memory)
+        group['failed'] += failed
+
+    summary = []
+    for (source_name, stage), group in sorted(grouped.items()):
+        row = {'source': source_name, 'stage': stage, 'count': len(group['wall']), 'failed': group['failed']}
+        for key, values in (('wall_seconds', group['wall']), ('cpu_seconds', group['cpu']),
+                            ('peak_anon_mb', group['memory'])):
+            points = np.percentile(values, PERCENTILES)
+            row[key] = {f'p{p}': round(float(v), 4) for p, v in zip(PERCENTILES, points)}
+            row[key]['max'] = round(float(max(values)), 4)
+        summary.append(row)
+    return summary
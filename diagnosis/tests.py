@@ -1,3 +1,1406 @@
-from django.test import TestCase
+import csv
+import glob
+import gzip
+import hashlib
+import io
+import json
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import threading
+import zipfile
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import joblib
+import nibabel as nib
+import numpy as np
+import pydicom
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, MRImageStorage, generate_uid
+from sklearn.linear_model import LogisticRegression
+
+from .apps import _is_serving
+from .cloud_local import LocalFirestoreClient
+from .cloud_utils import enqueue_scan_sync, flush_outbox
+from .dicom_convert import convert_dicom_archive, convert_series, is_dicom_archive
+from .derivatives import downsample_blocks, write_viewer_derivatives
+from .export import export_queryset, iter_export_zip
+from .feature_store import load_feature_matrix, load_features, save_features
+from .instrumentation import StageRecorder
+from .jobs import (
+    claim_scan, heartbeat, prepare_analysis_input, requeue_stale, resume_pending_jobs, run_analysis_job,
+    touch_heartbeat, worker_id,
+)
+from .ml_logic import InferenceEngine
+from .model_registry import (
+    ModelRegistryError, activate_version, list_versions, read_pointer, register_model, resolve_active,
+)
+from .models import CloudOutbox, PatientScan, StageMetric, ViewProfile
+from .preflight import PreflightError, check_header, compute_qc, run_preflight
+from .reports import get_or_render_report
+from .resize_scans import downsample_scan, downsampled_path_for, target_grid
+from .stats import STATS_KEY, compute_stats, get_stats, stage_percentiles
+from .training_store import TrainingFeatureStore
+
+
+class EngineWarmupTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        maps_path = os.path.join(self.tmp, 'maps.nii.gz')
+        maps = np.random.default_rng(0).random((10, 12, 10, 39)).astype(np.float32)
+        nib.Nifti1Image(maps, np.diag([8.0, 8.0, 8.0, 1.0])).to_filename(maps_path)
+        atlas = SimpleNamespace(maps=maps_path, labels=[str(i) for i in range(39)])
+        self.fetch = self.enterContext(
+            mock.patch('diagnosis.ml_logic.datasets.fetch_atlas_msdl', return_value=atlas))
+        self.enterContext(mock.patch('diagnosis.ml_logic._engine', None))
+        self.enterContext(override_settings(MODEL_REGISTRY_DIR=self.tmp))
+        rng = np.random.default_rng(1)
+        self.version = register_model(LogisticRegression().fit(rng.random((20, 741)), [0, 1] * 10),
+                                      trainer='test', registry_dir=self.tmp)
+
+    def test_shared_engine_warms_up_once(self):
+        from . import ml_logic
+
+        engine = ml_logic.get_engine()
+        self.assertIs(ml_logic.get_engine(), engine)
+        self.assertFalse(engine.is_warm)
+
+        with mock.patch('diagnosis.ml_logic.joblib.load', wraps=joblib.load) as load:
+            self.assertIs(engine.warmup(), engine)
+            masker, model = engine.masker, engine.model
+            engine.warmup()
+        self.assertTrue(engine.is_warm)
+        self.assertEqual(engine.model_version, self.version)
+        # Al doilea apel nu reîncarcă nici atlasul, nici modelul
+        self.assertEqual((self.fetch.call_count, load.call_count), (1, 1))
+        self.assertIs(engine.masker, masker)
+        self.assertIs(engine.model, model)
+
+    def test_warmup_command(self):
+        out = io.StringIO()
+        call_command('warmup_engine', stdout=out)
+        output = out.getvalue()
+        self.assertIn(f"Model: {self.version} (test)", output)
+        self.assertIn("Engine warm in", output)
+        self.fetch.assert_called_once()
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.doctor = User.objects.create_user('dr_test', password='secret')
+
+    def scan(self, status=PatientScan.STATUS_QUEUED, started_at=None, heartbeat_at=None):
+        return PatientScan.objects.create(patient_id="P1", age=60, doctor=self.doctor, status=status,
+                                          started_at=started_at, heartbeat_at=heartbeat_at)
+
+    def test_only_one_worker_claims_a_scan(self):
+        scan = self.scan()
+        self.assertTrue(claim_scan(scan.pk))
+        self.assertFalse(claim_scan(scan.pk))
+        scan.refresh_from_db()
+        self.assertEqual(scan.status, PatientScan.STATUS_RUNNING)
+        self.assertIsNotNone(scan.started_at)
+        self.assertFalse(claim_scan(self.scan(status=PatientScan.STATUS_DONE).pk))
+
+    def test_requeue_stale_only_touches_silent_running_jobs(self):
+        hours_ago = timezone.now() - timedelta(hours=2)
+        stale = self.scan(PatientScan.STATUS_RUNNING, hours_ago, hours_ago)
+        # Analiză lungă într-un alt proces: pornită demult, dar cu heartbeat recent
+        alive = self.scan(PatientScan.STATUS_RUNNING, hours_ago, timezone.now())
+        legacy = self.scan(PatientScan.STATUS_RUNNING, hours_ago)
+        fresh = self.scan(PatientScan.STATUS_RUNNING, timezone.now())
+        done = self.scan(PatientScan.STATUS_DONE, hours_ago, hours_ago)
+
+        self.assertEqual(requeue_stale(timedelta(minutes=30)), 2)
+        statuses = dict(PatientScan.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {
+            stale.pk: PatientScan.STATUS_QUEUED,
+            alive.pk: PatientScan.STATUS_RUNNING,
+            legacy.pk: PatientScan.STATUS_QUEUED,
+            fresh.pk: PatientScan.STATUS_RUNNING,
+            done.pk: PatientScan.STATUS_DONE,
+        })
+        self.assertTrue(claim_scan(stale.pk))
+        stale.refresh_from_db()
+        self.assertEqual(stale.claimed_by, worker_id())
+        self.assertGreater(stale.heartbeat_at, hours_ago)
+
+    def test_heartbeat_is_refreshed_while_the_job_runs(self):
+        scan = self.scan()
+        self.assertTrue(claim_scan(scan.pk))
+        PatientScan.objects.filter(pk=scan.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertTrue(touch_heartbeat(scan.pk))
+        scan.refresh_from_db()
+        self.assertGreater(scan.heartbeat_at, timezone.now() - timedelta(minutes=1))
+
+        # Doar worker-ul care a revendicat jobul îl ține în viață
+        with mock.patch('diagnosis.jobs.worker_id', return_value='other-host:1'):
+            self.assertFalse(touch_heartbeat(scan.pk))
+
+        beats = threading.Event()
+        with mock.patch('diagnosis.jobs.touch_heartbeat') as touch:
+            touch.side_effect = lambda scan_id: touch.call_count >= 2 and beats.set()
+            with heartbeat(scan.pk, interval=0.01):
+                self.assertTrue(beats.wait(5))
+        touch.assert_called_with(scan.pk)
+
+    @override_settings(ANALYSIS_STALE_AFTER_MINUTES=30)
+    def test_startup_resubmits_queued_and_stale_jobs(self):
+        queued = self.scan()
+        stale = self.scan(PatientScan.STATUS_RUNNING, timezone.now() - timedelta(hours=2))
+        self.scan(PatientScan.STATUS_RUNNING, timezone.now())
+
+        executor = mock.Mock()
+        with mock.patch('diagnosis.jobs.get_executor', return_value=executor):
+            self.assertEqual(resume_pending_jobs(), 2)
+        self.assertEqual([c.args for c in executor.submit.call_args_list],
+                         [(run_analysis_job, queued.pk), (run_analysis_job, stale.pk)])
+
+
+class DuplicateUploadTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.doctor = User.objects.create_user('doctor', password='secret')
+        self.content = b'fake nifti bytes'
+        self.previous = PatientScan.objects.create(
+            patient_id="P1", age=60, doctor=self.doctor, scan_file='scans/P1.nii.gz',
+            content_sha256=hashlib.sha256(self.content).hexdigest(), model_version='v1',
+            prediction="Healthy Control", confidence=91.0, status=PatientScan.STATUS_DONE,
+        )
+        self.client.force_login(self.doctor)
+
+    def tearDown(self):
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def upload(self, active_version):
+        engine = mock.Mock()
+        engine.active_version.return_value = active_version
+        self.engine = engine
+        executor = mock.Mock()
+        executor.submit.side_effect = lambda func, *args: func(*args)
+        with override_settings(MEDIA_ROOT=self.media, ANALYSIS_DISPATCH='worker'), \
+                mock.patch('diagnosis.jobs.get_engine', return_value=engine), \
+                mock.patch('diagnosis.jobs.get_executor', return_value=executor), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/upload/', {
+                'patient_id': "P2", 'age': 61,
+                'scan_file': SimpleUploadedFile('P2.nii.gz', self.content),
+            })
+        return PatientScan.objects.latest('pk')
+
+    def test_same_model_reuses_result_and_syncs(self):
+        scan = self.upload('v1')
+        # Comparația cu versiunea activă nu încălzește motorul în cererea de upload
+        self.engine.warmup.assert_not_called()
+        self.assertEqual((scan.status, scan.prediction, scan.model_version),
+                         (PatientScan.STATUS_DONE, "Healthy Control", 'v1'))
+        self.assertEqual(scan.scan_file.name, self.previous.scan_file.name)
+        self.assertEqual(CloudOutbox.objects.get(scan=scan).payload['patient_id'], "P2")
+        # Raportul este deja randat înainte de prima descărcare
+        self.assertTrue(scan.report_key)
+        self.assertTrue(os.path.exists(os.path.join(self.media, scan.report_file.name)))
+
+    def test_changed_model_queues_a_new_analysis(self):
+        scan = self.upload('v2')
+        self.assertEqual((scan.status, scan.prediction, scan.model_version), (PatientScan.STATUS_QUEUED, None, ''))
+        self.assertEqual(scan.scan_file.name, self.previous.scan_file.name)
+        self.assertFalse(CloudOutbox.objects.exists())
+
+    def test_in_flight_duplicate_keeps_its_own_file(self):
+        running = PatientScan.objects.create(
+            patient_id="P1", age=60, doctor=self.doctor, scan_file=self.previous.scan_file.name,
+            content_sha256=self.previous.content_sha256, status=PatientScan.STATUS_RUNNING,
+        )
+        scan = self.upload('v1')
+        self.assertNotEqual(scan.pk, running.pk)
+        self.assertEqual((scan.status, scan.prediction), (PatientScan.STATUS_QUEUED, None))
+        self.assertNotEqual(scan.scan_file.name, self.previous.scan_file.name)
+        self.assertTrue(os.path.exists(os.path.join(self.media, scan.scan_file.name)))
+
+
+class FeatureStoreTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.enterContext(override_settings(MEDIA_ROOT=self.media))
+        doctor = User.objects.create_user('doctor', password='secret')
+        self.scans = [
+            PatientScan.objects.create(patient_id=f"P{i}", age=60, doctor=doctor, content_sha256=f"{i:064x}")
+            for i in range(3)
+        ]
+        rng = np.random.default_rng(0)
+        self.time_series = rng.normal(size=(30, 39))
+        self.feature_vector = rng.normal(size=(1, 741))
+
+    def tearDown(self):
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def test_round_trip_as_float32(self):
+        scan = self.scans[0]
+        self.assertIsNone(load_features(scan))
+        save_features(scan, self.time_series, self.feature_vector)
+        scan.save()
+
+        features = load_features(PatientScan.objects.get(pk=scan.pk))
+        self.assertEqual(features['time_series'].dtype, np.float32)
+        self.assertEqual(features['feature_vector'].shape, (741,))
+        np.testing.assert_allclose(features['time_series'], self.time_series, rtol=1e-6)
+        np.testing.assert_allclose(features['feature_vector'], self.feature_vector.ravel(), rtol=1e-6)
+
+    def test_feature_matrix_skips_scans_without_sidecar(self):
+        save_features(self.scans[0], self.time_series, self.feature_vector)
+        save_features(self.scans[2], self.time_series, self.feature_vector * 2)
+        matrix, found = load_feature_matrix(self.scans)
+        self.assertEqual(matrix.shape, (2, 741))
+        self.assertEqual(found, [self.scans[0], self.scans[2]])
+        np.testing.assert_allclose(matrix[1], matrix[0] * 2, rtol=1e-6)
+
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class RescoreCommandTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.registry = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.registry, ignore_errors=True)
+        rng = np.random.default_rng(0)
+        # Atlas sintetic și scanare pe grila lui; motor nou, legat de registrul temporar
+        affine = np.diag([8.0, 8.0, 8.0, 1.0])
+        maps_path = os.path.join(self.media, 'maps.nii.gz')
+        nib.Nifti1Image(rng.random((10, 12, 10, 39)).astype(np.float32), affine).to_filename(maps_path)
+        atlas = SimpleNamespace(maps=maps_path, labels=[str(i) for i in range(39)])
+        self.enterContext(mock.patch('diagnosis.ml_logic.datasets.fetch_atlas_msdl', return_value=atlas))
+        self.enterContext(mock.patch('diagnosis.ml_logic._engine', None))
+        self.enterContext(override_settings(MEDIA_ROOT=self.media, MODEL_REGISTRY_DIR=self.registry))
+
+        os.makedirs(os.path.join(self.media, 'scans'))
+        nib.Nifti1Image((100 + rng.normal(0, 10, (10, 12, 10, 30))).astype(np.float32), affine).to_filename(
+            os.path.join(self.media, 'scans', 'scan.nii.gz'))
+        self.model = LogisticRegression().fit(rng.random((20, 741)), [0, 1] * 10)
+
+        doctor = User.objects.create_user('doctor', password='secret')
+        self.stored, self.missing = [
+            PatientScan.objects.create(patient_id=patient_id, age=60, doctor=doctor, scan_file='scans/scan.nii.gz',
+                                       content_sha256=patient_id.lower(), status=PatientScan.STATUS_DONE,
+                                       prediction="Healthy Control", confidence=50.0, model_version='old')
+            for patient_id in ("STORED", "MISSING")
+        ]
+        self.vector = rng.random((1, 741)).astype(np.float32)
+        save_features(self.stored, np.zeros((30, 39)), self.vector)
+        self.stored.save()
+
+    def rescore(self, *args):
+        out = io.StringIO()
+        call_command('rescore', '--workers', '1', *args, stdout=out)
+        return out.getvalue()
+
+    def test_rescores_stored_features_and_reextracts_missing_ones(self):
+        version = register_model(self.model, trainer='test', registry_dir=self.registry)
+        with self.captureOnCommitCallbacks(execute=False):
+            output = self.rescore()
+        self.assertIn("1 extracted from NIfTI, 0 failed, 2 queued for Cloud sync", output)
+
+        self.stored.refresh_from_db()
+        self.missing.refresh_from_db()
+        (label, confidence), = InferenceEngine().predict_batch(self.vector, model=self.model)
+        self.assertEqual((self.stored.prediction, self.stored.confidence, self.stored.model_version),
+                         (label, confidence, version))
+        self.assertEqual(self.missing.model_version, version)
+        self.assertIsNotNone(load_features(self.missing))
+        self.assertEqual(set(CloudOutbox.objects.values_list('scan', flat=True)), {self.stored.pk, self.missing.pk})
+
+        # Al doilea rescore: toate trăsăturile sunt salvate, deci niciun pool de procese
+        with mock.patch('diagnosis.management.commands.rescore.ProcessPoolExecutor') as pool:
+            output = self.rescore('--only-stale')
+        pool.assert_not_called()
+        self.assertIn("Re-scored 0 scan(s)", output)
+        with mock.patch('diagnosis.management.commands.rescore.ProcessPoolExecutor') as pool:
+            self.assertIn("Re-scored 2 scan(s)", self.rescore())
+        pool.assert_not_called()
+
+
+class DashboardPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = User.objects.create_user('doctor', password='secret')
+        other = User.objects.create_user('other', password='secret')
+        now = timezone.now()
+        # Trei scanări cu același created_at: ordinea între ele vine din id
+        for i, created_at in enumerate([now, now, now, now - timedelta(hours=1), now - timedelta(hours=2)]):
+            scan = PatientScan.objects.create(
+                patient_id=f"P{i}", age=60, doctor=self.doctor if i % 2 else other,
+                prediction="Parkinson's Disease" if i < 2 else "Healthy Control",
+            )
+            PatientScan.objects.filter(pk=scan.pk).update(created_at=created_at)
+        self.client.force_login(self.doctor)
+
+    @override_settings(DASHBOARD_PAGE_SIZE=2)
+    def test_cursor_walks_every_scan_once_in_order(self):
+        expected = list(PatientScan.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+        seen, pages, cursor = [], 0, None
+        while True:
+            response = self.client.get('/', {'cursor': cursor} if cursor else {})
+            seen += [scan.pk for scan in response.context['scans']]
+            pages += 1
+            cursor = response.context['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+        self.assertEqual(pages, 3)
+
+    def test_malformed_cursor_falls_back_to_first_page(self):
+        response = self.client.get('/', {'cursor': 'not-a-cursor'})
+        self.assertTrue(response.context['is_first_page'])
+        self.assertEqual(len(response.context['scans']), 5)
+        self.assertEqual((response.context['total_scans'], response.context['pd_cases'],
+                          response.context['healthy_cases']), (5, 2, 3))
+        self.assertEqual(response.context['my_stats']['total_scans'], 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctors = [User.objects.create_user(f'doctor{i}', password='secret') for i in range(2)]
+
+    def change(self, operation):
+        # Statisticile sunt în cache înainte de schimbare și corecte după commit
+        get_stats()
+        with self.captureOnCommitCallbacks(execute=True):
+            result = operation()
+        self.assertEqual(get_stats(), compute_stats())
+        return result
+
+    def test_signals_keep_cached_stats_in_sync(self):
+        scan = self.change(lambda: PatientScan.objects.create(
+            patient_id="P1", age=60, doctor=self.doctors[0], prediction="Healthy Control"))
+        self.assertEqual(get_stats()['healthy_cases'], 1)
+
+        scan.prediction = "Parkinson's Disease"
+        self.change(scan.save)
+        self.assertEqual((get_stats()['pd_cases'], get_stats()['healthy_cases']), (1, 0))
+
+        scan.doctor = self.doctors[1]
+        self.change(scan.save)
+        self.assertNotIn(self.doctors[0].pk, get_stats()['by_doctor'])
+        self.assertEqual(get_stats()['by_doctor'][self.doctors[1].pk]['pd_cases'], 1)
+
+        self.change(scan.delete)
+        self.assertEqual(get_stats()['total_scans'], 0)
+
+    def test_unrelated_save_keeps_the_cache_entry(self):
+        scan = PatientScan.objects.create(patient_id="P1", age=60, doctor=self.doctors[0])
+        stats = get_stats()
+        with self.captureOnCommitCallbacks(execute=True):
+            scan.age = 61
+            scan.save()
+        self.assertEqual(cache.get(STATS_KEY), stats)
+
+
+class ReportETagTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.enterContext(override_settings(MEDIA_ROOT=self.media))
+        self.doctor = User.objects.create_user('doctor', password='secret')
+        self.scan = PatientScan.objects.create(
+            patient_id="P1", age=60, doctor=self.doctor, model_version='v1',
+            prediction="Healthy Control", confidence=91.0, status=PatientScan.STATUS_DONE,
+        )
+        self.url = f'/report/{self.scan.pk}/'
+        self.client.force_login(self.doctor)
+
+    def tearDown(self):
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def download(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        if response.status_code == 200:
+            b''.join(response.streaming_content)
+        return response
+
+    def test_matching_if_none_match_returns_304(self):
+        first = self.download()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Content-Type'], 'application/pdf')
+        self.assertIn('no-cache', first['Cache-Control'])
+
+        cached = self.download(if_none_match=first['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], first['ETag'])
+
+    def test_model_version_or_template_change_gives_new_etag(self):
+        etag = self.download()['ETag']
+
+        PatientScan.objects.filter(pk=self.scan.pk).update(model_version='v2')
+        response = self.download(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        etag = response['ETag']
+        self.assertEqual(self.download(if_none_match=etag).status_code, 304)
+
+        with mock.patch('diagnosis.reports.template_hash', return_value='edited-template'):
+            response = self.download(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+def render_unless_broken(snapshot):
+    # Funcție de modul: worker-ii exportului (forkserver) o primesc prin pickle
+    from .report_worker import render
+
+    return None if snapshot.patient_id == "BROKEN" else render(snapshot)
+
+
+class ReportExportTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.enterContext(override_settings(MEDIA_ROOT=self.media))
+        doctor = User.objects.create_user('doctor', password='secret')
+        self.scans = [
+            PatientScan.objects.create(patient_id=patient_id, age=60, doctor=doctor, model_version='v1',
+                                       prediction="Healthy Control", confidence=90.0)
+            for patient_id in ("STORED", "RENDERED", "BROKEN")
+        ]
+        get_or_render_report(self.scans[0])
+
+    def tearDown(self):
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def test_streamed_archive_lists_only_included_reports(self):
+        # Loturi de 2: scanările din al doilea lot se citesc după salvarea primelor rapoarte
+        with mock.patch('diagnosis.export.render', render_unless_broken):
+            chunks = list(iter_export_zip(export_queryset(), workers=2, chunk_rows=2))
+        self.assertGreater(len(chunks), 3)
+
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+            names = archive.namelist()
+            with archive.open('summary.csv') as f:
+                rows = list(csv.DictReader(io.TextIOWrapper(f, encoding='utf-8')))
+            self.assertTrue(archive.read(f'reports/{self.scans[1].pk}_RENDERED.pdf').startswith(b'%PDF'))
+
+        stored, rendered, broken = self.scans
+        self.assertEqual(names, [f'reports/{stored.pk}_STORED.pdf', f'reports/{rendered.pk}_RENDERED.pdf',
+                                 'summary.csv'])
+        self.assertEqual([(row['patient_id'], row['report'], row['report_status']) for row in rows], [
+            ("STORED", names[0], 'included'),
+            ("RENDERED", names[1], 'included'),
+            ("BROKEN", '', 'render_failed'),
+        ])
+        # Raportul randat în timpul exportului este stocat pentru descărcările ulterioare
+        rendered.refresh_from_db()
+        self.assertTrue(rendered.report_key)
+
+    def test_workers_are_not_forked_from_the_web_process(self):
+        from .export import _worker_context
+
+        self.assertIn(_worker_context().get_start_method(), ('forkserver', 'spawn'))
+
+
+class CloudOutboxTests(TestCase):
+    def setUp(self):
+        doctor = User.objects.create_user('dr_test', password='secret')
+        self.scans = [
+            PatientScan.objects.create(
+                patient_id=f"P{i}", age=60 + i, doctor=doctor,
+                prediction="Healthy Control", confidence=0.9, status=PatientScan.STATUS_DONE,
+            )
+            for i in range(3)
+        ]
+        for scan in self.scans:
+            enqueue_scan_sync(scan)
+
+    def test_flush_writes_pending_messages_in_one_batch(self):
+        client = LocalFirestoreClient()
+        self.assertEqual(flush_outbox(client=client), 3)
+        self.assertEqual(client.commits, 1)
+        self.assertEqual(len(client.documents), 3)
+        self.assertFalse(CloudOutbox.objects.filter(sent_at__isnull=True).exists())
+
+        doc = CloudOutbox.objects.get(scan=self.scans[0])
+        path = f"artifacts/neurodetect-ppmi-2025/public/data/scans/{doc.doc_id}"
+        self.assertEqual(client.documents[path]['patient_id'], "P0")
+        self.assertEqual(client.documents[path]['status'], 'finalized')
+
+        # Nimic de retrimis
+        self.assertEqual(flush_outbox(client=client), 0)
+
+        # Durata lotului Firestore apare la fiecare scanare din lot
+        self.assertEqual(StageMetric.objects.filter(source=StageMetric.SOURCE_CLOUD).count(), 3)
+
+    def test_batch_size_splits_commits(self):
+        client = LocalFirestoreClient()
+        self.assertEqual(flush_outbox(client=client, batch_size=2), 3)
+        self.assertEqual(client.commits, 2)
+
+    def test_failed_commit_is_retried_after_backoff(self):
+        client = LocalFirestoreClient(fail_commits=1)
+        self.assertEqual(flush_outbox(client=client), 0)
+        self.assertEqual(client.documents, {})
+
+        pending = CloudOutbox.objects.filter(sent_at__isnull=True)
+        self.assertEqual(pending.count(), 3)
+        self.assertTrue(all(m.attempts == 1 and m.last_error for m in pending))
+        self.assertTrue(all(m.next_attempt_at > timezone.now() for m in pending))
+
+        # Înainte de expirarea backoff-ului lotul nu este reîncercat
+        self.assertEqual(flush_outbox(client=client), 0)
+
+        pending.update(next_attempt_at=timezone.now())
+        self.assertEqual(flush_outbox(client=client), 3)
+        self.assertEqual(len(client.documents), 3)
+        self.assertFalse(CloudOutbox.objects.filter(sent_at__isnull=True).exists())
+
+
+class ServerProcessTests(TestCase):
+    def serving(self, argv, modules=(), env=None):
+        with mock.patch.object(sys, 'argv', argv), \
+                mock.patch.dict(sys.modules, {name: mock.Mock() for name in modules}), \
+                mock.patch.dict(os.environ, env or {}):
+            return _is_serving()
+
+    def test_only_server_entry_points_start_background_threads(self):
+        self.assertFalse(self.serving(['manage.py', 'test']))
+        self.assertFalse(self.serving(['manage.py', 'runserver']))
+        self.assertTrue(self.serving(['manage.py', 'runserver'], env={'RUN_MAIN': 'true'}))
+        self.assertFalse(self.serving(['pytest']))
+        self.assertFalse(self.serving(['export_worker.py']))
+        self.assertTrue(self.serving(['gunicorn', 'pd_project.wsgi'], modules=['pd_project.wsgi']))
+        self.assertTrue(self.serving(['uvicorn', 'pd_project.asgi:application'], modules=['pd_project.asgi']))
+
+
+FOLDER_WIT_PD = os.path.join(settings.BASE_DIR, 'folder_wit_pd')
+
+
+def write_slice_dicom(path, series_uid, position, instance, acquisition, pixels,
+                      patient_id='SYN01', description='MPRAGE', series_number=2):
+    """
+    Felie DICOM sintetică (MR, fără mozaic), cu geometria minimă pentru conversie.
+    """
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = MRImageStorage
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.SOPClassUID = MRImageStorage
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.Modality = 'MR'
+    ds.PatientID = patient_id
+    ds.SeriesInstanceUID = series_uid
+    ds.SeriesDescription = description
+    ds.SeriesNumber = series_number
+    ds.InstanceNumber = instance
+    ds.AcquisitionNumber = acquisition
+    ds.ImageType = ['ORIGINAL', 'PRIMARY', 'M', 'ND']
+    ds.ImagePositionPatient = list(position)
+    ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+    ds.PixelSpacing = [2.0, 1.0]
+    ds.SliceThickness = 3.0
+    ds.RepetitionTime = 2000
+    ds.Rows, ds.Columns = pixels.shape
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = 'MONOCHROME2'
+    ds.BitsAllocated = ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.PixelRepresentation = 0
+    ds.PixelData = pixels.astype(np.uint16).tobytes()
+    ds.save_as(path, enforce_file_format=True)
+
+
+def write_series(directory, description, series_number, n_slices, n_volumes=1, patient_id='SYN01'):
+    """
+    Serie sintetică de felii 4 x 3 într-un director propriu; întoarce căile fișierelor.
+    """
+    os.makedirs(directory, exist_ok=True)
+    series_uid = generate_uid()
+    rng = np.random.default_rng(series_number)
+    paths = []
+    for t in range(n_volumes):
+        for k in range(n_slices):
+            path = os.path.join(directory, f"{series_number}_{t:03d}_{k:03d}.dcm")
+            write_slice_dicom(path, series_uid, (0.0, 0.0, 3.0 * k), len(paths) + 1, t + 1,
+                              rng.integers(0, 1000, size=(3, 4)), patient_id, description, series_number)
+            paths.append(path)
+    return paths
+
+
+class DicomConvertTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def ppmi_series(self, patient_id):
+        return sorted(glob.glob(os.path.join(FOLDER_WIT_PD, f"PPMI_{patient_id}_*.dcm")))
+
+    @skipUnless(os.path.isdir(FOLDER_WIT_PD), "folder_wit_pd samples not available")
+    def test_mosaic_rsfmri_series(self):
+        files = self.ppmi_series('103542')
+        output = os.path.join(self.tmp, 'rsfmri.nii.gz')
+        result = convert_series(files, output)
+
+        img = nib.load(output)
+        self.assertEqual(img.shape, (64, 64, 40, 10))
+        self.assertEqual(result['shape'], img.shape)
+        np.testing.assert_allclose(img.header.get_zooms(), (3.5, 3.5, 3.5, 2.5), rtol=1e-5)
+        self.assertEqual(nib.aff2axcodes(img.affine), ('L', 'P', 'S'))
+
+        # Primul volum = fișierul cu cel mai mic AcquisitionNumber; felia k = dala k din mozaic
+        first = min(files, key=lambda f: int(pydicom.dcmread(f, stop_before_pixels=True).AcquisitionNumber))
+        pixels = pydicom.dcmread(first).pixel_array
+        volume = np.asarray(img.dataobj[..., 0])
+        np.testing.assert_array_equal(volume[:, :, 0], pixels[:64, :64].T)
+        np.testing.assert_array_equal(volume[:, :, 9], pixels[64:128, 128:192].T)
+        np.testing.assert_array_equal(volume[:, :, 39], pixels[320:384, 256:320].T)
+
+        with open(result['sidecar']) as f:
+            sidecar = json.load(f)
+        self.assertEqual(sidecar['RepetitionTime'], 2.5)
+        self.assertEqual(sidecar['SeriesDescription'], 'rsfMRI_LR')
+
+    @skipUnless(os.path.isdir(FOLDER_WIT_PD), "folder_wit_pd samples not available")
+    def test_non_square_mosaic_geometry(self):
+        files = self.ppmi_series('3130')[:5]
+        img = nib.load(convert_series(files, os.path.join(self.tmp, 'ep2d.nii'))['nifti'])
+        # Mozaic 462 x 476 cu 40 felii => grilă 7 x 7 de dale 66 x 68
+        self.assertEqual(img.shape, (68, 66, 40, 5))
+
+        ds = pydicom.dcmread(files[0], stop_before_pixels=True)
+        # Originea se mută din colțul mozaicului în colțul primei dale (RAS)
+        expected = np.array(ds.ImagePositionPatient, dtype=float)
+        expected[:2] += np.array([476 - 68, 462 - 66]) / 2.0 * float(ds.PixelSpacing[0])
+        expected[:2] *= -1
+        np.testing.assert_allclose(img.affine[:3, 3], expected, atol=1e-3)
+
+    @skipUnless(os.path.isdir(FOLDER_WIT_PD), "folder_wit_pd samples not available")
+    def test_mixed_series_rejected_and_archive_picks_largest(self):
+        with self.assertRaises(ValueError):
+            convert_series(self.ppmi_series('103542') + self.ppmi_series('3130')[:2],
+                           os.path.join(self.tmp, 'mixed.nii.gz'))
+
+        archive = os.path.join(self.tmp, 'upload.zip')
+        with zipfile.ZipFile(archive, 'w') as zf:
+            for path in self.ppmi_series('103542') + self.ppmi_series('3130')[:3]:
+                zf.write(path, os.path.join('DICOM', os.path.basename(path)))
+        self.assertTrue(is_dicom_archive(archive))
+        result = convert_dicom_archive(archive, os.path.join(self.tmp, 'upload.nii.gz'))
+        self.assertEqual(result['shape'], (64, 64, 40, 10))
+
+    def test_single_slice_files_are_stacked_by_position(self):
+        series_uid = generate_uid()
+        rng = np.random.default_rng(0)
+        expected = rng.integers(0, 4000, size=(4, 3, 3, 2))  # (coloane, rânduri, felii, volume)
+        instance = 0
+        # Fișiere scrise în ordine inversă a pozițiilor, ca ordinea din folder să nu conteze
+        for t in range(2):
+            for k in reversed(range(3)):
+                instance += 1
+                write_slice_dicom(
+                    os.path.join(self.tmp, f"slice_{instance:03d}.dcm"), series_uid,
+                    (-10.0, -20.0, 5.0 + 3.0 * k), instance, t + 1, expected[:, :, k, t].T,
+                )
+
+        paths = sorted(glob.glob(os.path.join(self.tmp, '*.dcm')))
+        img = nib.load(convert_series(paths, os.path.join(self.tmp, 't1.nii.gz'))['nifti'])
+        self.assertEqual(img.shape, (4, 3, 3, 2))
+        np.testing.assert_array_equal(np.asarray(img.dataobj), expected)
+        np.testing.assert_allclose(img.affine, [
+            [-1.0, 0.0, 0.0, 10.0],
+            [0.0, -2.0, 0.0, 20.0],
+            [0.0, 0.0, 3.0, 5.0],
+            [0.0, 0.0, 0.0, 1.0],
+        ])
+
+
+class DicomSeriesConversionTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp, 'dicom')
+        self.output = os.path.join(self.tmp, 'nifti')
+        self.index = os.path.join(self.tmp, 'index.sqlite')
+        self.t1 = write_series(os.path.join(self.source, 'anat'), 'MPRAGE', 2, n_slices=3)
+        self.bold = write_series(os.path.join(self.source, 'func'), 'rsfMRI_LR', 5, n_slices=3, n_volumes=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def convert(self):
+        from convert_dicom_to_nifti import convert_dicom_to_nifti
+        manifest = convert_dicom_to_nifti(self.source, self.output, workers=1, index_path=self.index,
+                                          converter='python')
+        return {entry['description']: entry for entry in manifest.values()}
+
+    def test_rerun_skips_unchanged_series(self):
+        first = self.convert()
+        self.assertEqual({name: entry['status'] for name, entry in first.items()},
+                         {'MPRAGE': 'converted', 'rsfMRI_LR': 'converted'})
+        self.assertEqual(first['MPRAGE']['outputs'], ['PPMI_SYN01_MPRAGE_S2.json', 'PPMI_SYN01_MPRAGE_S2.nii.gz'])
+        output = os.path.join(self.output, 'PPMI_SYN01_MPRAGE_S2.nii.gz')
+        self.assertEqual(nib.load(output).shape, (4, 3, 3))
+        mtime = os.path.getmtime(output)
+
+        second = self.convert()
+        self.assertEqual({entry['status'] for entry in second.values()}, {'skipped'})
+        self.assertEqual(os.path.getmtime(output), mtime)
+
+        # Un fișier înlocuit (alt SOPInstanceUID) schimbă amprenta doar pentru seria lui
+        ds = pydicom.dcmread(self.bold[0])
+        write_slice_dicom(self.bold[0], ds.SeriesInstanceUID, (0.0, 0.0, 0.0), 1, 1,
+                          np.ones((3, 4)), description='rsfMRI_LR', series_number=5)
+        third = self.convert()
+        self.assertEqual((third['MPRAGE']['status'], third['rsfMRI_LR']['status']), ('skipped', 'converted'))
+        with open(os.path.join(self.output, 'conversion_manifest.json')) as f:
+            self.assertEqual(len(json.load(f)), 2)
+
+
+class DicomIndexTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp, 'dicom')
+        self.t1 = write_series(os.path.join(self.source, 'anat'), 'MPRAGE', 2, n_slices=52)
+        self.bold = write_series(os.path.join(self.source, 'func'), 'ep2d_bold', 5, n_slices=3, n_volumes=2)
+        with open(os.path.join(self.source, 'notes.txt'), 'w') as f:
+            f.write('not dicom')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_incremental_update_and_sql_classification(self):
+        from dicom_index import DicomIndex
+
+        with DicomIndex(os.path.join(self.tmp, 'index.sqlite')) as index:
+            self.assertEqual(index.update(self.source), 52 + 6 + 1)
+            self.assertEqual(index.update(self.source), 0)
+
+            classes = index.classify(self.source)
+            self.assertEqual([s['series_description'] for s in classes['T1w']], ['MPRAGE'])
+            self.assertEqual([s['series_description'] for s in classes['bold']], ['ep2d_bold'])
+            t1, = classes['T1w']
+            self.assertEqual((t1['n_files'], t1['dim3'], t1['dim4'], t1['tr']), (52, 52, 1, 2.0))
+            self.assertEqual([f['path'] for f in index.files(t1['series_uid'])], self.t1)
+
+            # Doar fișierul modificat se recitește; o serie fără fișiere dispare din index
+            with open(self.t1[0], 'ab') as f:
+                f.write(b'\0\0')
+            self.assertEqual(index.update(self.source), 1)
+            shutil.rmtree(os.path.join(self.source, 'func'))
+            self.assertEqual(index.update(self.source), 0)
+            self.assertEqual([s['series_description'] for s in index.series(self.source)], ['MPRAGE'])
+
+
+class BidsBuildTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp, 'dicom')
+        self.bids = os.path.join(self.tmp, 'bids')
+        write_series(os.path.join(self.source, 'S01', 'anat'), 'MPRAGE', 2, n_slices=52, patient_id='S-01')
+        write_series(os.path.join(self.source, 'S01', 'func'), 'rsfMRI_LR', 5, n_slices=3, n_volumes=2,
+                     patient_id='S-01')
+        write_series(os.path.join(self.source, 'S02', 'func'), 'rsfMRI_LR', 6, n_slices=3, n_volumes=2,
+                     patient_id='S-02')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def build(self, **kwargs):
+        from build_bids import build_bids
+        return build_bids(self.source, self.bids, workers=1, converter='python',
+                          index_path=os.path.join(self.tmp, 'index.sqlite'), **kwargs)
+
+    def sidecar(self, label):
+        with open(os.path.join(self.bids, f'sub-{label}', 'func', f'sub-{label}_task-rest_bold.json')) as f:
+            return json.load(f)
+
+    def test_incremental_build_and_sidecars(self):
+        state = self.build()
+        self.assertEqual({pid: entry['status'] for pid, entry in state.items()}, {'S-01': 'built', 'S-02': 'built'})
+        self.assertEqual(nib.load(os.path.join(self.bids, 'sub-S01', 'anat', 'sub-S01_T1w.nii.gz')).shape,
+                         (4, 3, 52))
+        self.assertEqual(nib.load(os.path.join(self.bids, 'sub-S02', 'func', 'sub-S02_task-rest_bold.nii.gz')).shape,
+                         (4, 3, 3, 2))
+        self.assertFalse(os.path.exists(os.path.join(self.bids, 'sub-S02', 'anat')))
+        sidecar = self.sidecar('S01')
+        self.assertEqual((sidecar['RepetitionTime'], sidecar['TaskName']), (2.0, 'rest'))
+        self.assertTrue(os.path.exists(os.path.join(self.bids, 'dataset_description.json')))
+
+        self.assertEqual({entry['status'] for entry in self.build().values()}, {'skipped'})
+
+        # Un TR forțat schimbă amprenta tuturor subiecților
+        state = self.build(repetition_time=3.0)
+        self.assertEqual({entry['status'] for entry in state.values()}, {'built'})
+        self.assertEqual(self.sidecar('S02')['RepetitionTime'], 3.0)
+        self.assertEqual(os.listdir(os.path.join(self.bids, 'code')), ['build_state.json'])
+
+
+class PreflightTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        # Cub "creier" de 1000 cu zgomot temporal, pe fundal zero
+        data = np.zeros((12, 12, 12, 20), dtype=np.float32)
+        data[3:9, 3:9, 3:9] = 1000 + rng.normal(0, 10, (6, 6, 6, 20))
+        self.data = data
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp, name)
+        nib.Nifti1Image(data, np.diag([3.0, 3.0, 3.0, 1.0])).to_filename(path)
+        return path
+
+    def test_header_rejects_3d_short_and_truncated(self):
+        with self.assertRaisesRegex(PreflightError, '4D'):
+            check_header(self.write('anat.nii.gz', self.data[..., 0]))
+        with self.assertRaisesRegex(PreflightError, 'minim 10'):
+            check_header(self.write('short.nii.gz', self.data[..., :5]))
+
+        for name in ['scan.nii.gz', 'scan.nii']:
+            path = self.write(name, self.data)
+            self.assertEqual(check_header(path)['shape'], [12, 12, 12, 20])
+            with open(path, 'rb') as f:
+                raw = f.read()
+            with open(path, 'wb') as f:
+                f.write(raw[:len(raw) // 2])
+            with self.assertRaisesRegex(PreflightError, 'trunchiat'):
+                check_header(path)
+
+    def test_multi_member_and_padded_gzip_are_complete(self):
+        with open(self.write('scan.nii', self.data), 'rb') as f:
+            raw = f.read()
+        half = len(raw) // 2
+        members = gzip.compress(raw[:half]) + gzip.compress(raw[half:])
+        for name, content in [('bgzip.nii.gz', members), ('padded.nii.gz', gzip.compress(raw) + bytes(512))]:
+            path = os.path.join(self.tmp, name)
+            with open(path, 'wb') as f:
+                f.write(content)
+            self.assertEqual(check_header(path)['shape'], [12, 12, 12, 20])
+
+        path = os.path.join(self.tmp, 'cut.nii.gz')
+        with open(path, 'wb') as f:
+            f.write(members[:len(members) - 100])
+        with self.assertRaisesRegex(PreflightError, 'trunchiat'):
+            check_header(path)
+
+    def test_qc_is_independent_of_chunk_size(self):
+        path = self.write('scan.nii.gz', self.data)
+        streamed = compute_qc(path, memory_budget_mb=0.05)
+        whole = compute_qc(path)
+        self.assertEqual(streamed['dvars_pct'], whole['dvars_pct'])
+        self.assertEqual(streamed['tsnr_median'], whole['tsnr_median'])
+        self.assertEqual(len(whole['global_signal']), 20)
+        self.assertEqual(len(whole['dvars_pct']), 19)
+        self.assertAlmostEqual(whole['tsnr_median'], 100, delta=25)
+
+    def test_constant_signal_is_rejected_with_metrics(self):
+        data = self.data.copy()
+        data[...] = data[..., :1]
+        with self.assertRaises(PreflightError) as ctx:
+            run_preflight(self.write('flat.nii.gz', data))
+        self.assertEqual(ctx.exception.metrics['flags'], ['no_temporal_variance'])
+
+    def test_analysis_job_reads_header_once(self):
+        doctor = User.objects.create_user('doctor', password='secret')
+        self.write('scan.nii.gz', self.data)
+        scan = PatientScan.objects.create(patient_id="P1", age=60, doctor=doctor, scan_file='scan.nii.gz')
+        engine = mock.Mock()
+        engine.analyze.return_value = {
+            'label': "Healthy Control", 'confidence': 90.0, 'model_version': 'v1',
+            'time_series': np.zeros((20, 39)), 'feature_vector': np.zeros((1, 741)),
+        }
+        header_check = mock.Mock(wraps=check_header)
+        with override_settings(MEDIA_ROOT=self.tmp), \
+                mock.patch('diagnosis.jobs.get_engine', return_value=engine), \
+                mock.patch('diagnosis.jobs.get_or_render_report'), \
+                mock.patch('diagnosis.jobs.check_header', header_check), \
+                mock.patch('diagnosis.preflight.check_header', header_check), \
+                self.captureOnCommitCallbacks(execute=False):
+            run_analysis_job(scan.pk)
+
+        scan.refresh_from_db()
+        self.assertEqual(scan.status, PatientScan.STATUS_DONE)
+        header_check.assert_called_once()
+        self.assertEqual(scan.qc_metrics['header']['shape'], [12, 12, 12, 20])
+        self.assertTrue(StageMetric.objects.filter(scan=scan, stage='header_check').exists())
+
+
+class StageMetricTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.scan = PatientScan.objects.create(patient_id="P1", age=60, doctor=self.staff)
+
+    def test_recorder_measures_stages_and_failures(self):
+        recorder = StageRecorder(StageMetric.SOURCE_ANALYSIS)
+        with recorder.stage('masking'):
+            np.linalg.svd(np.random.default_rng(0).normal(size=(200, 200)))
+        with self.assertRaises(ValueError):
+            with recorder.stage('prediction'):
+                raise ValueError("model")
+
+        rows = recorder.results()
+        self.assertEqual([row['stage'] for row in rows], ['masking', 'prediction'])
+        self.assertEqual([row['failed'] for row in rows], [False, True])
+        self.assertGreater(rows[0]['wall_seconds'], 0)
+        self.assertGreater(rows[0]['peak_rss_mb'], 0)
+
+    def test_percentiles_per_stage(self):
+        StageMetric.objects.bulk_create([
+            StageMetric(scan=self.scan, source=StageMetric.SOURCE_ANALYSIS, stage='masking',
+                        wall_seconds=float(i), cpu_seconds=float(i), peak_rss_mb=100.0, peak_anon_mb=50.0)
+            for i in range(1, 101)
+        ] + [
+            StageMetric(scan=self.scan, source=StageMetric.SOURCE_UPLOAD, stage='receive',
+                        wall_seconds=0.5, cpu_seconds=0.1, peak_rss_mb=100.0, peak_anon_mb=50.0, failed=True)
+        ])
+        masking, = stage_percentiles(source=StageMetric.SOURCE_ANALYSIS)
+        self.assertEqual(masking['count'], 100)
+        self.assertAlmostEqual(masking['wall_seconds']['p50'], 50.5)
+        self.assertAlmostEqual(masking['wall_seconds']['p95'], 95.05)
+        self.assertEqual(masking['wall_seconds']['max'], 100.0)
+
+        self.client.force_login(self.staff)
+        stages = self.client.get('/metrics/stages/').json()['stages']
+        self.assertEqual([(row['source'], row['stage'], row['failed']) for row in stages],
+                         [('analysis', 'masking', 0), ('upload', 'receive', 1)])
+
+
+    def test_upload_receive_is_timed_before_the_view(self):
+        from django.test import Client
+
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        # Cu verificarea CSRF activă, CsrfViewMiddleware citește corpul înaintea view-ului
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.staff)
+        client.get('/upload/')
+        content = os.urandom(1024 * 1024)
+        with override_settings(MEDIA_ROOT=media, ANALYSIS_DISPATCH='worker'):
+            response = client.post('/upload/', {
+                'patient_id': "P2", 'age': 61, 'csrfmiddlewaretoken': client.cookies['csrftoken'].value,
+                'scan_file': SimpleUploadedFile('P2.nii.gz', content),
+            })
+        self.assertEqual(response.status_code, 302)
+
+        scan = PatientScan.objects.get(patient_id="P2")
+        self.assertEqual(scan.content_sha256, hashlib.sha256(content).hexdigest())
+        metrics = StageMetric.objects.filter(scan=scan).order_by('pk')
+        receive = metrics.first()
+        self.assertEqual((receive.source, receive.stage, receive.failed),
+                         (StageMetric.SOURCE_UPLOAD, 'receive', False))
+        self.assertGreater(receive.wall_seconds, 0)
+        self.assertGreater(receive.peak_rss_mb, 0)
+        self.assertEqual(list(metrics.values_list('stage', flat=True)), ['receive', 'dedupe', 'save', 'enqueue'])
+
+
+class ViewProfilingTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.doctor = User.objects.create_user('doctor', password='secret')
+
+    def tearDown(self):
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def test_disabled_by_default(self):
+        self.client.force_login(self.staff)
+        response = self.client.get('/?profile=1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(ViewProfile.objects.exists())
+
+    def test_staff_request_stores_downloadable_profile(self):
+        with override_settings(VIEW_PROFILING=True, MEDIA_ROOT=self.media):
+            self.client.force_login(self.doctor)
+            self.client.get('/?profile=1')
+            self.assertFalse(ViewProfile.objects.exists())
+
+            self.client.force_login(self.staff)
+            self.assertNotIn('X-Profile-Id', self.client.get('/'))
+            response = self.client.get('/', HTTP_X_PROFILE='1')
+            profile = ViewProfile.objects.get(pk=response['X-Profile-Id'])
+            self.assertEqual((profile.view_name, profile.status_code, profile.user), ('dashboard', 200, self.staff))
+            self.assertIn('cumulative', profile.summary)
+
+            download = self.client.get(f'/admin/diagnosis/viewprofile/{profile.pk}/download/')
+            path = os.path.join(self.media, 'downloaded.prof')
+            with open(path, 'wb') as f:
+                f.write(b''.join(download.streaming_content))
+            self.assertTrue(any(name == 'dashboard' for _, _, name in pstats.Stats(path).stats))
+
+
+class ViewerDerivativeTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.volume = np.random.default_rng(0).uniform(-50, 1200, (91, 109, 91)).astype(np.float32)
+        self.affine = np.diag([2.0, 2.0, 2.0, 1.0])
+        self.affine[:3, 3] = [-90, -126, -72]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_quantized_full_and_block_averaged_preview(self):
+        paths = write_viewer_derivatives(self.volume, self.affine, os.path.join(self.tmp, 'scan_viewer.nii.gz'))
+        self.assertEqual(paths['preview'], os.path.join(self.tmp, 'scan_viewer_preview.nii.gz'))
+        value_range = float(self.volume.max() - self.volume.min())
+
+        full = nib.load(paths['full'])
+        self.assertEqual(full.get_data_dtype(), np.int16)
+        self.assertEqual(full.shape, (91, 109, 91))
+        # scl_slope / scl_inter readuc valorile originale, până la un pas de cuantizare
+        np.testing.assert_allclose(full.get_fdata(), self.volume, atol=value_range / 65535 + 1e-3)
+
+        preview = nib.load(paths['preview'])
+        self.assertEqual(preview.get_data_dtype(), np.uint8)
+        self.assertEqual(preview.shape, (45, 54, 45))
+        expected, expected_affine = downsample_blocks(self.volume, self.affine, 64)
+        np.testing.assert_allclose(preview.get_fdata(), expected, atol=value_range / 255)
+        # Centrul primului voxel = centrul primului bloc 2 x 2 x 2
+        np.testing.assert_allclose(preview.affine, expected_affine)
+        np.testing.assert_allclose(preview.affine[:3, 3], [-89, -125, -71])
+        self.assertEqual(downsample_blocks(self.volume[:60, :60, :60], self.affine, 64)[0].shape, (60, 60, 60))
+
+    def test_viewer_urls_prefer_derivatives_and_fall_back_to_the_snapshot(self):
+        scan = PatientScan(patient_id="P1", age=60, scan_file='scans/P1.nii.gz')
+        self.assertEqual(scan.viewer_url, '/media/scans/P1_viewer.nii.gz')
+        self.assertEqual(scan.viewer_preview_url, '/media/scans/P1_viewer.nii.gz')
+        # Fără '_viewer_viewer' pentru un fișier care este deja un snapshot
+        self.assertEqual(PatientScan(scan_file='scans/P2_viewer.nii.gz').viewer_url, '/media/scans/P2_viewer.nii.gz')
+
+        scan.viewer_full.name = 'scans/P1_ds4mm_viewer.nii.gz'
+        self.assertEqual(scan.viewer_preview_url, '/media/scans/P1_ds4mm_viewer.nii.gz')
+        scan.viewer_full.name = 'scans/P1_viewer.nii.gz'
+        scan.viewer_preview.name = 'scans/P1_viewer_preview.nii.gz'
+        self.assertEqual(scan.viewer_url, '/media/scans/P1_viewer.nii.gz')
+        self.assertEqual(scan.viewer_preview_url, '/media/scans/P1_viewer_preview.nii.gz')
+
+
+class StreamingExtractionTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        # Atlas sintetic (39 hărți, voxeli de 8 mm) în locul descărcării MSDL
+        affine = np.diag([8.0, 8.0, 8.0, 1.0])
+        maps_path = os.path.join(self.tmp, 'maps.nii.gz')
+        nib.Nifti1Image(rng.random((10, 12, 10, 39)).astype(np.float32), affine).to_filename(maps_path)
+        atlas = SimpleNamespace(maps=maps_path, labels=[str(i) for i in range(39)])
+        self.enterContext(mock.patch('diagnosis.ml_logic.datasets.fetch_atlas_msdl', return_value=atlas))
+
+        # Scanare deja pe grila hărților (masker-ul nu o mai reeșantionează)
+        self.scan_path = os.path.join(self.tmp, 'ongrid.nii.gz')
+        data = (100 + rng.normal(0, 10, (10, 12, 10, 40))).astype(np.float32)
+        nib.Nifti1Image(data, affine).to_filename(self.scan_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def extract(self, streaming):
+        engine = InferenceEngine(model_path=os.path.join(self.tmp, 'missing.pkl'), streaming=streaming,
+                                 memory_budget_mb=0.3).warmup()
+        img = engine.load(self.scan_path)
+        engine.save_snapshot(img, os.path.join(self.tmp, f'{streaming}_viewer.nii.gz'))
+        self.assertEqual(engine.use_streaming(img), streaming == 'always')
+        return engine.extract_time_series(img), engine.volumes_per_chunk(img)
+
+    def test_streaming_matches_full_masker_on_grid(self):
+        whole, _ = self.extract('never')
+        streamed, chunk_volumes = self.extract('always')
+        self.assertLess(chunk_volumes, 40)
+        self.assertEqual(whole.shape, (40, 39))
+        # Aceleași semnale z-score, până la precizia float32 a datelor
+        np.testing.assert_allclose(streamed, whole, atol=1e-4)
+
+
+class DownsampleTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.affine = np.diag([2.0, 2.0, 2.0, 1.0])
+        self.data = (100 + rng.normal(0, 10, (16, 14, 12, 10))).astype(np.float32)
+        self.scan_path = os.path.join(self.tmp, 'scan.nii.gz')
+        img = nib.Nifti1Image(self.data, self.affine)
+        img.header.set_zooms((2.0, 2.0, 2.0, 2.5))
+        img.to_filename(self.scan_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_chunked_matches_whole_resample(self):
+        from nilearn.image import resample_img
+
+        target_affine, target_shape = target_grid(self.affine, self.data.shape, 4.0)
+        whole = resample_img(nib.Nifti1Image(self.data, self.affine), target_affine=target_affine,
+                             target_shape=target_shape, interpolation='continuous')
+        for workers in (1, 2):
+            path = downsample_scan(self.scan_path, os.path.join(self.tmp, f'ds_{workers}.nii.gz'),
+                                   voxel_size=4.0, workers=workers, chunk_volumes=3)
+            out = nib.load(path)
+            self.assertEqual(out.shape, (8, 7, 6, 10))
+            self.assertEqual(out.header.get_zooms()[3], 2.5)
+            np.testing.assert_allclose(out.affine, target_affine)
+            np.testing.assert_allclose(out.get_fdata(), whole.get_fdata(), atol=1e-3)
+
+    def test_derivative_is_reused(self):
+        with override_settings(ANALYSIS_DOWNSAMPLE_ABOVE_MB=0), \
+                mock.patch('diagnosis.jobs.downsample_scan', wraps=downsample_scan) as downsample:
+            first = prepare_analysis_input(self.scan_path)
+            second = prepare_analysis_input(self.scan_path)
+        self.assertEqual(first, second)
+        self.assertEqual(first, downsampled_path_for(self.scan_path, 4.0))
+        downsample.assert_called_once()
+        # În procesul web reeșantionarea nu pornește un pool de procese
+        self.assertEqual(downsample.call_args.kwargs['workers'], 1)
+
+        os.remove(first)
+        with override_settings(ANALYSIS_DOWNSAMPLE_ABOVE_MB=0, ANALYSIS_DISPATCH='worker'), \
+                mock.patch('diagnosis.jobs.downsample_scan') as downsample:
+            prepare_analysis_input(self.scan_path)
+        self.assertEqual(downsample.call_args.kwargs['workers'], settings.ANALYSIS_DOWNSAMPLE_WORKERS)
+
+    def test_small_scans_are_not_downsampled(self):
+        self.assertEqual(prepare_analysis_input(self.scan_path), self.scan_path)
+        self.assertFalse(os.path.exists(downsampled_path_for(self.scan_path, 4.0)))
+
+
+class TrainingExtractionTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.checkpoints = os.path.join(self.tmp, 'checkpoints')
+        os.makedirs(self.checkpoints)
+        data = np.random.default_rng(0).random((4, 4, 4, 12)).astype(np.float32)
+        self.scan_path = os.path.join(self.tmp, 'sub-01_ses-1_bold.nii.gz')
+        nib.Nifti1Image(data, np.eye(4)).to_filename(self.scan_path)
+        self.vector = np.arange(741, dtype=np.float32).reshape(1, -1)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_rerun_uses_checkpoint_and_store(self):
+        from train_scientific import extract_subject
+
+        with mock.patch('train_scientific.extract_features', return_value=(None, self.vector)) as extract:
+            record, vector = extract_subject(self.scan_path, 1, self.checkpoints)
+            self.assertEqual(record['status'], 'done')
+            np.testing.assert_array_equal(vector, self.vector[0])
+
+            record, vector = extract_subject(self.scan_path, 1, self.checkpoints)
+            self.assertEqual(record['status'], 'cached')
+            np.testing.assert_array_equal(vector, self.vector[0])
+
+            record, vector = extract_subject(self.scan_path, 1, self.checkpoints, {record['sha256']})
+            self.assertEqual((record['status'], vector), ('stored', None))
+
+    def test_header_rejects_are_skipped_not_failed(self):
+        from train_scientific import extract_subject
+
+        path = os.path.join(self.tmp, 'anat.nii.gz')
+        nib.Nifti1Image(np.zeros((4, 4, 4), dtype=np.float32), np.eye(4)).to_filename(path)
+        with mock.patch('train_scientific.extract_features') as extract:
+            record, vector = extract_subject(path, 0, self.checkpoints)
+        self.assertEqual((record['status'], vector), ('skipped', None))
+        self.assertIn('4D', record['error'])
+        extract.assert_not_called()
+
+
+class TrainingFeatureStoreTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.vectors = np.random.default_rng(0).random((3, 741)).astype(np.float32)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def rows(self, *hashes):
+        return [{'subject_id': h, 'session': '', 'label': i % 2, 'sha256': h, 'source': f'{h}.nii.gz'}
+                for i, h in enumerate(hashes)]
+
+    def test_append_is_deduplicated_and_survives_reopen(self):
+        store = TrainingFeatureStore(self.root)
+        self.assertEqual(store.append(self.rows('a', 'b'), self.vectors[:2]), 2)
+        self.assertEqual(store.append(self.rows('b', 'c'), self.vectors[1:]), 1)
+
+        X, y, rows = TrainingFeatureStore(self.root).load()
+        self.assertIsInstance(X, np.memmap)
+        np.testing.assert_array_equal(X, self.vectors)
+        self.assertEqual(y.tolist(), [0, 1, 1])
+        self.assertEqual([row['sha256'] for row in rows], ['a', 'b', 'c'])
+
+        with self.assertRaises(ValueError):
+            TrainingFeatureStore(self.root, dim=10)
+
+    def test_uncommitted_bytes_are_ignored_and_truncated(self):
+        store = TrainingFeatureStore(self.root)
+        store.append(self.rows('a'), self.vectors[:1])
+        # Oprire bruscă după scrierea datelor, înainte de meta.json
+        with open(store.vectors_path, 'ab') as f:
+            f.write(self.vectors[2].tobytes())
+        with open(store.rows_path, 'a') as f:
+            f.write(json.dumps(self.rows('lost')[0]) + '\n')
+
+        store = TrainingFeatureStore(self.root)
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.known_hashes(), {'a'})
+        store.append(self.rows('b'), self.vectors[1:2])
+        self.assertEqual(os.path.getsize(store.vectors_path), 2 * 741 * 4)
+        np.testing.assert_array_equal(store.vectors(), self.vectors[:2])
+
+
+class ModelBenchmarkTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_nested_cv_on_separable_store(self):
+        from benchmark_models import CALIBRATIONS, KERNELS, benchmark
+
+        rng = np.random.default_rng(0)
+        y = np.array([0, 1] * 6)
+        X = rng.normal(size=(12, 741)).astype(np.float32)
+        X[y == 1, :20] += 3.0
+        store_dir = os.path.join(self.tmp, 'store')
+        TrainingFeatureStore(store_dir).append(
+            [{'subject_id': str(i), 'session': '', 'label': int(label), 'sha256': str(i), 'source': ''}
+             for i, label in enumerate(y)], X)
+
+        report_path = os.path.join(self.tmp, 'report.json')
+        summary = benchmark(outer_folds=10, inner_folds=3, n_jobs=1, store_dir=store_dir, report_path=report_path)
+        self.assertEqual({(row['kernel'], row['calibration']) for row in summary},
+                         {(kernel, calibration) for kernel in KERNELS for calibration in CALIBRATIONS})
+        with open(report_path) as f:
+            report = json.load(f)
+        # Fold-urile sunt limitate de clasa minoritară (6 subiecți)
+        self.assertEqual(report['outer_folds'], 6)
+        self.assertEqual(len(report['folds']), 6 * len(summary))
+        # Platt intern este instabil pe 10 subiecți; decision_function nu
+        rows = {(row['kernel'], row['calibration']): row for row in summary}
+        self.assertGreater(rows['linear', 'none']['auc'], 0.9)
+        self.assertTrue(all(row['accuracy'] > 0.75 for row in summary))
+
+
+class AnalysisBenchmarkTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        maps_path = os.path.join(self.tmp, 'maps.nii.gz')
+        maps = np.random.default_rng(0).random((25, 30, 24, 39)).astype(np.float32)
+        nib.Nifti1Image(maps, np.diag([8.0, 8.0, 8.0, 1.0])).to_filename(maps_path)
+        atlas = SimpleNamespace(maps=maps_path, labels=[str(i) for i in range(39)])
+        self.enterContext(mock.patch('diagnosis.ml_logic.datasets.fetch_atlas_msdl', return_value=atlas))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def report(self, stages):
+        stages = {name: {'seconds_median': seconds} for name, seconds in stages.items()}
+        return {'cases': [{'name': 'case', 'stages': stages,
+                           'total_seconds_median': sum(s['seconds_median'] for s in stages.values())}]}
+
+    def test_case_times_every_stage_on_a_reused_scan(self):
+        from benchmark_analysis import STAGES, ensure_scan, run_case, summarize_runs
+
+        path = ensure_scan(8.0, 12, True, seed=1, scans_dir=self.tmp)
+        with mock.patch('benchmark_analysis.create_sized_mock') as create:
+            self.assertEqual(ensure_scan(8.0, 12, True, seed=1, scans_dir=self.tmp), path)
+        create.assert_not_called()
+
+        result = run_case(path, repeats=2, model_path=os.path.join(self.tmp, 'missing.pkl'))
+        self.assertEqual(result['shape'][3], 12)
+        self.assertEqual(len(result['runs']), 2)
+        self.assertTrue(all(list(run) == STAGES for run in result['runs']))
+
+        stages, total = summarize_runs(result['runs'])
+        self.assertEqual(list(stages), STAGES)
+        self.assertGreater(stages['masking']['seconds_median'], 0)
+        self.assertGreaterEqual(stages['masking']['seconds_median'], stages['masking']['seconds_min'])
+        self.assertGreater(total, 0)
+
+    def test_compare_flags_only_real_slowdowns(self):
+        from benchmark_analysis import STAGES, compare_reports
+
+        before = dict.fromkeys(STAGES, 0.01) | {'load': 1.0, 'masking': 2.0}
+        # masking +50% (regresie), load +10% (în toleranță), prediction x3 dar sub 50 ms (zgomot)
+        after = before | {'load': 1.1, 'masking': 3.0, 'prediction': 0.03}
+        rows, regressions = compare_reports(self.report(before), self.report(after), max_slowdown=0.25)
+
+        self.assertEqual(len(rows), len(STAGES) + 1)
+        self.assertEqual([row['stage'] for row in regressions], ['masking', 'total'])
+        self.assertEqual(regressions[0]['ratio'], 1.5)
+        _, regressions = compare_reports(self.report(before), self.report(before))
+        self.assertEqual(regressions, [])
+
+
+class ModelRegistryTests(TestCase):
+    def setUp(self):
+        self.registry = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.X = rng.random((20, 741))
+        self.y = np.array([0, 1] * 10)
+
+    def tearDown(self):
+        shutil.rmtree(self.registry, ignore_errors=True)
+
+    def model(self, C=1.0, n_features=741):
+        return LogisticRegression(C=C).fit(self.X[:, :n_features], self.y)
+
+    def test_versions_are_immutable_and_content_addressed(self):
+        first = register_model(self.model(), trainer='test', registry_dir=self.registry)
+        self.assertEqual(register_model(self.model(), trainer='test', registry_dir=self.registry), first)
+        second = register_model(self.model(C=0.1), trainer='test', activate=False, registry_dir=self.registry)
+
+        self.assertNotEqual(first, second)
+        self.assertEqual([meta['version'] for meta in list_versions(self.registry)], [first, second])
+        active = resolve_active(self.registry)
+        self.assertEqual((active['version'], active['meta']['feature_dim']), (first, 741))
+
+        activate_version(second, self.registry)
+        self.assertEqual(read_pointer(self.registry)['previous'], first)
+        with self.assertRaises(ModelRegistryError):
+            activate_version('missing', self.registry)
+        with self.assertRaises(ModelRegistryError):
+            register_model(self.model(n_features=10), trainer='test', registry_dir=self.registry)
+
+    def test_engine_hot_reloads_when_the_pointer_moves(self):
+        engine = InferenceEngine(registry_dir=self.registry)
+        engine.refresh_model()
+        self.assertIsNone(engine.model)
+
+        first = register_model(self.model(), trainer='test', registry_dir=self.registry)
+        self.assertTrue(engine.refresh_model())
+        self.assertEqual(engine.model_version, first)
+        # Pointer neschimbat: niciun acces la model.pkl
+        self.assertFalse(engine.refresh_model())
+
+        second = register_model(self.model(C=0.1), trainer='test', registry_dir=self.registry)
+        engine.refresh_model()
+        self.assertEqual(engine.model_version, second)
+        label, confidence = engine.predict_batch(self.X[:1])[0]
+        self.assertIn(label, ("Parkinson's Disease", "Healthy Control"))
+
+    def test_active_version_does_not_warm_up(self):
+        engine = InferenceEngine(registry_dir=self.registry)
+        self.assertEqual(engine.active_version(), '')
+        first = register_model(self.model(), trainer='test', registry_dir=self.registry)
+        with mock.patch('diagnosis.ml_logic.joblib.load') as load:
+            self.assertEqual(engine.active_version(), first)
+        load.assert_not_called()
+        self.assertIsNone(engine.masker)
+
+        engine.refresh_model()
+        second = register_model(self.model(C=0.1), trainer='test', activate=False, registry_dir=self.registry)
+        self.assertEqual(engine.active_version(), first)
+        activate_version(second, self.registry)
+        self.assertEqual(engine.active_version(), second)
@@ -0,0 +1,146 @@
+import os
+import re
+import json
+
+import numpy as np
+
+
+def parse_subject_session(file_path):
+    """
+    Deduce (subject_id, session) din numele fișierului:
+    BIDS `sub-XXX_ses-YY_...`, PPMI `PPMI_103542_...` sau, altfel, numele fișierului.
+    """
+    name = os.path.basename(file_path)
+    subject = re.search(r'sub-([A-Za-z0-9]+)', name)
+    session = re.search(r'ses-([A-Za-z0-9]+)', name)
+    if subject:
+        return subject.group(1), session.group(1) if session else ''
+    ppmi = re.match(r'PPMI_(\d+)_', name)
+    if ppmi:
+        return ppmi.group(1), ''
+    return re.sub(r'\.nii(\.gz)?$', '', name), ''
+
+
+class TrainingFeatureStore:
+    """
+    Depozit de trăsături pentru antrenare, pe disc, doar cu adăugare (append-only).
+
+    Structură pe coloane în `root/`:
+      - vectors.f32  : matricea N x dim, float32, row-major (se deschide cu np.memmap)
+      - labels.i1    : etichetele (1 = PD, 0 = HC), int8
+      - rows.jsonl   : subject_id, session, label, sha256, source pentru fiecare rând
+      - meta.json    : atlas, kind, dim și numărul de rânduri confirmate
+
+    `meta.json` se rescrie atomic după fiecare adăugare; octeții scriși după ultimul
+    număr confirmat (de ex. după o oprire bruscă) sunt ignorați și apoi trunchiați.
+    """
+
+    def __init__(self, root, atlas='msdl', kind='correlation', dim=741):
+        self.root = root
+        self.vectors_path = os.path.join(root, 'vectors.f32')
+        self.labels_path = os.path.join(root, 'labels.i1')
+        self.rows_path = os.path.join(root, 'rows.jsonl')
+        self.meta_path = os.path.join(root, 'meta.json')
+
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.meta = json.load(f)
+            if (self.meta['atlas'], self.meta['kind'], self.meta['dim']) != (atlas, kind, dim):
+                raise ValueError(
+                    f"Depozitul {root} conține {self.meta['atlas']}/{self.meta['kind']} "
+                    f"({self.meta['dim']} trăsături), nu {atlas}/{kind} ({dim})."
+                )
+        else:
+            self.meta = {'atlas': atlas, 'kind': kind, 'dim': dim, 'n_rows': 0}
+
+    def __len__(self):
+        return self.meta['n_rows']
+
+    @property
+    def dim(self):
+        return self.meta['dim']
+
+    def rows(self):
+        """
+        Metadatele rândurilor confirmate, în ordinea din matrice.
+        """
+        if not os.path.exists(self.rows_path):
+            return []
+        with open(self.rows_path) as f:
+            lines = f.readlines()[:len(self)]
+        return [json.loads(line) for line in lines]
+
+    def known_hashes(self):
+        return {row['sha256'] for row in self.rows()}
+
+    def vectors(self):
+        """
+        Matricea N x dim mapată în memorie (read-only); nu se încarcă în RAM.
+        """
+        if len(self) == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(len(self), self.dim))
+
+    def labels(self):
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int8)
+        return np.memmap(self.labels_path, dtype=np.int8, mode='r', shape=(len(self),))
+
+    def load(self):
+        """
+        (X, y, rows) pentru antrenare sau evaluare.
+        """
+        return self.vectors(), self.labels(), self.rows()
+
+    def append(self, rows, vectors):
+        """
+        Adaugă rânduri noi; cele cu un sha256 deja prezent sunt ignorate.
+        Întoarce numărul de rânduri adăugate.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(rows), -1)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Vectori de {vectors.shape[1]} trăsături, depozitul așteaptă {self.dim}.")
+
+        known = self.known_hashes()
+        keep = []
+        for i, row in enumerate(rows):
+            if row['sha256'] not in known:
+                known.add(row['sha256'])
+                keep.append(i)
+        if not keep:
+            return 0
+
+        os.makedirs(self.root, exist_ok=True)
+        self._truncate_uncommitted()
+
+        with open(self.vectors_path, 'ab') as f:
+            f.write(np.ascontiguousarray(vectors[keep]).tobytes())
+        with open(self.labels_path, 'ab') as f:
+            f.write(np.array([rows[i]['label'] for i in keep], dtype=np.int8).tobytes())
+        with open(self.rows_path, 'a') as f:
+            for i in keep:
+                f.write(json.dumps(rows[i]) + '\n')
+
+        self.meta['n_rows'] += len(keep)
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f, indent=4)
+        os.replace(tmp_path, self.meta_path)
+        return len(keep)
+
+    def _truncate_uncommitted(self):
+        n = len(self)
+        sizes = [
+            (self.vectors_path, n * self.dim * 4),
+            (self.labels_path, n),
+        ]
+        for path, size in sizes:
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+        if os.path.exists(self.rows_path):
+            with open(self.rows_path) as f:
+                lines = f.readlines()
+            if len(lines) > n:
+                with open(self.rows_path, 'w') as f:
+                    f.writelines(lines[:n])
@@ -0,0 +1,69 @@
+import time
+import hashlib
+
+from django.core.files.uploadhandler import FileUploadHandler
+
+from .instrumentation import current_rss_mb
+
+# Memoria se eșantionează o dată la atâtea bucăți (64 KB fiecare), nu la fiecare
+RSS_SAMPLE_EVERY = 16
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """
+    Calculează SHA-256 pentru fiecare fișier urcat, pe măsură ce bucățile sunt
+    scrise pe disc de handler-ele standard (nu recitește fișierul după upload).
+    Rezultatul ajunge în `request.upload_digests[field_name]`.
+
+    Măsoară și recepția corpului multipart, în `request.upload_receive` (același format
+    ca StageRecorder.results()): corpul este citit înaintea view-ului, la primul acces
+    la request.POST din CsrfViewMiddleware, deci o etapă din view ar măsura ~0 ms.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.receive_wall = time.perf_counter()
+        self.receive_cpu = time.thread_time()
+        self.peak_rss, self.peak_anon = current_rss_mb()
+        self.chunks = 0
+        self.interrupted = False
+        # None => parsarea standard continuă
+        return None
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        self.chunks += 1
+        if self.chunks % RSS_SAMPLE_EVERY == 0:
+            self._sample_rss()
+        # Trimitem bucata mai departe către handler-ul care o salvează
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not hasattr(self.request, 'upload_digests'):
+            self.request.upload_digests = {}
+        self.request.upload_digests[self.field_name] = self.hasher.hexdigest()
+        # None => fișierul este construit de următorul handler din listă
+        return None
+
+    def upload_interrupted(self):
+        self.interrupted = True
+
+    def upload_complete(self):
+        self._sample_rss()
+        self.request.upload_receive = {
+            'stage': 'receive',
+            'wall_seconds': time.perf_counter() - self.receive_wall,
+            'cpu_seconds': time.thread_time() - self.receive_cpu,
+            'peak_rss_mb': round(self.peak_rss, 1),
+            'peak_anon_mb': round(self.peak_anon, 1),
+            'failed': self.interrupted,
+        }
+        return None
+
+    def _sample_rss(self):
+        rss, anon = current_rss_mb()
+        self.peak_rss = max(self.peak_rss, rss)
+        self.peak_anon = max(self.peak_anon, anon)
@@ -7,5 +7,8 @@ urlpatterns = [
     path('upload/', views.upload_scan, name='upload'),
     path('methodology/', views.methodology, name='methodology'),
     path('result/<int:scan_id>/', views.view_result, name='view_result'),
+    path('result/<int:scan_id>/status/', views.scan_status, name='scan_status'),
     path('report/<int:scan_id>/', views.generate_pdf, name='generate_pdf'),
+    path('reports/export/', views.export_reports, name='export_reports'),
+    path('metrics/stages/', views.stage_metrics, name='stage_metrics'),
 ]
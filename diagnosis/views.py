@@ -1,34 +1,74 @@
-from django.shortcuts import render, redirect
-from .models import PatientScan
-from .ml_logic import analyze_fmri
+from django.shortcuts import render, redirect, get_object_or_404
+from .models import PatientScan, StageMetric
+from .jobs import (
+    enqueue_analysis, find_previous_scan, reuse_previous_analysis, save_reused_scan, save_stage_metrics,
+)
+from .instrumentation import StageRecorder
+from .profiling import profile_view
+from .stats import get_stats, doctor_stats, stage_percentiles
+from .reports import report_key, get_or_render_report
+from .export import export_queryset, iter_export_zip
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
-from django.template.loader import get_template
-from xhtml2pdf import pisa
+from django.http import HttpResponse, JsonResponse, FileResponse, StreamingHttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
 from django.contrib.auth.forms import UserCreationForm
-from .cloud_utils import save_scan_to_cloud
 from django.contrib import messages
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import timedelta
 
 @login_required
+@profile_view
 def dashboard(request):
     """
-    Displays the clinical dashboard with all processed scans.
+    Displays the clinical dashboard with processed scans, newest first, one page at a time.
     """
-    scans = PatientScan.objects.all().order_by('-created_at')
-    
-    total_scans = scans.count()
-    pd_cases = scans.filter(prediction="Parkinson's Disease").count()
-    healthy_cases = scans.filter(prediction="Healthy Control").count()
+    # Counters come from the stats cache (kept current by PatientScan signals)
+    stats = get_stats()
+
+    # Keyset pagination on (created_at, id): constant cost whatever the page depth
+    page_size = getattr(settings, 'DASHBOARD_PAGE_SIZE', 25)
+    scans = PatientScan.objects.select_related('doctor').order_by('-created_at', '-id')
+    cursor = _parse_cursor(request.GET.get('cursor'))
+    if cursor:
+        created_at, scan_id = cursor
+        scans = scans.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=scan_id))
+
+    page = list(scans[:page_size + 1])
+    next_cursor = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        last = page[-1]
+        next_cursor = f"{last.created_at.isoformat()}|{last.id}"
 
     context = {
-        'scans': scans,
-        'total_scans': total_scans,
-        'pd_cases': pd_cases,
-        'healthy_cases': healthy_cases,
+        'scans': page,
+        'next_cursor': next_cursor,
+        'is_first_page': cursor is None,
+        'total_scans': stats['total_scans'],
+        'pd_cases': stats['pd_cases'],
+        'healthy_cases': stats['healthy_cases'],
+        'my_stats': doctor_stats(stats, request.user.id),
     }
     
     return render(request, 'diagnosis/dashboard.html', context)
 
+def _parse_cursor(value):
+    """
+    Decodes a 'created_at|id' dashboard cursor; returns None when missing or malformed.
+    """
+    if not value or '|' not in value:
+        return None
+    created_at, _, scan_id = value.rpartition('|')
+    created_at = parse_datetime(created_at)
+    if created_at is None or not scan_id.isdigit():
+        return None
+    return created_at, int(scan_id)
+
 @login_required
 def methodology(request):
     """
@@ -39,59 +79,59 @@ def methodology(request):
 # diagnosis/views.py
 
 @login_required
+@profile_view
 def upload_scan(request):
     """
-    Handles file upload, AI analysis, and Cloud Synchronization.
+    Stores the uploaded scan and queues the AI analysis and Cloud Synchronization.
     """
-    if request.method == 'POST' and request.FILES.get('scan_file'):
+    recorder = StageRecorder(StageMetric.SOURCE_UPLOAD)
+    myfile = None
+    if request.method == 'POST':
+        myfile = request.FILES.get('scan_file')
+        # The multipart body (file streamed to disk + hashed) was already parsed by
+        # CsrfViewMiddleware before this view ran; HashingUploadHandler timed that receive
+        receive = getattr(request, 'upload_receive', None)
+        if receive:
+            recorder.add(**receive)
+
+    if myfile:
         p_id = request.POST.get('patient_id')
         age = request.POST.get('age')
-        myfile = request.FILES['scan_file']
 
-        # 1. Save to Local Database
-        scan = PatientScan.objects.create(
+        # 1. Content hash computed while the upload streamed to disk
+        digest = getattr(request, 'upload_digests', {}).get('scan_file', '')
+        scan = PatientScan(
             patient_id=p_id, 
             age=age, 
-            scan_file=myfile,
-            doctor=request.user
+            doctor=request.user,
+            content_sha256=digest
         )
-        
-        # 2. Run Neuro-Scientific Analysis
-        pred, conf, viewer_filename = analyze_fmri(scan.scan_file.path)
-        
-        scan.prediction = pred
-        scan.confidence = conf
-        scan.save()
-
-        # 3. FIXED: Smart URL generation (Prevents double '_viewer_viewer')
-        base_url = scan.scan_file.url
-        if base_url.endswith('.nii.gz'):
-            # Strip extension and potential existing suffix
-            clean_url = base_url[:-7] # remove .nii.gz
-            if clean_url.endswith('_viewer'):
-                clean_url = clean_url[:-7] # remove _viewer
-            viewer_url = f"{clean_url}_viewer.nii.gz"
+
+        # 2. Identical file already stored: reuse it (and its result, if the model is unchanged)
+        with recorder.stage('dedupe'):
+            previous = find_previous_scan(digest)
+            reused = reuse_previous_analysis(scan, previous) if previous else False
+        if not previous:
+            scan.scan_file = myfile
+
+        # 3. Save to Local Database (moves the uploaded file into MEDIA_ROOT);
+        #    a reused result is queued for Cloud sync in the same transaction
+        with recorder.stage('save'):
+            if reused:
+                save_reused_scan(scan)
+            else:
+                scan.save()
+
+        if reused:
+            messages.success(request, "Identical scan already analysed with the current model. Result reused.")
         else:
-            # Fallback for non-compressed .nii
-            viewer_url = base_url.replace('.nii', '_viewer.nii')
-
-        # 4. Synchronize with Cloud
-        cloud_payload = {
-            'patient_id': p_id,
-            'prediction': pred,
-            'confidence': conf,
-            'age': int(age) if age else 0,
-            'doctor_username': request.user.username
-        }
-        
-        save_scan_to_cloud(request.user.id, cloud_payload)
-        
-        messages.success(request, "Analysis completed and synced to Cloud.")
-        
-        return render(request, 'diagnosis/result.html', {
-            'scan': scan, 
-            'viewer_url': viewer_url
-        })
+            # 4. Analysis and Cloud sync run in the background job queue
+            with recorder.stage('enqueue'):
+                enqueue_analysis(scan)
+            messages.success(request, "Scan uploaded. Analysis is running in the background.")
+
+        save_stage_metrics(scan, recorder)
+        return redirect('view_result', scan_id=scan.id)
 
     return render(request, 'diagnosis/upload.html')
 
@@ -101,40 +141,94 @@ def view_result(request, scan_id):
     Displays the result of a specific previous scan.
     """
     scan = PatientScan.objects.get(id=scan_id)
-    
-    # FIXED: Same smart logic here
-    base_url = scan.scan_file.url
-    if base_url.endswith('.nii.gz'):
-        clean_url = base_url[:-7]
-        if clean_url.endswith('_viewer'):
-            clean_url = clean_url[:-7]
-        viewer_url = f"{clean_url}_viewer.nii.gz"
-    else:
-        viewer_url = base_url.replace('.nii', '_viewer.nii')
-        
-    return render(request, 'diagnosis/result.html', {'scan': scan, 'viewer_url': viewer_url})
+    return render(request, 'diagnosis/result.html', {
+        'scan': scan,
+        'viewer_url': scan.viewer_url,
+        'viewer_preview_url': scan.viewer_preview_url,
+    })
 
 @login_required
+def scan_status(request, scan_id):
+    """
+    JSON status of the background analysis job, polled by the result page.
+    """
+    scan = get_object_or_404(PatientScan, id=scan_id)
+    data = {
+        'id': scan.id,
+        'status': scan.status,
+        'prediction': scan.prediction,
+        'confidence': scan.confidence,
+        'error': scan.error_message or None,
+        'started_at': scan.started_at.isoformat() if scan.started_at else None,
+        'finished_at': scan.finished_at.isoformat() if scan.finished_at else None,
+        'qc_flags': scan.qc_flags,
+        'model_version': scan.model_version or None,
+    }
+    if scan.status == PatientScan.STATUS_DONE:
+        data['viewer_url'] = scan.viewer_url
+        data['viewer_preview_url'] = scan.viewer_preview_url
+    return JsonResponse(data)
+
+def _report_etag(request, scan_id):
+    scan = PatientScan.objects.filter(id=scan_id).first()
+    return report_key(scan) if scan else None
+
+@login_required
+@profile_view
+@condition(etag_func=_report_etag)
 def generate_pdf(request, scan_id):
     """
-    Generates a professional clinical PDF report.
+    Serves the clinical PDF report, rendered once per version and stored in media/reports/.
+    Supports conditional GET (If-None-Match) through the report version ETag.
     """
-    scan = PatientScan.objects.get(id=scan_id)
-    template_path = 'diagnosis/pdf_layout.html'
-    context = {'scan': scan}
+    scan = get_object_or_404(PatientScan, id=scan_id)
+    path = get_or_render_report(scan)
     
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="NeuroDetect_Report_{scan.patient_id}.pdf"'
-    
-    template = get_template(template_path)
-    html = template.render(context)
-    
-    pisa_status = pisa.CreatePDF(html, dest=response)
-    
-    if pisa_status.err:
+    if path is None:
         return HttpResponse('Error generating PDF report.')
+
+    response = FileResponse(
+        open(path, 'rb'),
+        content_type='application/pdf',
+        as_attachment=True,
+        filename=f"NeuroDetect_Report_{scan.patient_id}.pdf",
+    )
+    # Browsers keep the file but revalidate it with the ETag on every download
+    patch_cache_control(response, private=True, no_cache=True)
     return response
 
+@staff_member_required
+def export_reports(request):
+    """
+    Streams a ZIP of PDF reports plus a CSV summary, built on the fly.
+    Optional filters: ?from=YYYY-MM-DD&to=YYYY-MM-DD&doctor=<username>.
+    """
+    date_from = parse_date(request.GET.get('from') or '')
+    date_to = parse_date(request.GET.get('to') or '')
+    doctor = request.GET.get('doctor') or None
+    scans = export_queryset(date_from, date_to, doctor)
+
+    response = StreamingHttpResponse(
+        iter_export_zip(scans, workers=getattr(settings, 'EXPORT_WORKERS', None)),
+        content_type='application/zip',
+    )
+    response['Content-Disposition'] = 'attachment; filename="NeuroDetect_Reports.zip"'
+    return response
+
+@staff_member_required
+def stage_metrics(request):
+    """
+    Per-stage percentiles (wall time, CPU time, peak memory) of uploads, analyses and Cloud sync.
+    Optional filters: ?days=N (default 7, 0 = all time) and ?source=upload|analysis|cloud.
+    """
+    days = request.GET.get('days', '7')
+    days = int(days) if days.isdigit() else 7
+    since = timezone.now() - timedelta(days=days) if days else None
+    return JsonResponse({
+        'since': since.isoformat() if since else None,
+        'stages': stage_percentiles(since=since, source=request.GET.get('source') or None),
+    })
+
 def register(request):
     """
     Handles new user registration.
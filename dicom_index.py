@@ -0,0 +1,246 @@
+import os
+import time
+import sqlite3
+import argparse
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import pydicom
+from pydicom.tag import Tag
+
+# UID-urile PPMI anonimizate nu respectă strict VR UI; avertismentele nu ne privesc aici
+warnings.filterwarnings("ignore", module="pydicom")
+
+INDEX_PATH = "dicom_index.sqlite"
+
+# Doar tag-urile din antet de care au nevoie gruparea și clasificarea (fără pixeli)
+MOSAIC_TAG = Tag(0x0019, 0x100A)  # Siemens NumberOfImagesInMosaic
+HEADER_TAGS = [
+    "PatientID", "StudyInstanceUID", "SeriesInstanceUID", "SeriesNumber",
+    "SeriesDescription", "ProtocolName", "Modality", "ImageType",
+    "SOPInstanceUID", "InstanceNumber", "Rows", "Columns", "NumberOfFrames",
+    "RepetitionTime", MOSAIC_TAG,
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path            TEXT PRIMARY KEY,
+    size            INTEGER NOT NULL,
+    mtime_ns        INTEGER NOT NULL,
+    series_uid      TEXT,
+    sop_uid         TEXT,
+    instance_number INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_series_idx ON files (series_uid);
+
+CREATE TABLE IF NOT EXISTS series (
+    series_uid         TEXT PRIMARY KEY,
+    patient_id         TEXT,
+    study_uid          TEXT,
+    series_number      INTEGER,
+    protocol_name      TEXT,
+    series_description TEXT,
+    modality           TEXT,
+    image_type         TEXT,
+    rows               INTEGER,
+    columns            INTEGER,
+    frames             INTEGER,
+    mosaic_images      INTEGER,
+    tr                 REAL
+);
+
+-- Dimensiunile ca în heudiconv (seqinfo.dim3 / dim4):
+-- mozaic Siemens => dim3 = felii din mozaic, dim4 = fișiere (volume);
+-- altfel dim3 = cadre (multi-frame) sau număr de fișiere, dim4 = 1
+CREATE VIEW IF NOT EXISTS series_info AS
+SELECT s.*,
+       COUNT(f.path) AS n_files,
+       CASE WHEN s.mosaic_images > 0 THEN s.mosaic_images
+            WHEN s.frames > 1 THEN s.frames
+            ELSE COUNT(f.path) END AS dim3,
+       CASE WHEN s.mosaic_images > 0 THEN COUNT(f.path) ELSE 1 END AS dim4,
+       UPPER(COALESCE(s.protocol_name, '') || ' ' || COALESCE(s.series_description, '')) AS header_info
+FROM series s JOIN files f ON f.series_uid = s.series_uid
+GROUP BY s.series_uid;
+"""
+
+# Regulile din ppmi_heuristic.infotodict, ca interogări peste index
+# (plus `rsfMRI`, denumirea protocoalelor PPMI mai noi, ex. rsfMRI_LR / rsfMRI_RL)
+CLASSIFICATION_RULES = {
+    "T1w": """
+        (header_info LIKE '%MPRAGE%' OR UPPER(COALESCE(protocol_name, '')) LIKE '%T1%')
+        AND dim3 > 50
+    """,
+    "bold": """
+        header_info LIKE '%RESTING%' OR header_info LIKE '%BOLD%' OR header_info LIKE '%EP2D%'
+        OR header_info LIKE '%RSFMRI%'
+    """,
+}
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def read_header(path):
+    """
+    Citește antetul unui fișier (stop_before_pixels). Rulează și în procese separate.
+    Întoarce (path, rând files, rând series); pentru fișiere non-DICOM rândul series este None
+    (fișierul rămâne în index ca să nu fie recitit).
+    """
+    stat = os.stat(path)
+    try:
+        ds = pydicom.dcmread(path, stop_before_pixels=True, specific_tags=HEADER_TAGS)
+    except Exception:
+        return path, (stat.st_size, stat.st_mtime_ns, None, None, None), None
+    if "SeriesInstanceUID" not in ds:
+        return path, (stat.st_size, stat.st_mtime_ns, None, None, None), None
+
+    series_uid = str(ds.SeriesInstanceUID)
+    mosaic = ds.get(MOSAIC_TAG)
+    tr = ds.get("RepetitionTime")
+    file_row = (
+        stat.st_size, stat.st_mtime_ns, series_uid,
+        str(ds.get("SOPInstanceUID", "") or os.path.basename(path)),
+        _int(ds.get("InstanceNumber")),
+    )
+    series_row = (
+        series_uid,
+        str(ds.get("PatientID", "") or ""),
+        str(ds.get("StudyInstanceUID", "") or ""),
+        _int(ds.get("SeriesNumber")),
+        str(ds.get("ProtocolName", "") or ""),
+        str(ds.get("SeriesDescription", "") or ""),
+        str(ds.get("Modality", "") or ""),
+        "\\".join(ds.get("ImageType", []) or []),
+        _int(ds.get("Rows")),
+        _int(ds.get("Columns")),
+        _int(ds.get("NumberOfFrames")),
+        _int(mosaic.value) if mosaic is not None else None,
+        # DICOM păstrează TR în milisecunde; BIDS îl vrea în secunde
+        float(tr) / 1000.0 if tr not in (None, "") else None,
+    )
+    return path, file_row, series_row
+
+
+class DicomIndex:
+    """
+    Index SQLite al anteturilor DICOM: subiect, serie, protocol, descriere, dimensiuni, TR
+    și căile fișierelor. Se actualizează incremental (doar fișierele noi sau modificate,
+    după dimensiune și mtime), iar clasificarea T1w/BOLD este o interogare SQL.
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def update(self, source_dir, workers=1):
+        """
+        Indexează recursiv `source_dir`. Întoarce numărul de fișiere (re)citite.
+        """
+        source_dir = os.path.abspath(source_dir)
+        known = {
+            row["path"]: (row["size"], row["mtime_ns"])
+            for row in self.conn.execute("SELECT path, size, mtime_ns FROM files WHERE path LIKE ?",
+                                         (os.path.join(source_dir, "") + "%",))
+        }
+
+        present, todo = set(), []
+        for root, _, names in os.walk(source_dir):
+            for name in names:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(root, name)
+                present.add(path)
+                stat = os.stat(path)
+                if known.get(path) != (stat.st_size, stat.st_mtime_ns):
+                    todo.append(path)
+        todo.sort()
+
+        if workers and workers > 1 and len(todo) > workers:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(read_header, todo, chunksize=64))
+        else:
+            results = [read_header(path) for path in todo]
+
+        with self.conn:
+            self.conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in set(known) - present])
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, series_uid, sop_uid, instance_number) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(path,) + file_row for path, file_row, _ in results],
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO series VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                {row[0]: row for _, _, row in results if row is not None}.values(),
+            )
+            # Seriile fără fișiere rămase nu mai au ce căuta în index
+            self.conn.execute("DELETE FROM series WHERE series_uid NOT IN (SELECT DISTINCT series_uid FROM files "
+                              "WHERE series_uid IS NOT NULL)")
+        return len(todo)
+
+    def series(self, source_dir=None, where=None, params=()):
+        """
+        Seriile indexate (din view-ul series_info), opțional restrânse la `source_dir`.
+        """
+        query = "SELECT * FROM series_info"
+        clauses, args = [], []
+        if source_dir is not None:
+            clauses.append("series_uid IN (SELECT series_uid FROM files WHERE path LIKE ?)")
+            args.append(os.path.join(os.path.abspath(source_dir), "") + "%")
+        if where:
+            clauses.append(f"({where})")
+            args.extend(params)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY patient_id, series_number, series_uid"
+        return [dict(row) for row in self.conn.execute(query, args)]
+
+    def files(self, series_uid):
+        """
+        (path, size, sop_uid) pentru fișierele unei serii, în ordinea InstanceNumber.
+        """
+        return [dict(row) for row in self.conn.execute(
+            "SELECT path, size, sop_uid FROM files WHERE series_uid = ? ORDER BY instance_number, path",
+            (series_uid,),
+        )]
+
+    def classify(self, source_dir=None):
+        """
+        {'T1w': [serii], 'bold': [serii]} conform CLASSIFICATION_RULES.
+        """
+        return {
+            suffix: self.series(source_dir, where=rule)
+            for suffix, rule in CLASSIFICATION_RULES.items()
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index SQLite al anteturilor DICOM și clasificarea seriilor T1w/BOLD.")
+    parser.add_argument("source", nargs="?", default="folder_wit_pd", help="Folderul cu fișiere DICOM (recursiv).")
+    parser.add_argument("--index", default=INDEX_PATH, help="Fișierul SQLite al indexului.")
+    parser.add_argument("--workers", type=int, default=1, help="Procese pentru citirea anteturilor noi.")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with DicomIndex(args.index) as index:
+        read = index.update(args.source, workers=args.workers)
+        print(f"🗂️  {read} anteturi citite în {time.perf_counter() - start:.2f}s ({args.index})")
+        for suffix, items in index.classify(args.source).items():
+            for s in items:
+                print(f"  {suffix:<5} sub-{s['patient_id']:<8} S{s['series_number']} {s['series_description']:<24} "
+                      f"{s['rows']}x{s['columns']}x{s['dim3']}x{s['dim4']} TR={s['tr']}s ({s['n_files']} fisiere)")
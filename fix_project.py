@@ -1,10 +1,11 @@
 import os
 import numpy as np
 import nibabel as nib
-import joblib
 from sklearn.linear_model import LogisticRegression
 from nilearn import datasets
 
+from diagnosis.model_registry import register_model
+
 # Setup Paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MEDIA_DIR = os.path.join(BASE_DIR, 'media', 'scans')
@@ -22,9 +23,8 @@ def step_1_create_model():
     model = LogisticRegression()
     model.fit(X, y)
     
-    model_path = os.path.join(MODEL_DIR, 'pd_classifier.pkl')
-    joblib.dump(model, model_path)
-    print(f"   -> Model saved: {model_path}")
+    version = register_model(model, trainer='fix_project', registry_dir=MODEL_DIR)
+    print(f"   -> Model registered: {version} (active)")
 
 def step_2_download_atlas():
     print("2️⃣  Pre-fetching Brain Atlas (MSDL)...")
@@ -117,9 +117,106 @@ STATIC_URL = "static/"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads are hashed while they stream to disk (used to deduplicate scans)
+FILE_UPLOAD_HANDLERS = [
+    "diagnosis.uploads.HashingUploadHandler",
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
+
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/accounts/login/'
 LOGIN_URL = '/accounts/login/'
 
+# Load the MSDL atlas, masker and classifier once per worker at startup
+ML_ENGINE_WARMUP = True
+
+# Versioned classifiers (diagnosis.model_registry): immutable versions/<id>/
+# artifacts plus a registry.json "active" pointer. Workers stat the pointer before
+# each prediction and hot-reload when it moves (`manage.py model_registry`).
+MODEL_REGISTRY_DIR = BASE_DIR / 'diagnosis' / 'ml_models'
+
+# Background analysis jobs: 'thread' runs them in a pool inside the web process,
+# 'worker' leaves them queued for `manage.py process_scans --loop`. In 'thread'
+# mode the web process re-submits queued jobs on startup and re-queues 'running'
+# jobs whose worker sent no heartbeat for ANALYSIS_STALE_AFTER_MINUTES (None
+# disables that). A running job refreshes its heartbeat every
+# ANALYSIS_HEARTBEAT_SECONDS, so long analyses in other processes are left alone
+ANALYSIS_DISPATCH = 'thread'
+ANALYSIS_WORKERS = 2
+ANALYSIS_STALE_AFTER_MINUTES = 5
+ANALYSIS_HEARTBEAT_SECONDS = 30
+
+# Large 4D scans are read through nibabel's proxy and masked in time-chunks so
+# peak memory stays near this budget: 'auto' streams only when the full series
+# would not fit, 'always' / 'never' force the mode
+ANALYSIS_STREAMING = 'auto'
+ANALYSIS_MEMORY_BUDGET_MB = 512
+
+# Uploads larger than this (MB on disk) are resampled to ANALYSIS_DOWNSAMPLE_VOXEL_MM
+# voxels in time-chunks before masking (None disables the step). Under the
+# 'thread' dispatch this runs in the job thread; process_scans workers use a
+# pool of ANALYSIS_DOWNSAMPLE_WORKERS processes each
+ANALYSIS_DOWNSAMPLE_ABOVE_MB = 300
+ANALYSIS_DOWNSAMPLE_VOXEL_MM = 4.0
+ANALYSIS_DOWNSAMPLE_WORKERS = 2
+
+# Pre-flight QC before masking: series shorter than QC_MIN_VOLUMES, 3D or
+# truncated files are rejected from the header alone; scans whose median tSNR
+# is below QC_MIN_TSNR or with more than QC_MAX_OUTLIER_FRACTION framewise
+# intensity outliers (DVARS) are flagged, and rejected below QC_REJECT_TSNR
+QC_MIN_VOLUMES = 10
+QC_MIN_TSNR = 20.0
+QC_MAX_OUTLIER_FRACTION = 0.2
+QC_REJECT_TSNR = None
+
+# Viewer derivatives: a uint8 preview (largest side <= VIEWER_PREVIEW_MAX_DIM)
+# and an int16 full-resolution volume, gzip-compressed at this level (1-9)
+VIEWER_PREVIEW_MAX_DIM = 64
+VIEWER_COMPRESSION_LEVEL = 6
+
+# Rows per dashboard page (keyset pagination on created_at)
+DASHBOARD_PAGE_SIZE = 25
+
+# Dashboard counters are cached; PatientScan signals drop the entry after a
+# committed change and the next dashboard view recomputes it in one query.
+# The entry also expires after DASHBOARD_STATS_TTL seconds (or run
+# `manage.py refresh_dashboard_stats` from a scheduler).
+# A file cache is shared by the web process and `process_scans` workers.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / ".django_cache",
+    }
+}
+DASHBOARD_STATS_TTL = 15 * 60
+
+# Processes rendering missing PDFs during a bulk report export (None = all cores)
+EXPORT_WORKERS = None
+
+# Firestore sync goes through a transactional outbox (diagnosis.CloudOutbox):
+# results are committed locally and pushed in batches by a background flusher,
+# retried with exponential backoff (CLOUD_SYNC_BACKOFF_BASE doubling up to
+# CLOUD_SYNC_BACKOFF_MAX seconds). 'local' swaps Firestore for an in-process
+# stand-in for development and tests. The flusher thread runs only in server
+# processes (runserver, WSGI/ASGI); CLOUD_OUTBOX_FLUSHER = False disables it
+# there too, e.g. without Firebase credentials (`manage.py flush_cloud_outbox`
+# still sends the pending messages).
+CLOUD_SYNC_BACKEND = 'firestore'
+CLOUD_OUTBOX_FLUSHER = True
+CLOUD_SYNC_INTERVAL = 30
+CLOUD_SYNC_BACKOFF_BASE = 5
+CLOUD_SYNC_BACKOFF_MAX = 60 * 60
+
+# Opt-in cProfile capture for the upload, report and dashboard views
+# (diagnosis.profiling). False: off, no profiler is ever created; True: staff
+# request a profile with ?profile=1 or an `X-Profile: 1` header; 'always':
+# every call. Profiles are stored in media/profiles/ and downloaded from the
+# admin (View profiles), summarised to the VIEW_PROFILE_TOP slowest calls.
+# Only the view itself is profiled: an upload's multipart body is read by
+# CsrfViewMiddleware beforehand (see the 'receive' stage metric instead).
+VIEW_PROFILING = False
+VIEW_PROFILE_TOP = 40
+
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
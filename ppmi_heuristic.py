@@ -26,6 +26,7 @@ def infotodict(seqinfo):
             ("RESTING" in header_info)
             or ("BOLD" in header_info)
             or ("EP2D" in header_info)
+            or ("RSFMRI" in header_info)
         ):
             info[func].append(s.series_id)
 
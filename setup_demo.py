@@ -1,12 +1,13 @@
 import os
 import numpy as np
 import nibabel as nib
-import joblib
 from nilearn import datasets, maskers, connectome
 from sklearn.svm import SVC
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler
 
+from diagnosis.model_registry import register_model
+
 def create_structured_mock(file_path, diagnosis='PD'):
     """
     Creează un NIfTI 4D unde regiunile creierului sunt corelate diferit.
@@ -60,11 +61,9 @@ def train_demo_model():
     
     model.fit(X, y)
     
-    # 3. Salvare
-    dest_path = os.path.join('diagnosis', 'ml_models', 'pd_classifier.pkl')
-    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-    joblib.dump(model, dest_path)
-    print(f"🚀 Model salvat: {dest_path}")
+    # 3. Salvare: versiune nouă în registru, activată imediat
+    version = register_model(model, trainer='setup_demo', registry_dir=os.path.join('diagnosis', 'ml_models'))
+    print(f"🚀 Model înregistrat: {version}")
 
 if __name__ == "__main__":
     # Curățăm folderele
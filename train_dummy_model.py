@@ -1,12 +1,12 @@
 import os
-import joblib
 import numpy as np
 from sklearn.linear_model import LogisticRegression
 
+from diagnosis.model_registry import register_model
+
 # Define paths relative to this script
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_DIR = os.path.join(BASE_DIR, 'diagnosis', 'ml_models')
-MODEL_PATH = os.path.join(MODEL_DIR, 'pd_classifier.pkl')
 
 def force_train_model():
     print("🛠️  Initializing Dummy Model Generator...")
@@ -30,9 +30,9 @@ def force_train_model():
     model = LogisticRegression()
     model.fit(X, y)
 
-    # 4. Save the model
-    joblib.dump(model, MODEL_PATH)
-    print(f"✅ SUCCESS: Model saved at: {MODEL_PATH}")
+    # 4. Register the model as a new version and make it the active one
+    version = register_model(model, trainer='train_dummy_model', registry_dir=MODEL_DIR)
+    print(f"✅ SUCCESS: Model registered as version {version} in {MODEL_DIR}")
     print("   -> The confidence score should now work.")
 
 if __name__ == "__main__":
@@ -1,11 +1,11 @@
 import os
-import joblib
 import numpy as np
 from sklearn.svm import SVC
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler
+
+from diagnosis.model_registry import register_model
 MODEL_DIR = os.path.join('diagnosis', 'ml_models')
-MODEL_PATH = os.path.join(MODEL_DIR, 'pd_classifier.pkl')
 os.makedirs(MODEL_DIR, exist_ok=True)
 
 print("Initializare si antrenare model demonstrativ (SVM)...")
@@ -22,7 +22,7 @@ clf = Pipeline([
 ])
 
 clf.fit(X_train, y_train)
-joblib.dump(clf, MODEL_PATH)
+version = register_model(clf, trainer='train_model_init', feature_dim=n_features, registry_dir=MODEL_DIR)
 
-print(f"✅ Model salvat cu succes la: {MODEL_PATH}")
+print(f"✅ Model înregistrat cu succes: versiunea {version} în {MODEL_DIR}")
 print(f"   Modelul este gata sa primeasca vectori de dimensiunea {n_features}.")
\ No newline at end of file
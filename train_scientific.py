@@ -1,63 +1,152 @@
 import os
 import glob
+import json
+import time
+import argparse
 import numpy as np
-import joblib
-import nibabel as nib
 import warnings
-from nilearn import datasets, maskers, connectome
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from sklearn.svm import SVC
 from sklearn.preprocessing import StandardScaler
 from sklearn.pipeline import Pipeline
 
+from diagnosis.ml_logic import extract_features, file_sha256
+from diagnosis.model_registry import register_model
+from diagnosis.preflight import PreflightError, check_header
+from diagnosis.training_store import TrainingFeatureStore, parse_subject_session
+
 warnings.filterwarnings("ignore")
 
-def train_scientific():
-    BASE_DIR = os.getcwd()
-    PD_DIR = os.path.join(BASE_DIR, "research_data", "PD")
-    HC_DIR = os.path.join(BASE_DIR, "research_data", "HC")
-    MODEL_DEST = os.path.join(BASE_DIR, "diagnosis", "ml_models", "pd_classifier.pkl")
-
-    print("🧠 Pasul 1: Extracție Semnale...")
-    atlas = datasets.fetch_atlas_msdl()
-    masker = maskers.NiftiMapsMasker(
-        maps_img=atlas.maps, 
-        standardize='zscore_sample',
-        detrend=True,
-        resampling_target='maps',
-        memory='nilearn_cache'
-    )
-
-    X_features = []
-    y_labels = []
-    categories = [("PD", PD_DIR, 1), ("HC", HC_DIR, 0)]
+BASE_DIR = os.getcwd()
+DATA_DIR = os.path.join(BASE_DIR, "research_data")
+CHECKPOINT_DIR = os.path.join(DATA_DIR, "checkpoints")
+MANIFEST_PATH = os.path.join(DATA_DIR, "extraction_manifest.json")
+STORE_DIR = os.path.join(DATA_DIR, "feature_store")
+
+
+def extract_subject(file_path, label_val, checkpoint_dir, known_hashes=frozenset()):
+    """
+    Extrage vectorul de conectivitate pentru un fișier (rulează într-un proces separat).
+    Rezultatul se salvează într-un checkpoint cheiat după hash-ul conținutului,
+    așa că o rulare reluată sare peste subiecții deja procesați.
+    """
+    start = time.perf_counter()
+    record = {
+        'file': os.path.relpath(file_path, BASE_DIR),
+        'label': label_val,
+        'sha256': None,
+        'status': None,
+        'seconds': None,
+        'error': None,
+    }
+    try:
+        digest = file_sha256(file_path)
+        record['sha256'] = digest
+        checkpoint = os.path.join(checkpoint_dir, f"{digest}.npy")
+
+        if digest in known_hashes:
+            # Subiectul este deja în depozitul de trăsături
+            record['status'] = 'stored'
+            return record, None
+        if os.path.exists(checkpoint):
+            vector = np.load(checkpoint)
+            record['status'] = 'cached'
+        else:
+            # Același pre-flight ca la upload: doar antetul, fără citirea datelor
+            try:
+                check_header(file_path)
+            except PreflightError as e:
+                record['status'] = 'skipped'
+                record['error'] = str(e)
+                return record, None
+
+            _, features = extract_features(file_path)
+            vector = features[0].astype(np.float32)
+
+            # Scriere atomică: un proces oprit nu lasă checkpoint-uri corupte
+            tmp_path = f"{checkpoint}.tmp.npy"
+            np.save(tmp_path, vector)
+            os.replace(tmp_path, checkpoint)
+            record['status'] = 'done'
+        return record, vector
+    except Exception as e:
+        record['status'] = 'failed'
+        record['error'] = str(e)
+        return record, None
+    finally:
+        record['seconds'] = round(time.perf_counter() - start, 3)
+
 
+def extract_dataset(categories, workers=None, checkpoint_dir=CHECKPOINT_DIR, manifest_path=MANIFEST_PATH,
+                    known_hashes=frozenset()):
+    """
+    Extracția în paralel pentru fișierele care nu sunt încă în depozit; scrie manifestul
+    cu timpi și erori. Întoarce (rânduri pentru depozit, vectori) în ordinea stabilă a fișierelor.
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+
+    jobs = []
     for label_name, directory, label_val in categories:
         if not os.path.exists(directory): continue
-        files = glob.glob(os.path.join(directory, "*.nii*"))
-        for f in files:
-            try:
-                img = nib.load(f)
-                if len(img.shape) < 4 or img.shape[3] < 10: continue
-                
-                print(f"  > Procesare: {os.path.basename(f)}")
-                ts = masker.fit_transform(f)
-                
-                # Folosim Correlation cu vectorizare pentru compatibilitate maxima
-                conn = connectome.ConnectivityMeasure(kind='correlation', vectorize=True, discard_diagonal=True)
-                vector = conn.fit_transform([ts])[0]
-                
-                X_features.append(vector)
-                y_labels.append(label_val)
-            except Exception as e:
-                print(f"  ❌ Eroare la {os.path.basename(f)}: {e}")
-
-    if len(set(y_labels)) < 2:
+        for f in sorted(glob.glob(os.path.join(directory, "*.nii*"))):
+            jobs.append((f, label_val))
+
+    print(f"🧠 Pasul 1: Extracție Semnale ({len(jobs)} fișiere, {workers or os.cpu_count()} procese)...")
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(extract_subject, f, label_val, checkpoint_dir, known_hashes): f
+            for f, label_val in jobs
+        }
+        for future in as_completed(futures):
+            record, vector = future.result()
+            results[futures[future]] = (record, vector)
+            icon = {'done': '>', 'cached': '↺', 'stored': '=', 'skipped': '-', 'failed': '❌'}[record['status']]
+            print(f"  {icon} {record['status']:<7} {os.path.basename(record['file'])} ({record['seconds']}s)")
+            if record['error'] and record['status'] == 'failed':
+                print(f"    Eroare: {record['error']}")
+
+    manifest = [results[f][0] for f, _ in jobs]
+    with open(manifest_path, "w") as fh:
+        json.dump(manifest, fh, indent=4)
+    print(f"📝 Manifest scris în: {manifest_path}")
+
+    rows, vectors = [], []
+    for f, label_val in jobs:
+        record, vector = results[f]
+        if vector is None:
+            continue
+        subject_id, session = parse_subject_session(f)
+        rows.append({
+            'subject_id': subject_id,
+            'session': session,
+            'label': label_val,
+            'sha256': record['sha256'],
+            'source': record['file'],
+        })
+        vectors.append(vector)
+    return rows, vectors
+
+
+def train_scientific(workers=None, from_store=False):
+    PD_DIR = os.path.join(DATA_DIR, "PD")
+    HC_DIR = os.path.join(DATA_DIR, "HC")
+
+    store = TrainingFeatureStore(STORE_DIR)
+    if not from_store:
+        categories = [("PD", PD_DIR, 1), ("HC", HC_DIR, 0)]
+        rows, vectors = extract_dataset(categories, workers=workers, known_hashes=store.known_hashes())
+        if rows:
+            added = store.append(rows, np.vstack(vectors))
+            print(f"🗄️  {added} subiecți noi adăugați în depozitul de trăsături.")
+
+    # Antrenăm direct din matricea mapată în memorie (fără re-extracție din NIfTI)
+    X, y, _ = store.load()
+
+    if len(set(y.tolist())) < 2:
         print("❌ Date insuficiente (minim 1 PD si 1 HC).")
         return
 
-    X = np.array(X_features)
-    y = np.array(y_labels)
-
     print(f"📊 Dataset: {X.shape[0]} subiecți. Antrenare Pipeline...")
 
     # Pipeline robust pentru seturi mici
@@ -68,9 +157,17 @@ def train_scientific():
 
     model.fit(X, y)
 
-    os.makedirs(os.path.dirname(MODEL_DEST), exist_ok=True)
-    joblib.dump(model, MODEL_DEST)
-    print(f"✅ SUCCES! Model salvat în: {MODEL_DEST}")
+    # Versiune nouă, imutabilă, în registru; worker-ii o preiau la următoarea predicție
+    version = register_model(model, trainer="train_scientific", metadata={
+        'n_subjects': int(X.shape[0]),
+        'n_pd': int(np.sum(y == 1)),
+        'n_hc': int(np.sum(y == 0)),
+    })
+    print(f"✅ SUCCES! Model înregistrat și activat: {version}")
 
 if __name__ == "__main__":
-    train_scientific()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Antrenare SVM pe conectivitatea MSDL (research_data/PD, research_data/HC).")
+    parser.add_argument("--workers", type=int, default=None, help="Număr de procese pentru extracție (implicit: toate nucleele).")
+    parser.add_argument("--from-store", action="store_true", help="Antrenare doar din depozitul de trăsături, fără extracție.")
+    args = parser.parse_args()
+    train_scientific(workers=args.workers, from_store=args.from_store)